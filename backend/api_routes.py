@@ -1,12 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
 from pydantic import BaseModel
 from models import User
 from auth import current_active_user
 from user_service import UserService
 from file_service import FileService
+from gridfs_http import gridfs_download_response
 from typing import Dict, Any
-import io
 
 router = APIRouter()
 
@@ -142,11 +141,8 @@ async def upload_file(file: UploadFile = File(), user: User = Depends(current_ac
     try:
         file_service = FileService()
         
-        # Read file content
-        content = await file.read()
-        
         result = await file_service.upload_file(
-            file_content=content,
+            source=file,  # Streamed into GridFS chunk by chunk
             filename=file.filename,
             content_type=file.content_type,
             user_email=user.email,
@@ -156,8 +152,10 @@ async def upload_file(file: UploadFile = File(), user: User = Depends(current_ac
         if result.get("success"):
             return result
         else:
-            raise HTTPException(status_code=500, detail=result.get("error", "Upload failed"))
+            raise HTTPException(status_code=result.get("status_code", 500), detail=result.get("error", "Upload failed"))
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
@@ -183,8 +181,8 @@ async def delete_file(file_id: str, user: User = Depends(current_active_user)):
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 @router.get("/files/{file_id}")
-async def download_file(file_id: str, user: User = Depends(current_active_user)):
-    """Download a file using GridFS"""
+async def download_file(file_id: str, request: Request, user: User = Depends(current_active_user)):
+    """Download a file using GridFS (supports Range, ETag and If-None-Match)"""
     try:
         file_service = FileService()
         
@@ -193,11 +191,12 @@ async def download_file(file_id: str, user: User = Depends(current_active_user))
         if not file_data:
             raise HTTPException(status_code=404, detail="File not found or access denied")
         
-        # Create streaming response
-        return StreamingResponse(
-            io.BytesIO(file_data["content"]),
-            media_type=file_data["content_type"],
-            headers={"Content-Disposition": f"attachment; filename={file_data['filename']}"}
+        # Stream from GridFS (full file, byte range or 304)
+        return gridfs_download_response(
+            file_data["stream"],
+            request.headers,
+            file_data["filename"],
+            file_data["content_type"]
         )
     except HTTPException:
         raise
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sequential vs concurrent ingestion of a multi-file batch
+1. In process: FileService.upload_temp_files with one upload at a time (the
+   old for-loop behaviour) vs UPLOAD_CONCURRENCY parallel uploads. Needs a
+   running MongoDB (MONGODB_URL).
+2. End to end: POST /api/mergeImages with N images against a running server
+   (BENCH_BASE_URL, default http://localhost:8000), measuring request latency
+   until the command ID is returned. Run the server once with
+   UPLOAD_CONCURRENCY=1 and once with the default to compare. Skipped when no
+   server is reachable.
+Usage: python benchmarks/bench_batch_upload.py [files] [repeats]
+"""
+
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from PIL import Image
+from config import settings
+from database import init_db, close_db
+from file_service import FileService
+
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://localhost:8000")
+
+
+class BenchFile:
+    """Minimal UploadFile stand-in over in-memory bytes"""
+
+    def __init__(self, filename, content, content_type="image/jpeg"):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = len(content)
+        self._buffer = io.BytesIO(content)
+
+    async def read(self, size=-1):
+        return self._buffer.read(size)
+
+
+def make_image(index):
+    """A noisy 1000x1000 JPEG (hard to compress, a few hundred KB)"""
+    image = Image.frombytes("RGB", (1000, 1000), os.urandom(1000 * 1000 * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return f"bench_{index:03d}.jpg", buffer.getvalue()
+
+
+def summarize(name, timings):
+    """Print mean / p50 / max latency in milliseconds"""
+    timings = [t * 1000 for t in timings]
+    print(f"{name:<28} mean {statistics.mean(timings):9.1f} ms   "
+          f"p50 {statistics.median(timings):9.1f} ms   max {max(timings):9.1f} ms")
+
+
+async def bench_service(images, repeats):
+    await init_db()
+    file_service = FileService()
+    for concurrency in sorted({1, settings.upload_concurrency}):
+        timings = []
+        for _ in range(repeats):
+            files = [BenchFile(name, content) for name, content in images]
+            started = time.perf_counter()
+            result = await file_service.upload_temp_files(
+                files, user_email="bench@example.com", user_id="bench", max_concurrency=concurrency
+            )
+            timings.append(time.perf_counter() - started)
+            assert result["success"], result
+            await file_service.delete_temp_files(result["file_ids"])
+        summarize(f"service, {concurrency} in parallel", timings)
+    await close_db()
+
+
+def bench_http(images, repeats):
+    try:
+        requests.get(f"{BASE_URL}/docs", timeout=2)
+    except requests.exceptions.ConnectionError:
+        print(f"⚠️  No server at {BASE_URL}, skipping end-to-end benchmark")
+        return
+
+    response = requests.post(f"{BASE_URL}/api/authenticate", json={
+        "email": "bench@example.com",
+        "password": "benchpassword123",
+        "first_name": "Bench",
+        "last_name": "User",
+        "create": True
+    })
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    timings = []
+    for _ in range(repeats):
+        files = [("files", (name, content, "image/jpeg")) for name, content in images]
+        started = time.perf_counter()
+        response = requests.post(f"{BASE_URL}/api/mergeImages", files=files, headers=headers)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    summarize("POST /api/mergeImages", timings)
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    images = [make_image(index) for index in range(file_count)]
+    total_mb = sum(len(content) for _, content in images) / (1024 * 1024)
+    print(f"🔍 {file_count} files ({total_mb:.1f} MB) per batch, {repeats} repeats")
+
+    asyncio.run(bench_service(images, repeats))
+    bench_http(images, repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MergePdfs, with and without deduplication of identical objects
+Inputs share the font dictionary and a logo image (as letters and
+invoices from one template do); the last input is merged twice. Reports
+merge time, output size and duplicate objects removed (MERGE_PDFS_DEDUP).
+No MongoDB needed.
+Usage: python benchmarks/bench_merge_pdfs.py [files] [pages per file]
+"""
+
+import io
+import os
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from tools_commands.pdf_dedup import deduplicate_objects
+
+
+def make_logo():
+    """A 600x300 photo-like JPEG, the shared resource of every input"""
+    image = Image.effect_mandelbrot((600, 300), (-2.0, -1.2, 1.0, 1.2), 100).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_document(logo, index, pages):
+    rl_config.useA85 = 0  # Binary image streams, as in real files
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer)
+    for page in range(pages):
+        pdf_canvas.drawImage(ImageReader(io.BytesIO(logo)), 72, 680, width=300, height=150)
+        pdf_canvas.setFont("Helvetica", 10)
+        for line in range(40):
+            pdf_canvas.drawString(72, 640 - line * 14, f"Document {index}, page {page + 1}, line {line}")
+        pdf_canvas.showPage()
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def merge(documents, dedup):
+    started = time.perf_counter()
+    pdf_writer = PdfWriter()
+    for document in documents:
+        for page in PdfReader(io.BytesIO(document)).pages:
+            pdf_writer.add_page(page)
+    removed = deduplicate_objects(pdf_writer) if dedup else 0
+    output = io.BytesIO()
+    pdf_writer.write(output)
+    return time.perf_counter() - started, len(output.getvalue()), removed
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    logo = make_logo()
+    documents = [make_document(logo, index, pages) for index in range(files)]
+    documents.append(documents[-1])
+    print(f"🔍 Merge: {len(documents)} PDFs x {pages} pages ({sum(map(len, documents))} bytes of input)")
+    for name, dedup in (("plain", False), ("dedup", True)):
+        elapsed, size, removed = merge(documents, dedup)
+        print(f"{name:<6} {elapsed:7.2f} s   {size:>10} bytes   {removed:>6} duplicate objects removed")
+
+
+if __name__ == "__main__":
+    main()
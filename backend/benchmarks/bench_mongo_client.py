@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark: new AsyncIOMotorClient per call vs. one shared, pooled client
+Reproduces the old process_manager pattern (connect, query, close) against the
+shared client from database.init_db. Needs a running MongoDB (MONGODB_URL).
+Usage: python benchmarks/bench_mongo_client.py [iterations]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import settings
+from database import init_db, get_database, close_db
+
+
+def summarize(name, timings):
+    """Print mean / p50 / p95 latency in milliseconds"""
+    timings = sorted(t * 1000 for t in timings)
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{name:<24} mean {statistics.mean(timings):8.2f} ms   "
+          f"p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+async def per_call_client(iterations):
+    """Old pattern: a fresh client (new connection pool + handshake) for every call"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        client = AsyncIOMotorClient(settings.mongodb_url)
+        await client[settings.database_name].commands.find_one({})
+        client.close()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def shared_client(iterations):
+    """New pattern: reuse the pooled client created at startup"""
+    db = get_database()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await db.commands.find_one({})
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    await init_db()
+    await get_database().commands.find_one({})  # Warm up the shared pool
+
+    print(f"🔍 {iterations} find_one calls against {settings.database_name}.commands")
+    summarize("new client per call", await per_call_client(iterations))
+    summarize("shared pooled client", await shared_client(iterations))
+
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
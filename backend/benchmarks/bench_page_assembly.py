@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PDF page assembly, pages per second
+1. MergeImages: one PDF per image parsed back with PdfReader and copied into a
+   PdfWriter (the old round trip) vs. every image drawn on one shared canvas.
+2. XlsToPdf: one PDF per sheet merged with PyPDF2 (the old round trip) vs.
+   consecutive sheets rendered into one document (render_batch).
+3. Photo embedding: 12 MP JPEGs decoded and re-encoded (as before) vs. embedded
+   as is vs. downsampled to 150 dpi (MERGE_IMAGES_MAX_DPI), time and size.
+Both variants of 1. and 2. produce the same pages; no MongoDB needed.
+Usage: python benchmarks/bench_page_assembly.py [images] [sheets] [photos]
+"""
+
+import io
+import os
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from config import settings
+from tools_commands.MergeImages import add_image_page
+from tools_commands.XlsToPdf import render_batch, sheet_jobs
+
+
+def make_images(count):
+    """Small images alternating between landscape and portrait"""
+    images = []
+    for index in range(count):
+        size = (320, 240) if index % 2 else (240, 320)
+        images.append(Image.new("RGB", size, (index * 7 % 256, 90, 160)))
+    return images
+
+
+def make_rows(rows):
+    yield ["ID", "Name", "Quantity", "Price"]
+    for row in range(rows):
+        yield [row, f"Item {row}", row % 13, row * 1.25]
+
+
+def merge_with_round_trip(documents):
+    """Copy the pages of separately rendered PDFs into one (the old assembly)"""
+    pdf_writer = PdfWriter()
+    for document in documents:
+        for page in PdfReader(io.BytesIO(document)).pages:
+            pdf_writer.add_page(page)
+    output = io.BytesIO()
+    pdf_writer.write(output)
+    return output.getvalue()
+
+
+def images_round_trip(images):
+    documents = []
+    for image in images:
+        buffer = io.BytesIO()
+        pdf_canvas = canvas.Canvas(buffer, pagesize=A4)
+        add_image_page(pdf_canvas, image)
+        pdf_canvas.save()
+        documents.append(buffer.getvalue())
+    return merge_with_round_trip(documents)
+
+
+def images_single_canvas(images):
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer, pagesize=A4)
+    for image in images:
+        add_image_page(pdf_canvas, image)
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def sheets_round_trip(jobs):
+    return merge_with_round_trip([render_batch([job])[0] for job in jobs])
+
+
+def sheets_single_document(jobs):
+    return render_batch(jobs)[0]
+
+
+def make_photos(count, size=(4000, 3000)):
+    """Distinct photo-like JPEGs (fractal detail, so they compress like photos)"""
+    base = Image.effect_mandelbrot((size[0] // 4, size[1] // 4), (-2.0, -1.2, 1.0, 1.2), 100)
+    base = Image.merge("RGB", (base, base.rotate(180), base.transpose(Image.FLIP_LEFT_RIGHT)))
+    base = base.resize(size)
+    photos = []
+    for index in range(count):
+        base.putpixel((0, 0), (index % 256, 0, 0))
+        buffer = io.BytesIO()
+        base.save(buffer, "JPEG", quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def draw_photos(photos, passthrough, max_dpi):
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer, pagesize=A4)
+    for photo in photos:
+        stream = io.BytesIO(photo)
+        with Image.open(stream) as image:
+            add_image_page(pdf_canvas, image, stream if passthrough else None, max_dpi)
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def bench_photos(count):
+    photos = make_photos(count)
+    print(f"🔍 Photo embedding: {count} JPEGs of 4000x3000, {sum(map(len, photos))} bytes in total")
+    for name, passthrough, max_dpi in (("re-encoded", False, 0), ("as is", True, 0), ("150 dpi", True, 150)):
+        started = time.perf_counter()
+        pdf = draw_photos(photos, passthrough, max_dpi)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<12} {count / elapsed:8.1f} pages/s   ({len(pdf)} bytes)")
+
+
+def pages_per_second(assemble, items):
+    started = time.perf_counter()
+    pdf = assemble(items)
+    elapsed = time.perf_counter() - started
+    pages = len(PdfReader(io.BytesIO(pdf)).pages)
+    return pages / elapsed, pages, len(pdf)
+
+
+def compare(label, before, after, items):
+    print(f"🔍 {label}")
+    for name, assemble in (("round trip", before), ("single pass", after)):
+        rate, pages, size = pages_per_second(assemble, items)
+        print(f"{name:<12} {rate:8.1f} pages/s   ({pages} pages, {size} bytes)")
+
+
+def main():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sheets = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    photos = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    compare(f"MergeImages: {images} images", images_round_trip, images_single_canvas, make_images(images))
+
+    jobs = [job for index in range(sheets)
+            for job in sheet_jobs(f"Sheet {index}", make_rows(20), 100, settings.xls_table_block_rows)]
+    compare(f"XlsToPdf: {sheets} sheets x 20 rows", sheets_round_trip, sheets_single_document, jobs)
+
+    bench_photos(photos)
+
+
+if __name__ == "__main__":
+    main()
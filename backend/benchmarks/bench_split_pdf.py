@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SplitPdfs
+1. Page serialisation across 1..N split worker processes: a generated PDF
+   (text and vector graphics on every page) is split into one-page PDFs.
+2. Zipping the pages of a text PDF and of a scan-like PDF (a JPEG per page): the whole
+   archive deflated into a BytesIO (as before) vs. streamed to a write-only
+   sink with the store/deflate policy (SPLIT_ZIP_MIN_DEFLATE_GAIN). Reports
+   time, archive size and peak traced memory.
+3. Split modes: every page vs. the pages 10-20 only vs. chunks of 50 pages.
+4. Split output (SPLIT_OUTPUT): one ZIP written while splitting vs. separate
+   part files whose stored ZIP is assembled on download. Reports the work done
+   after the pages are serialised, bytes stored, bytes to download for one
+   page and the time to lay out the assembled archive (its first byte).
+No MongoDB needed.
+Usage: python benchmarks/bench_split_pdf.py [pages]
+"""
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+import zlib
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from config import settings
+from tools_commands.SplitPdfs import split_pages, split_parts
+from tools_commands.zip_stream import ZipStreamWriter, stored_archive
+
+
+class Source:
+    """The part of an opened GridFS input split_pages uses"""
+
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+
+
+class Sink:
+    """Write-only output that keeps nothing, standing in for a GridFS upload"""
+
+    def __init__(self):
+        self.length = 0
+
+    def write(self, data):
+        self.length += len(data)
+        return len(data)
+
+
+def make_scan(pages):
+    """A PDF of one noisy JPEG per page, which deflate cannot shrink"""
+    scans = []
+    for index in range(8):
+        buffer = io.BytesIO()
+        Image.frombytes("L", (300, 400), os.urandom(300 * 400)).save(buffer, "JPEG", quality=60)
+        scans.append(ImageReader(io.BytesIO(buffer.getvalue())))
+    rl_config.useA85 = 0  # Binary JPEG streams, as in real scans
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer)
+    for page in range(pages):
+        pdf_canvas.drawImage(scans[page % len(scans)], 0, 0, width=595, height=842)
+        pdf_canvas.showPage()
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def make_pdf(pages):
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer)
+    for page in range(pages):
+        pdf_canvas.drawString(72, 770, f"Page {page + 1}")
+        for line in range(60):
+            pdf_canvas.line(72, 60 + line * 11, 520, 60 + line * 11 + page % 7)
+            pdf_canvas.drawString(80, 62 + line * 11, f"{page}-{line} lorem ipsum dolor sit amet")
+        pdf_canvas.showPage()
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def zip_in_memory(pages):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for index, page in enumerate(pages):
+            zip_file.writestr(f"page_{index + 1:03d}.pdf", page)
+    return len(buffer.getvalue())
+
+
+def zip_streamed(pages):
+    sink = Sink()
+    with ZipStreamWriter(sink, settings.split_zip_min_deflate_gain) as zip_writer:
+        for index, page in enumerate(pages):
+            zip_writer.write(f"page_{index + 1:03d}.pdf", page)
+    return sink.length
+
+
+def bench_zip(pages):
+    for label, make in (("text", make_pdf), ("scan", make_scan)):
+        source = Source(make(pages))
+        pdf_reader = PdfReader(source.stream)
+        page_pdfs = list(split_pages(source, pdf_reader, split_parts("pages", pdf_reader, pages)[0], 1))
+        print(f"🔍 ZIP: {pages} {label} pages ({sum(map(len, page_pdfs))} bytes)")
+        for name, write_zip in (("in memory", zip_in_memory), ("streamed", zip_streamed)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            size = write_zip(page_pdfs)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<10} {elapsed:7.2f} s   {size:>10} bytes   peak {peak / 1024 / 1024:6.1f} MB")
+
+
+def bench_modes(content, pages):
+    print(f"🔍 Split modes: {pages} pages, single worker")
+    for label, mode, ranges, chunk_size in (("every page", "pages", None, None),
+                                            ("pages 10-20", "ranges", "10-20", None),
+                                            ("chunks of 50", "chunks", None, 50)):
+        source = Source(content)
+        started = time.perf_counter()
+        pdf_reader = PdfReader(source.stream)
+        parts, _ = split_parts(mode, pdf_reader, pages, ranges, chunk_size)
+        total_bytes = sum(len(part) for part in split_pages(source, pdf_reader, parts, 1))
+        elapsed = time.perf_counter() - started
+        print(f"{label:<14} {elapsed:7.2f} s   {len(parts):>5} PDF(s)   {total_bytes:>10} bytes")
+
+
+def bench_output(content, pages):
+    source = Source(content)
+    pdf_reader = PdfReader(source.stream)
+    page_pdfs = list(split_pages(source, pdf_reader, split_parts("pages", pdf_reader, pages)[0], 1))
+    names = [f"page_{index + 1:03d}.pdf" for index in range(pages)]
+    print(f"🔍 Split output: {pages} pages")
+
+    started = time.perf_counter()
+    zip_size = zip_streamed(page_pdfs)
+    elapsed = time.perf_counter() - started
+    print(f"{'zip':<6} {elapsed:7.2f} s   stored {zip_size:>10} bytes   one page {zip_size:>10} bytes")
+
+    started = time.perf_counter()
+    files = [(name, len(page), zlib.crc32(page), page) for name, page in zip(names, page_pdfs)]
+    elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    segments, archive_size = stored_archive(files, time.localtime()[:6])
+    first_byte = time.perf_counter() - started
+    # The assembled archive must unzip to the same pages
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(data for _, _, data in segments)))
+    assert archive.read(names[-1]) == page_pdfs[-1]
+    print(f"{'parts':<6} {elapsed:7.2f} s   stored {sum(map(len, page_pdfs)):>10} bytes   "
+          f"one page {len(page_pdfs[0]):>10} bytes   ZIP of {archive_size} bytes laid out in {first_byte * 1000:.1f} ms")
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    content = make_pdf(pages)
+    cores = os.cpu_count() or 1
+    print(f"🔍 Split: {pages} pages ({len(content)} bytes), ranges of {settings.split_range_pages} pages, {cores} cores")
+
+    baseline = None
+    for workers in sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))):
+        source = Source(content)
+        started = time.perf_counter()
+        pdf_reader = PdfReader(source.stream)
+        parts, _ = split_parts("pages", pdf_reader, pages)
+        total_bytes = sum(len(page) for page in split_pages(source, pdf_reader, parts, workers))
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        print(f"{workers:>2} worker(s)   {elapsed:7.2f} s   {pages / elapsed:7.1f} pages/s   "
+              f"speedup {baseline / elapsed:4.2f}x   ({total_bytes} bytes of pages)")
+
+    bench_zip(pages)
+    bench_modes(content, pages)
+    bench_output(content, pages)
+
+
+if __name__ == "__main__":
+    main()
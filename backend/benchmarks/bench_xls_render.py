@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: XlsToPdf sheet rendering
+1. Core scaling: a 20-sheet workbook rendered across 1..N render worker processes.
+2. Row scaling: one sheet of growing size rendered as a single table vs. in
+   fixed-size row blocks (XLS_TABLE_BLOCK_ROWS), single worker.
+3. Per-sheet overhead: many small sheets with the shared render profile vs. a
+   profile (styles) rebuilt for every sheet, as before.
+No MongoDB needed.
+Usage: python benchmarks/bench_xls_render.py [sheets] [rows_per_sheet]
+"""
+
+import io
+import os
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+from config import settings
+from tools_commands.XlsToPdf import batch_jobs, render_batch, render_batches, sheet_jobs
+from tools_commands.render_profile import RenderProfile, get_render_profile
+
+COLUMNS = ["ID", "Name", "Region", "Quantity", "Price", "Total", "Date", "Notes"]
+
+
+def make_rows(rows):
+    yield COLUMNS
+    for row in range(rows):
+        yield [row, f"Item {row}", f"Region {row % 7}", row % 13, row * 1.25,
+               row * (row % 13) * 1.25, f"2024-01-{row % 28 + 1:02d}", "lorem ipsum " * 2]
+
+
+def make_workbook(sheets, rows):
+    """A workbook of sheets x rows with 8 mixed-type columns"""
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_index in range(sheets):
+        sheet = workbook.create_sheet(f"Sheet {sheet_index + 1}")
+        for row in make_rows(rows):
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def workbook_jobs(buffer, block_rows):
+    """Render jobs of a workbook, as the handler builds them"""
+    workbook = openpyxl.load_workbook(buffer, read_only=True, data_only=True)
+    for name in workbook.sheetnames:
+        yield from sheet_jobs(f"bench.xlsx - {name}", workbook[name].iter_rows(values_only=True),
+                              settings.xls_part_rows, block_rows)
+    workbook.close()
+
+
+def timed_render(jobs, workers):
+    started = time.perf_counter()
+    batches = batch_jobs(jobs, settings.xls_part_rows)
+    total_bytes = sum(len(pdf) for _, pdf, _ in render_batches(batches, workers))
+    return time.perf_counter() - started, total_bytes
+
+
+def bench_cores(sheets, rows):
+    buffer = make_workbook(sheets, rows)
+    cores = os.cpu_count() or 1
+    print(f"🔍 Core scaling: {sheets} sheets x {rows} rows, {cores} cores")
+
+    baseline = None
+    for workers in sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))):
+        buffer.seek(0)
+        elapsed, total_bytes = timed_render(workbook_jobs(buffer, settings.xls_table_block_rows), workers)
+        baseline = baseline or elapsed
+        print(f"{workers:>2} worker(s)   {elapsed:7.2f} s   speedup {baseline / elapsed:4.2f}x   ({total_bytes} PDF bytes)")
+
+
+def bench_rows():
+    print(f"🔍 Row scaling: one sheet, single table vs. blocks of {settings.xls_table_block_rows} rows")
+    for rows in (1000, 2000, 4000, 8000):
+        results = []
+        for block_rows in (rows, settings.xls_table_block_rows):
+            jobs = sheet_jobs("bench", make_rows(rows), rows, block_rows)
+            elapsed, _ = timed_render(jobs, 1)
+            results.append(elapsed)
+        print(f"{rows:>6} rows   single table {results[0]:7.2f} s   blocks {results[1]:7.2f} s")
+
+
+def bench_small_sheets(sheets=300):
+    jobs = [job for index in range(sheets)
+            for job in sheet_jobs(f"Sheet {index}", make_rows(5), 100, settings.xls_table_block_rows)]
+    print(f"🔍 Per-sheet overhead: {sheets} sheets x 5 rows, single worker")
+
+    get_render_profile()  # Built once per process
+    started = time.perf_counter()
+    for job in jobs:
+        render_batch([job])
+    shared = (time.perf_counter() - started) / sheets
+
+    started = time.perf_counter()
+    for job in jobs:
+        render_batch([job], RenderProfile(settings.xls_render_profile))
+    rebuilt = (time.perf_counter() - started) / sheets
+
+    print(f"shared profile   {shared * 1000:7.2f} ms/sheet")
+    print(f"rebuilt per sheet {rebuilt * 1000:6.2f} ms/sheet")
+
+
+def main():
+    sheets = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    bench_cores(sheets, rows)
+    bench_rows()
+    bench_small_sheets()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,11 @@ Handles both automatic batch cleanup and manual cleanup operations
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from bson import ObjectId
 from typing import Dict, Any, List
 from config import settings
+from database import get_database
 
 # Set up logging
 logger = logging.getLogger('cleanup_service')
@@ -18,14 +19,16 @@ class TmpFilesCleanupService:
     """Service for cleaning up temporary files from GridFS"""
     
     def __init__(self):
-        self.client = AsyncIOMotorClient(settings.mongodb_url)
-        self.db = self.client[settings.database_name]
+        self.db = get_database()
         self.tmp_bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name="tmp_files")
     
     async def cleanup_old_files(self, max_age_hours: int = 24) -> Dict[str, Any]:
         """
         Remove temporary files older than max_age_hours
         
+        Outputs held by the result cache are skipped; cleanup_result_cache()
+        evicts them.
+        
         Args:
             max_age_hours: Files older than this will be deleted (default: 24 hours)
             
@@ -42,7 +45,10 @@ class TmpFilesCleanupService:
         
         try:
             # Find old files
-            cursor = self.tmp_bucket.find({"uploadDate": {"$lt": cutoff_date}})
+            cursor = self.tmp_bucket.find({
+                "uploadDate": {"$lt": cutoff_date},
+                "metadata.cached": {"$ne": True}
+            })
             
             async for file_doc in cursor:
                 try:
@@ -211,6 +217,89 @@ class TmpFilesCleanupService:
                 "total_size_freed_bytes": total_size_freed
             }
     
+    async def cleanup_result_cache(self, ttl_hours: int = 72, max_size_mb: int = 500) -> Dict[str, Any]:
+        """
+        Evict command result cache entries and their output files
+        
+        Entries unused for ttl_hours are evicted first; then, while the cache
+        is larger than max_size_mb, the least recently used ones. Entries used
+        within the last hour are kept so fresh results stay downloadable.
+        
+        Args:
+            ttl_hours: Evict entries not used for this many hours
+            max_size_mb: Size budget of all cached outputs
+            
+        Returns:
+            Dict with cleanup statistics
+        """
+        now = datetime.utcnow()
+        ttl_cutoff = now - timedelta(hours=ttl_hours)
+        keep_after = now - timedelta(hours=1)
+        max_size_bytes = max_size_mb * 1024 * 1024
+        logger.info(f"🗄️ Starting result cache cleanup (TTL {ttl_hours} hours, max {max_size_mb} MB)")
+        
+        evicted_count = 0
+        deleted_count = 0
+        total_size_freed = 0
+        errors = []
+        
+        try:
+            cache_size = 0
+            async for entry in self.db.command_cache.find({}, {"size_bytes": 1}):
+                cache_size += entry.get("size_bytes", 0)
+            
+            # Oldest first: expired entries, then LRU entries while over budget
+            cursor = self.db.command_cache.find(
+                {"last_used_at": {"$lt": keep_after}}
+            ).sort("last_used_at", 1)
+            
+            async for entry in cursor:
+                expired = entry["last_used_at"] < ttl_cutoff
+                if not expired and cache_size <= max_size_bytes:
+                    break
+                
+                try:
+                    # Remove the entry first so no new command can hit it
+                    await self.db.command_cache.delete_one({"_id": entry["_id"]})
+                    for file_id_str in entry.get("output_file_ids", []):
+                        try:
+                            await self.tmp_bucket.delete(ObjectId(file_id_str))
+                            deleted_count += 1
+                        except Exception as e:
+                            logger.warning(f"Cached output {file_id_str} not deleted: {e}")
+                    
+                    evicted_count += 1
+                    cache_size -= entry.get("size_bytes", 0)
+                    total_size_freed += entry.get("size_bytes", 0)
+                    reason = "expired" if expired else "over size budget"
+                    logger.info(f"🗑️ Evicted cached {entry.get('shell_command')} result ({reason}, {entry.get('size_bytes', 0)} bytes)")
+                    
+                except Exception as e:
+                    errors.append({"cache_key": entry["_id"], "error": str(e)})
+                    logger.error(f"❌ Failed to evict cache entry {entry['_id']}: {e}")
+            
+            size_mb = total_size_freed / (1024 * 1024)
+            logger.info(f"✅ Result cache cleanup completed: {evicted_count} entries evicted, {size_mb:.2f} MB freed")
+            
+            return {
+                "success": True,
+                "evicted_entries": evicted_count,
+                "deleted_count": deleted_count,
+                "total_size_freed_bytes": total_size_freed,
+                "total_size_freed_mb": round(size_mb, 2),
+                "cache_size_mb": round(cache_size / (1024 * 1024), 2),
+                "errors": errors
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Critical error during result cache cleanup: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "deleted_count": deleted_count,
+                "total_size_freed_bytes": total_size_freed
+            }
+    
     async def get_cleanup_stats(self) -> Dict[str, Any]:
         """
         Get statistics about temporary files without deleting them
@@ -236,9 +325,12 @@ class TmpFilesCleanupService:
             
             cursor = self.tmp_bucket.find({})
             
+            cached_files = 0
             async for file_doc in cursor:
                 total_files += 1
                 total_size += file_doc.length
+                if (file_doc.metadata or {}).get("cached"):
+                    cached_files += 1
                 
                 upload_date = file_doc.upload_date
                 if upload_date > one_hour_ago:
@@ -256,6 +348,8 @@ class TmpFilesCleanupService:
                 "total_size_bytes": total_size,
                 "total_size_mb": round(total_size / (1024 * 1024), 2),
                 "files_by_age": files_by_age,
+                "cached_files": cached_files,
+                "cache_entries": await self.db.command_cache.count_documents({}),
                 "timestamp": now.isoformat()
             }
             
@@ -268,7 +362,7 @@ class TmpFilesCleanupService:
     
     async def full_cleanup(self, max_age_hours: int = 24) -> Dict[str, Any]:
         """
-        Run both time-based and command-based cleanup
+        Run time-based, command-based and result cache cleanup
         
         Args:
             max_age_hours: Maximum age for files in hours
@@ -278,13 +372,18 @@ class TmpFilesCleanupService:
         """
         logger.info(f"🚀 Starting full cleanup process...")
         
-        # Run both cleanup methods
+        # Run all cleanup methods
         time_based_result = await self.cleanup_old_files(max_age_hours)
         command_based_result = await self.cleanup_by_command_status()
+        cache_result = await self.cleanup_result_cache(
+            ttl_hours=getattr(settings, 'result_cache_ttl_hours', 72),
+            max_size_mb=getattr(settings, 'result_cache_max_mb', 500)
+        )
+        results = (time_based_result, command_based_result, cache_result)
         
         # Combine results
-        total_deleted = time_based_result.get("deleted_count", 0) + command_based_result.get("deleted_count", 0)
-        total_size_freed = time_based_result.get("total_size_freed_bytes", 0) + command_based_result.get("total_size_freed_bytes", 0)
+        total_deleted = sum(result.get("deleted_count", 0) for result in results)
+        total_size_freed = sum(result.get("total_size_freed_bytes", 0) for result in results)
         
         return {
             "success": True,
@@ -294,6 +393,7 @@ class TmpFilesCleanupService:
             "total_size_freed_mb": round(total_size_freed / (1024 * 1024), 2),
             "time_based_cleanup": time_based_result,
             "command_based_cleanup": command_based_result,
+            "result_cache_cleanup": cache_result,
             "timestamp": datetime.utcnow().isoformat()
         }
 
@@ -0,0 +1,246 @@
+"""
+Command events
+In-process pub/sub of command state transitions (queued, started, progress,
+done, failed) for push-based status endpoints. Transitions of commands executed
+by this process are published directly by process_manager; a single watcher
+(MongoDB change stream, or a batched poll when change streams are unavailable)
+picks up transitions made by other nodes and standalone workers.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Set
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from config import settings
+from command_queue import STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+
+# Set up logging
+logger = logging.getLogger('command_events')
+
+EVENT_QUEUED = "queued"
+EVENT_STARTED = "started"
+EVENT_PROGRESS = "progress"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+
+FINAL_EVENTS = (EVENT_DONE, EVENT_FAILED)
+
+# Command document fields whose changes produce an event
+WATCHED_FIELDS = ("status", "exit_state", "progress")
+
+_STATUS_EVENTS = {
+    STATUS_QUEUED: EVENT_QUEUED,
+    STATUS_RUNNING: EVENT_STARTED,
+    STATUS_DONE: EVENT_DONE,
+    STATUS_FAILED: EVENT_FAILED
+}
+
+
+def event_from_doc(command_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the event describing the current state of a command document"""
+    status = command_doc.get("status")
+    exit_state = command_doc.get("exit_state")
+
+    event_type = _STATUS_EVENTS.get(status)
+    if event_type == EVENT_STARTED and command_doc.get("progress"):
+        event_type = EVENT_PROGRESS
+    elif event_type is None:
+        # Legacy documents without a queue status
+        if exit_state == -1:
+            event_type = EVENT_STARTED
+        else:
+            event_type = EVENT_DONE if exit_state == 0 else EVENT_FAILED
+
+    event = {
+        "command_id": str(command_doc["_id"]),
+        "event": event_type,
+        "status": status,
+        "exit_state": exit_state,
+        "attempts": command_doc.get("attempts")
+    }
+    if event_type == EVENT_PROGRESS:
+        event["progress"] = command_doc["progress"]
+    if event_type in FINAL_EVENTS:
+        event["stdout"] = command_doc.get("stdout")
+        event["stderr"] = command_doc.get("stderr")
+    return event
+
+
+def event_key(event: Dict[str, Any]):
+    """Identity of an event, used to drop duplicates seen by several sources"""
+    return (event["event"], event.get("exit_state"), event.get("attempts"), repr(event.get("progress")))
+
+
+class CommandEventBus:
+    """
+    Fan-out of command events to subscribers
+
+    Every subscriber gets its own bounded asyncio.Queue and long-poll requests
+    share one future per command; waiting costs no database traffic. Only
+    commands with subscribers or waiters are tracked, and one watcher serves
+    all of them.
+    """
+
+    def __init__(self, poll_seconds: int = 2, queue_size: int = 100):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._last_event: Dict[str, Any] = {}  # command_id -> key of the last published event
+        # Long-poll waiters: one shared future per command, resolved by its final event
+        self._final_futures: Dict[str, asyncio.Future] = {}
+        self._final_waiters: Dict[str, int] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    def subscribe(self, command_id: str) -> asyncio.Queue:
+        """Start receiving events for a command (call unsubscribe() when done)"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(command_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, command_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(command_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[command_id]
+            self._forget(command_id)
+
+    def watch_final(self, command_id: str) -> asyncio.Future:
+        """
+        Shared future resolved with the final (done/failed) event of a command
+
+        All long-poll requests for the same command wait on the same future.
+        Call release_final() once per watch_final() call.
+        """
+        future = self._final_futures.get(command_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._final_futures[command_id] = future
+        self._final_waiters[command_id] = self._final_waiters.get(command_id, 0) + 1
+        return future
+
+    def release_final(self, command_id: str):
+        waiters = self._final_waiters.get(command_id, 0) - 1
+        if waiters > 0:
+            self._final_waiters[command_id] = waiters
+            return
+        self._final_waiters.pop(command_id, None)
+        self._final_futures.pop(command_id, None)
+        self._forget(command_id)
+
+    async def wait_final(self, future: asyncio.Future, timeout: float) -> bool:
+        """Wait on a watch_final() future; False on timeout"""
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _forget(self, command_id: str):
+        """Drop de-duplication state once nobody watches the command anymore"""
+        if command_id not in self._subscribers and command_id not in self._final_futures:
+            self._last_event.pop(command_id, None)
+
+    def is_watched(self, command_id: str) -> bool:
+        return command_id in self._subscribers or command_id in self._final_futures
+
+    def watched_ids(self) -> Set[str]:
+        return set(self._subscribers) | set(self._final_futures)
+
+    def publish(self, event: Dict[str, Any]):
+        """Deliver an event to the subscribers of its command"""
+        command_id = event["command_id"]
+        if not self.is_watched(command_id):
+            return
+
+        key = event_key(event)
+        if self._last_event.get(command_id) == key:
+            return
+        self._last_event[command_id] = key
+
+        future = self._final_futures.get(command_id)
+        if future is not None and not future.done() and event["event"] in FINAL_EVENTS:
+            future.set_result(event)
+
+        for queue in self._subscribers.get(command_id, ()):
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than block publishers
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def publish_doc(self, command_doc: Dict[str, Any]):
+        """Publish the state of a command document"""
+        self.publish(event_from_doc(command_doc))
+
+    def start(self):
+        self._watcher = asyncio.create_task(self._watch_loop())
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch_loop(self):
+        """Follow transitions made by other processes: change stream first, polling as fallback"""
+        from database import get_database
+
+        db = get_database()
+        updated = [{f"updateDescription.updatedFields.{field}": {"$exists": True}} for field in WATCHED_FIELDS]
+        pipeline = [{"$match": {"$or": [{"operationType": "replace"}, {"operationType": "update", "$or": updated}]}}]
+
+        while True:
+            try:
+                async with db.commands.watch(pipeline, full_document="updateLookup") as stream:
+                    logger.info("Watching command transitions with a change stream")
+                    async for change in stream:
+                        command_doc = change.get("fullDocument")
+                        if command_doc is not None and self.is_watched(str(command_doc["_id"])):
+                            self.publish_doc(command_doc)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # Change streams need a replica set or sharded cluster
+                logger.info(f"Change streams unavailable ({e}), polling watched commands every {self.poll_seconds}s")
+                await self._poll_loop(db)
+                return
+            except PyMongoError as e:
+                logger.error(f"Command change stream interrupted: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _poll_loop(self, db):
+        """One batched query per interval for all watched commands"""
+        projection = {field: 1 for field in WATCHED_FIELDS + ("attempts", "stdout", "stderr")}
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            watched = self.watched_ids()
+            if not watched:
+                continue
+            try:
+                cursor = db.commands.find(
+                    {"_id": {"$in": [ObjectId(command_id) for command_id in watched]}},
+                    projection
+                )
+                async for command_doc in cursor:
+                    self.publish_doc(command_doc)
+            except Exception as e:
+                logger.error(f"Failed to poll watched commands: {e}")
+
+
+# Global event bus (publishing works before start(); start() adds the watcher)
+command_events = CommandEventBus(poll_seconds=settings.command_events_poll_seconds)
+
+
+def start_command_events() -> CommandEventBus:
+    """Start watching command transitions made by other processes"""
+    command_events.start()
+    return command_events
+
+
+def stop_command_events():
+    command_events.stop()
+
+
+def get_command_events() -> CommandEventBus:
+    return command_events
@@ -0,0 +1,230 @@
+"""
+Durable command queue on the MongoDB 'commands' collection
+Commands are claimed atomically with find_one_and_update and held with a
+heartbeat-renewed lease, so any API node or standalone worker can execute
+them and work survives process restarts
+"""
+
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from config import settings
+
+# Queue states stored in the 'status' field of a command document.
+# exit_state keeps its meaning (-1 until the command has a final result).
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Identifies this process as lease owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def priority_for(shell_command: str) -> int:
+    """Queue priority of a command type (lower runs first, unknown types last)"""
+    priorities = settings.command_priorities
+    return priorities.get(shell_command, max(priorities.values(), default=0) + 1)
+
+
+def queue_fields(priority: int) -> Dict[str, Any]:
+    """Queue bookkeeping fields for a newly created command document"""
+    return {
+        "status": STATUS_QUEUED,
+        "priority": priority,
+        "attempts": 0,
+        "max_attempts": settings.command_max_attempts,
+        "available_at": datetime.utcnow(),
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "heartbeat_at": None,
+        "last_error": None
+    }
+
+
+def release_fields(status: str) -> Dict[str, Any]:
+    """Fields that end a lease when a command reaches a final state"""
+    return {
+        "status": status,
+        "lease_owner": None,
+        "lease_expires_at": None
+    }
+
+
+def _attempts_compared(operator: str) -> Dict[str, Any]:
+    """Compare 'attempts' with the command's 'max_attempts' ($lt: attempts left, $gte: none left)"""
+    return {"$expr": {operator: ["$attempts", {"$ifNull": ["$max_attempts", settings.command_max_attempts]}]}}
+
+
+def _claimable_filter(now: datetime, grace_seconds: int = 0) -> Dict[str, Any]:
+    """Queued commands that are due, plus running commands whose lease expired with attempts left"""
+    return {
+        "$or": [
+            {"status": STATUS_QUEUED, "available_at": {"$lte": now - timedelta(seconds=grace_seconds)}},
+            {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": now}, **_attempts_compared("$lt")}
+        ]
+    }
+
+
+async def ensure_indexes(db):
+    """Create the indexes used by claiming and recovery"""
+    await db.commands.create_index([("status", ASCENDING), ("priority", ASCENDING), ("created_at", ASCENDING)])
+    await db.commands.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+
+
+async def migrate_legacy_commands(db) -> int:
+    """Put commands created before the durable queue (no 'status', still -1) back in the queue"""
+    result = await db.commands.update_many(
+        {"status": {"$exists": False}, "exit_state": -1},
+        {"$set": queue_fields(priority=0)}
+    )
+    return result.modified_count
+
+
+async def claim_command(db, command_id: str, worker_id: str = WORKER_ID) -> Optional[Dict[str, Any]]:
+    """
+    Atomically take the lease on a specific command
+
+    Returns:
+        The claimed command document, or None if it is not claimable
+        (already running elsewhere, finished, or waiting for a retry)
+    """
+    now = datetime.utcnow()
+    query = _claimable_filter(now)
+    query["_id"] = ObjectId(command_id)
+
+    return await db.commands.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": STATUS_RUNNING,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=settings.command_lease_seconds),
+                "heartbeat_at": now,
+                "started_at": now,
+                "progress": None  # Reset by every attempt
+            },
+            "$inc": {"attempts": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def heartbeat(db, command_id: str, worker_id: str = WORKER_ID) -> bool:
+    """
+    Extend the lease of a running command
+
+    Returns:
+        False if the lease was lost (expired and claimed by another worker)
+    """
+    now = datetime.utcnow()
+    result = await db.commands.update_one(
+        {"_id": ObjectId(command_id), "status": STATUS_RUNNING, "lease_owner": worker_id},
+        {"$set": {
+            "lease_expires_at": now + timedelta(seconds=settings.command_lease_seconds),
+            "heartbeat_at": now
+        }}
+    )
+    return result.matched_count == 1
+
+
+async def schedule_retry(db, command_doc: Dict[str, Any], error: str, worker_id: str = WORKER_ID) -> bool:
+    """
+    Requeue a command after an infrastructure failure (crash, lost worker)
+
+    Uses exponential backoff: retry_backoff * 2^(attempts - 1).
+
+    Returns:
+        True if the command was requeued, False if it has no attempts left
+    """
+    attempts = command_doc.get("attempts", 1)
+    max_attempts = command_doc.get("max_attempts", settings.command_max_attempts)
+    if attempts >= max_attempts:
+        return False
+
+    delay = settings.command_retry_backoff_seconds * (2 ** (attempts - 1))
+    result = await db.commands.update_one(
+        {"_id": command_doc["_id"], "lease_owner": worker_id},
+        {"$set": {
+            "status": STATUS_QUEUED,
+            "exit_state": -1,
+            "available_at": datetime.utcnow() + timedelta(seconds=delay),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "started_at": None,
+            "last_error": error
+        }}
+    )
+    return result.matched_count == 1
+
+
+async def fail_lost_commands(db) -> int:
+    """
+    Fail running commands whose lease expired after their last attempt
+
+    Their worker died (crash, OOM kill) on every attempt: re-leasing them
+    would only take down another worker.
+
+    Returns:
+        Number of commands marked failed
+    """
+    now = datetime.utcnow()
+    error = "Command lease lost (worker crashed or stopped) and no attempts left"
+    result = await db.commands.update_many(
+        {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": now}, **_attempts_compared("$gte")},
+        {"$set": {
+            "exit_state": 2,  # 2 = process management error
+            "stderr": error,
+            "last_error": error,
+            "completed_at": now,
+            **release_fields(STATUS_FAILED)
+        }}
+    )
+    return result.modified_count
+
+
+async def find_claimable(db, exclude: Set[str], limit: int, grace_seconds: int = 0) -> List[Dict[str, Any]]:
+    """
+    List commands waiting for a worker, highest priority and oldest first
+
+    Args:
+        exclude: Command IDs already known to the caller
+        limit: Maximum number of documents to return
+        grace_seconds: Ignore queued commands younger than this (they are about
+            to be run by the API node that created them)
+    """
+    if limit <= 0:
+        return []
+
+    query = _claimable_filter(datetime.utcnow(), grace_seconds)
+    if exclude:
+        query["_id"] = {"$nin": [ObjectId(command_id) for command_id in exclude]}
+
+    cursor = db.commands.find(
+        query,
+        {"shell_command": 1, "args.user_id": 1}
+    ).sort([("priority", ASCENDING), ("created_at", ASCENDING)]).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+async def count_queued(db, user_id: Optional[str] = None) -> int:
+    """Number of queued commands (optionally for one user)"""
+    query: Dict[str, Any] = {"status": STATUS_QUEUED}
+    if user_id is not None:
+        query["args.user_id"] = user_id
+    return await db.commands.count_documents(query)
+
+
+async def durable_queue_position(db, command_doc: Dict[str, Any]) -> int:
+    """1-based position of a queued command in the durable queue (priority, then age)"""
+    ahead = await db.commands.count_documents({
+        "status": STATUS_QUEUED,
+        "$or": [
+            {"priority": {"$lt": command_doc.get("priority", 0)}},
+            {"priority": command_doc.get("priority", 0), "created_at": {"$lt": command_doc["created_at"]}}
+        ]
+    })
+    return ahead + 1
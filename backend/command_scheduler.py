@@ -0,0 +1,321 @@
+"""
+Command scheduler
+Bounded, prioritised queue in front of process_command with admission control.
+The durable queue in MongoDB (command_queue.py) is the source of truth; this
+scheduler orders and throttles the commands executed by the current process.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Set, Tuple
+from config import settings
+from command_queue import count_queued, fail_lost_commands, find_claimable
+
+# Set up logging
+logger = logging.getLogger('command_scheduler')
+
+
+class SchedulerFullError(Exception):
+    """Raised when a command cannot be admitted (queue full or per-user limit reached)"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CommandScheduler:
+    """
+    Runs at most max_concurrent commands at a time
+
+    Queued commands are ordered by command type priority (lower value runs first)
+    and, within a priority level, round-robin across users so one user's burst
+    cannot starve everyone else.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue_depth: int,
+                 max_queued_per_user: int, priorities: Dict[str, int],
+                 execute: bool = True, poll_seconds: int = 5, grace_seconds: int = 0):
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_queued_per_user = max_queued_per_user
+        self.priorities = priorities
+        self.default_priority = max(priorities.values(), default=0) + 1
+        self.execute = execute  # False: API-only node, standalone workers run the commands
+        self.poll_seconds = poll_seconds
+        self.grace_seconds = grace_seconds
+
+        # priority -> user_id -> deque of command IDs (user order = round-robin order)
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._queued: Dict[str, Tuple[int, str]] = {}  # command_id -> (priority, user_id)
+        self._running: Set[str] = set()
+        self._reserved: Dict[str, int] = {}  # user_id -> slots admitted but not submitted yet
+        self._avg_duration = 10.0  # Moving average of command run time (seconds)
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queued)
+
+    @property
+    def reserved(self) -> int:
+        return sum(self._reserved.values())
+
+    def _queued_for_user(self, user_id: str) -> int:
+        return sum(1 for _, owner in self._queued.values() if owner == user_id)
+
+    def _reserve(self, user_id: str):
+        self._reserved[user_id] = self._reserved.get(user_id, 0) + 1
+
+    def _estimate_wait(self, queued_ahead: int) -> int:
+        """Rough seconds until a new command would start running"""
+        seconds = self._avg_duration * (queued_ahead + 1) / self.max_concurrent
+        return max(1, min(300, math.ceil(seconds)))
+
+    def _raise_if_full(self, queue_depth: int, user_queued: int):
+        """
+        Raises:
+            SchedulerFullError: 503 when the global queue is full,
+                429 when the user already has too many queued commands
+        """
+        if queue_depth >= self.max_queue_depth:
+            raise SchedulerFullError(
+                f"Server is busy: {queue_depth} commands queued. Please retry later.",
+                status_code=503,
+                retry_after=self._estimate_wait(queue_depth)
+            )
+
+        if user_queued >= self.max_queued_per_user:
+            raise SchedulerFullError(
+                f"Too many queued commands for this user ({user_queued}). Please retry later.",
+                status_code=429,
+                retry_after=self._estimate_wait(user_queued)
+            )
+
+    def check_admission(self, user_id: str):
+        """Verify a new command from user_id fits in the in-memory queue, reserved slots included (see _raise_if_full)"""
+        self._raise_if_full(self.queue_depth + self.reserved,
+                            self._queued_for_user(user_id) + self._reserved.get(user_id, 0))
+
+    async def admit(self, user_id: str):
+        """
+        Admission control used by the routes: reserve a queue slot for user_id
+
+        The slot is held while the route uploads files and creates the command,
+        so a burst of concurrent requests cannot all pass the check at once.
+        It is used by submit(reserved=True) or given back with release().
+
+        Executing nodes use their in-memory queue. API-only nodes check the
+        durable queue in MongoDB, shared by all standalone workers, plus the
+        slots reserved on this node.
+        """
+        if self.execute:
+            # No await between the check and the reservation: atomic on the event loop
+            self.check_admission(user_id)
+            self._reserve(user_id)
+            return
+
+        from database import get_database
+        db = get_database()
+        queued, user_queued = await count_queued(db), await count_queued(db, user_id)
+        self._raise_if_full(queued + self.reserved, user_queued + self._reserved.get(user_id, 0))
+        self._reserve(user_id)
+
+    def release(self, user_id: str):
+        """Give back a slot reserved by admit() that will not be submitted (upload or command creation failed)"""
+        remaining = self._reserved.get(user_id, 0) - 1
+        if remaining > 0:
+            self._reserved[user_id] = remaining
+        else:
+            self._reserved.pop(user_id, None)
+
+    def submit(self, command_id: str, shell_command: str, user_id: str, reserved: bool = False):
+        """
+        Queue a command for execution
+
+        reserved=True hands over the slot reserved by admit() (routes);
+        the durable queue poller submits without a reservation.
+        """
+        if reserved:
+            self.release(user_id)
+        if not self.execute:
+            # Persisted as queued by create_command; a standalone worker will claim it
+            return
+
+        priority = self.priorities.get(shell_command, self.default_priority)
+        users = self._queues.setdefault(priority, OrderedDict())
+        users.setdefault(user_id, deque()).append(command_id)
+        self._queued[command_id] = (priority, user_id)
+        self._wakeup.set()
+
+        logger.info(f"Queued {shell_command} command {command_id} (priority {priority}, user {user_id}, depth {self.queue_depth})")
+
+    def _pop_next(self) -> Optional[str]:
+        """Take the next command: highest priority first, round-robin across users"""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_id, commands = next(iter(users.items()))
+            command_id = commands.popleft()
+            if commands:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            del self._queued[command_id]
+            return command_id
+        return None
+
+    def _dispatch_order(self) -> List[str]:
+        """Queued command IDs in the order _pop_next() would return them"""
+        order = []
+        for priority in sorted(self._queues):
+            pending = [list(commands) for commands in self._queues[priority].values()]
+            depth = max((len(commands) for commands in pending), default=0)
+            for round_index in range(depth):
+                for commands in pending:
+                    if round_index < len(commands):
+                        order.append(commands[round_index])
+        return order
+
+    def get_queue_position(self, command_id: str) -> Optional[int]:
+        """1-based position in the queue, or None if the command is not queued"""
+        if command_id not in self._queued:
+            return None
+        return self._dispatch_order().index(command_id) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue_depth,
+            "reserved": self.reserved,
+            "running": len(self._running),
+            "max_concurrent": self.max_concurrent,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_duration_seconds": round(self._avg_duration, 2)
+        }
+
+    def start(self):
+        if not self.execute:
+            logger.info("Command scheduler in admission-only mode (commands run on standalone workers)")
+            return
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        self._poller = asyncio.create_task(self._poll_loop())
+        logger.info(f"Command scheduler started (max {self.max_concurrent} concurrent, queue depth {self.max_queue_depth})")
+
+    def stop(self):
+        for task in (self._dispatcher, self._poller):
+            if task is not None:
+                task.cancel()
+        self._dispatcher = None
+        self._poller = None
+
+    async def _poll_loop(self):
+        """
+        Pull work from the durable queue
+
+        Picks up commands left behind by a restart or crash (queued, or running
+        with an expired lease), retries whose backoff elapsed, and commands
+        created by other nodes that have not started within grace_seconds.
+        Commands whose lease expired on their last attempt are failed instead.
+        """
+        from database import get_database
+
+        while True:
+            try:
+                failed = await fail_lost_commands(get_database())
+                if failed:
+                    logger.warning(f"Failed {failed} command(s) that lost their lease on the last attempt")
+                free = self.max_concurrent - len(self._running) - self.queue_depth - self.reserved
+                docs = await find_claimable(
+                    get_database(),
+                    exclude=set(self._queued) | self._running,
+                    limit=free,
+                    grace_seconds=self.grace_seconds
+                )
+                for doc in docs:
+                    user_id = doc.get("args", {}).get("user_id", "unknown")
+                    self.submit(str(doc["_id"]), doc.get("shell_command"), user_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to poll durable command queue: {e}")
+
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _dispatch_loop(self):
+        """Start queued commands whenever a concurrency slot is free"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while len(self._running) < self.max_concurrent:
+                command_id = self._pop_next()
+                if command_id is None:
+                    break
+                self._running.add(command_id)
+                asyncio.create_task(self._run(command_id))
+
+    async def _run(self, command_id: str):
+        from process_manager import process_command
+
+        started = time.monotonic()
+        try:
+            await process_command(command_id)
+        except Exception as e:
+            logger.error(f"Command {command_id} raised in scheduler: {e}")
+        finally:
+            duration = time.monotonic() - started
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._running.discard(command_id)
+            self._wakeup.set()
+
+
+# Global scheduler instance
+command_scheduler: Optional[CommandScheduler] = None
+
+
+def start_command_scheduler() -> CommandScheduler:
+    """Create and start the global command scheduler"""
+    global command_scheduler
+
+    command_scheduler = CommandScheduler(
+        max_concurrent=settings.scheduler_max_concurrent,
+        max_queue_depth=settings.scheduler_max_queue_depth,
+        max_queued_per_user=settings.scheduler_max_queued_per_user,
+        priorities=settings.command_priorities,
+        execute=settings.run_commands_in_api,
+        poll_seconds=settings.command_queue_poll_seconds,
+        # Leave freshly created commands to the API node that received them
+        grace_seconds=2 * settings.command_queue_poll_seconds
+    )
+    command_scheduler.start()
+    return command_scheduler
+
+
+def stop_command_scheduler():
+    """Stop dispatching queued commands"""
+    if command_scheduler is not None:
+        command_scheduler.stop()
+
+
+def get_command_scheduler() -> Optional[CommandScheduler]:
+    """Get the global command scheduler (None if not started)"""
+    return command_scheduler
+
+
+def require_command_scheduler() -> CommandScheduler:
+    """
+    Get the global command scheduler for a route that queues a command
+
+    Raises:
+        SchedulerFullError: 503 while the scheduler is not started (startup, shutdown)
+    """
+    if command_scheduler is None:
+        raise SchedulerFullError("Command scheduler is not running. Please retry later.",
+                                 status_code=503, retry_after=5)
+    return command_scheduler
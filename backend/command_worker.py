@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Standalone command worker
+Pulls commands from the durable MongoDB queue and executes them, so workers
+can be scaled independently of the API (set RUN_COMMANDS_IN_API=false there)
+Usage: python command_worker.py
+"""
+
+import sys
+import asyncio
+import logging
+from database import init_db, get_database
+from command_queue import WORKER_ID, ensure_indexes
+from command_scheduler import CommandScheduler
+from worker_pool import start_worker_pool, stop_worker_pool
+from config import settings
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('command_worker.log'),
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger('command_worker')
+
+async def main():
+    """Run the worker until interrupted"""
+    logger.info(f"Command worker {WORKER_ID} starting")
+
+    await init_db()
+    await ensure_indexes(get_database())
+
+    start_worker_pool()
+
+    # Same scheduler as the API, fed only by the durable queue poller.
+    # No grace period: API-only nodes never run the commands they create.
+    scheduler = CommandScheduler(
+        max_concurrent=settings.scheduler_max_concurrent,
+        max_queue_depth=settings.scheduler_max_queue_depth,
+        max_queued_per_user=settings.scheduler_max_queued_per_user,
+        priorities=settings.command_priorities,
+        poll_seconds=settings.command_queue_poll_seconds,
+        grace_seconds=0
+    )
+    scheduler.start()
+    logger.info(f"Command worker ready (max {settings.scheduler_max_concurrent} concurrent commands)")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        scheduler.stop()
+        await asyncio.to_thread(stop_worker_pool)
+        logger.info("Command worker stopped")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
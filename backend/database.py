@@ -13,8 +13,8 @@ async def init_db():
     """Initialize database connection and models"""
     global client, database, images_bucket
     
-    # Create motor client
-    client = AsyncIOMotorClient(settings.mongodb_url)
+    # Create the single, pooled motor client shared by the whole process
+    client = AsyncIOMotorClient(settings.mongodb_url, **settings.mongo_client_options())
     database = client[settings.database_name]
     
     # Initialize beanie with the User model
@@ -33,3 +33,11 @@ def get_images_bucket():
 def get_database():
     """Get the database instance"""
     return database
+
+
+async def close_db():
+    """Close the shared database client"""
+    global client
+    if client is not None:
+        client.close()
+        client = None
@@ -4,11 +4,51 @@ File service for handling image uploads/downloads using GridFS
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from gridfs.errors import NoFile
 from database import get_images_bucket
-from typing import List, Dict, Any, Optional
+from config import settings
+from typing import List, Dict, Any, Optional, AsyncIterator, Union
+import asyncio
 import datetime
+import hashlib
 from bson import ObjectId
 import io
 
+# Bytes read from an upload per GridFS write (4 chunks of the default 255 KB)
+UPLOAD_READ_SIZE = 4 * 255 * 1024
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_SIZE_MB"""
+
+
+class _BytesSource:
+    """Async read() over in-memory bytes, so callers can still upload plain bytes"""
+    
+    def __init__(self, content: bytes):
+        self._buffer = io.BytesIO(content)
+        self.size = len(content)
+    
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+async def iter_grid_out(grid_out) -> AsyncIterator[bytes]:
+    """
+    Yield an open GridFS file one stored chunk at a time
+    
+    Each read fetches a single chunk document, so memory stays at one chunk
+    (255 KB by default) per download, and a slow client slows the reads down
+    (the response only asks for the next chunk once the previous one is sent).
+    """
+    try:
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        grid_out.close()
+
+
 class FileService:
     def __init__(self):
         """Initialize FileService with the images bucket"""
@@ -28,14 +68,71 @@ class FileService:
             db = get_database()
             self._tmp_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="tmp_files")
         return self._tmp_bucket
+    
+    async def _stream_upload(self, bucket: AsyncIOMotorGridFSBucket, source, filename: str,
+                             metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Copy an upload into GridFS chunk by chunk
+        
+        Size and SHA-256 are computed while streaming and stored in the file
+        metadata ('file_size', 'sha256'). Files larger than MAX_UPLOAD_SIZE_MB
+        are rejected before any GridFS write when their size is known, otherwise
+        as soon as the limit is crossed; the partial GridFS file is removed.
+        UploadFile sizes are only known once Starlette has spooled the body:
+        the request as a whole is capped earlier, while it is received, by
+        RequestSizeLimitMiddleware (MAX_REQUEST_SIZE_MB).
+        
+        Args:
+            source: bytes, or an object with an async read(size) (e.g. UploadFile)
+            
+        Returns:
+            Dict with 'file_id', 'size' and 'sha256'
+            
+        Raises:
+            FileTooLargeError: if the upload exceeds the maximum size
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = _BytesSource(bytes(source))
+        
+        max_bytes = settings.max_upload_size_mb * 1024 * 1024
+        too_large = f"File '{filename}' exceeds the maximum upload size of {settings.max_upload_size_mb} MB"
+        declared_size = getattr(source, "size", None)
+        if declared_size is not None and declared_size > max_bytes:
+            raise FileTooLargeError(too_large)
+        
+        grid_in = bucket.open_upload_stream(filename, metadata=metadata)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            while True:
+                chunk = await source.read(UPLOAD_READ_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(too_large)
+                digest.update(chunk)
+                await grid_in.write(chunk)
+            
+            await grid_in.set("metadata", {**metadata, "file_size": size, "sha256": digest.hexdigest()})
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+        
+        return {
+            "file_id": grid_in._id,
+            "size": size,
+            "sha256": digest.hexdigest()
+        }
 
-    async def upload_file(self, file_content: bytes, filename: str, content_type: str, 
+    async def upload_file(self, source: Union[bytes, Any], filename: str, content_type: str, 
                          user_email: str, user_id: str) -> Dict[str, Any]:
         """
-        Upload a file to GridFS
+        Upload a file to GridFS (streamed, see _stream_upload)
         
         Args:
-            file_content: The file content as bytes
+            source: The file content as bytes, or an UploadFile to stream from
             filename: Original filename
             content_type: MIME type of the file
             user_email: Email of the user uploading
@@ -54,40 +151,41 @@ class FileService:
                 "original_filename": filename,
                 "display_name": filename,
                 "content_type": content_type,
-                "upload_date": datetime.datetime.utcnow(),
-                "file_size": len(file_content)
+                "upload_date": datetime.datetime.utcnow()
+                # file_size and sha256 (strong ETag for downloads) are added while streaming
             }
             
-            # Upload to GridFS should be closed after use
-            file_id = await bucket.upload_from_stream(
-                filename=filename,
-                source=io.BytesIO(file_content),
-                metadata=metadata
-            )
+            upload = await self._stream_upload(bucket, source, filename, metadata)
             
             return {
                 "success": True,
-                "file_id": str(file_id),
+                "file_id": str(upload["file_id"]),
                 "filename": filename,
-                "size": len(file_content),
+                "size": upload["size"],
                 "content_type": content_type,
                 "owner": user_email,
                 "upload_date": metadata["upload_date"].isoformat()
             }
             
+        except FileTooLargeError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "status_code": 413
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Upload failed: {str(e)}"
             }
     
-    async def upload_temp_file(self, file_content: bytes, filename: str, content_type: str, 
+    async def upload_temp_file(self, source: Union[bytes, Any], filename: str, content_type: str, 
                               user_email: str, user_id: str) -> Dict[str, Any]:
         """
-        Upload a temporary file to GridFS tmp_files bucket
+        Upload a temporary file to GridFS tmp_files bucket (streamed, see _stream_upload)
         
         Args:
-            file_content: The file content as bytes
+            source: The file content as bytes, or an UploadFile to stream from
             filename: Original filename
             content_type: MIME type of the file
             user_email: Email of the user uploading
@@ -106,32 +204,104 @@ class FileService:
                 "original_filename": filename,
                 "content_type": content_type,
                 "upload_date": datetime.datetime.utcnow(),
-                "file_size": len(file_content),
                 "is_temporary": True
+                # file_size and sha256 (result cache key) are added while streaming
             }
             
             # Upload file to tmp_files bucket
-            file_stream = io.BytesIO(file_content)
-            file_id = await bucket.upload_from_stream(
-                filename,
-                file_stream,
-                metadata=metadata
-            )
+            upload = await self._stream_upload(bucket, source, filename, metadata)
             
             return {
                 "success": True,
-                "file_id": str(file_id),
+                "file_id": str(upload["file_id"]),
                 "filename": filename,
-                "size": len(file_content),
+                "size": upload["size"],
+                "sha256": upload["sha256"],
                 "content_type": content_type,
                 "bucket": "tmp_files"
             }
             
+        except FileTooLargeError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "status_code": 413
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Failed to upload temporary file: {str(e)}"
             }
+    
+    async def upload_temp_files(self, files: List[Any], user_email: str, user_id: str,
+                                default_content_type: Optional[str] = None,
+                                max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Upload a batch of files to the tmp_files bucket concurrently
+        
+        At most max_concurrency uploads (UPLOAD_CONCURRENCY by default) run at
+        once. The batch is all or nothing: after the first failure no further
+        uploads are started and the files already stored are deleted again.
+        
+        Args:
+            files: UploadFile objects (anything with filename, content_type, size and async read)
+            default_content_type: Used when a file has no content type
+            
+        Returns:
+            Dict with 'file_ids' in the order of files, or the error of the first
+            failed file ('filename', 'error', optional 'status_code')
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or settings.upload_concurrency)
+        failed = asyncio.Event()
+        
+        async def upload_one(file) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                if failed.is_set():
+                    return None
+                result = await self.upload_temp_file(
+                    source=file,
+                    filename=file.filename,
+                    content_type=file.content_type or default_content_type,
+                    user_email=user_email,
+                    user_id=user_id
+                )
+                if not result.get("success"):
+                    failed.set()
+                return result
+        
+        results = await asyncio.gather(*(upload_one(file) for file in files))
+        
+        if not failed.is_set():
+            return {
+                "success": True,
+                "file_ids": [result["file_id"] for result in results]
+            }
+        
+        # Roll back: the command will never be created for a partial batch
+        uploaded = [result["file_id"] for result in results if result and result.get("success")]
+        await self.delete_temp_files(uploaded)
+        file, error = next(
+            (file, result) for file, result in zip(files, results)
+            if result and not result.get("success")
+        )
+        return {
+            "success": False,
+            "filename": file.filename,
+            "error": error.get("error"),
+            "status_code": error.get("status_code", 500),
+            "rolled_back": len(uploaded)
+        }
+    
+    async def delete_temp_files(self, file_ids: List[str]):
+        """Delete tmp_files entries, ignoring files that are already gone"""
+        bucket = await self._get_tmp_bucket()
+        for file_id in file_ids:
+            try:
+                await bucket.delete(ObjectId(file_id))
+            except NoFile:
+                pass
+            except Exception as e:
+                print(f"Error deleting temporary file {file_id}: {e}")
 
     async def list_user_files(self, user_email: str, user_id: str) -> List[Dict[str, Any]]:
         """
@@ -218,7 +388,7 @@ class FileService:
     
     async def download_file(self, file_id: str, user_email: str, user_id: str) -> Optional[Dict[str, Any]]:
         """
-        Download a file from GridFS (only if owned by user)
+        Open a file in GridFS for download (only if owned by user)
         
         Args:
             file_id: GridFS file ID
@@ -226,40 +396,33 @@ class FileService:
             user_id: User's ID (for ownership verification)
             
         Returns:
-            Dict with file content and metadata, or None if not found/no access
+            Dict with the open GridFS download stream ('stream', read it with
+            iter_grid_out) and metadata, or None if not found/no access
         """
         try:
             bucket = await self._get_bucket()
             
-            # First get file info to verify ownership
-            cursor = bucket.find({"_id": ObjectId(file_id)})
-            file_doc = await cursor.next()
-            if not file_doc:
-                return None
+            # Opening the stream loads the file document used to verify ownership
+            grid_out = await bucket.open_download_stream(ObjectId(file_id))
+            metadata = grid_out.metadata or {}
                 
-            if file_doc.metadata.get("owner_email") != user_email:
+            if metadata.get("owner_email") != user_email:
+                grid_out.close()
                 return None  # Access denied
             
-            # Download the file content
-            content_stream = io.BytesIO()
-            await bucket.download_to_stream(ObjectId(file_id), content_stream)
-            file_bytes = content_stream.getvalue()
-            
             # Use display_name for download filename if available
-            download_filename = file_doc.metadata.get("display_name", file_doc.filename)
+            download_filename = metadata.get("display_name", grid_out.filename)
             
             return {
-                "content": file_bytes,
+                "stream": grid_out,
                 "filename": download_filename,  # Use display name for download
-                "original_filename": file_doc.filename,  # Keep original for reference
-                "content_type": file_doc.metadata.get("content_type", "application/octet-stream"),
-                "size": file_doc.length
+                "original_filename": grid_out.filename,  # Keep original for reference
+                "content_type": metadata.get("content_type", "application/octet-stream"),
+                "size": grid_out.length
             }
             
         except NoFile:
             return None
-        except StopAsyncIteration:
-            return None  # No file found
         except Exception as e:
             print(f"Error downloading file {file_id}: {e}")
             return None
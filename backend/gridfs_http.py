@@ -0,0 +1,214 @@
+"""
+HTTP download helpers for GridFS files
+Range requests (206/416), strong ETags and conditional GET (304) for the
+file download endpoints. GridFS files are never modified after upload, so the
+ETag of a file never changes. Split results stored as separate page files are
+served as a stored ZIP assembled on the fly from their manifest.
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi.responses import Response, StreamingResponse
+from file_service import iter_grid_out
+from tools_commands.zip_stream import Segment, stored_archive
+
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a Range header does not overlap the file"""
+
+
+def make_etag(grid_out) -> str:
+    """Strong ETag: content hash when known, otherwise file ID + length (files are immutable)"""
+    metadata = grid_out.metadata or {}
+    if metadata.get("sha256"):
+        return f'"{metadata["sha256"]}"'
+    return f'"{grid_out._id}-{grid_out.length}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range ("bytes=start-end", "bytes=start-", "bytes=-suffix")
+
+    Returns:
+        (start, end) inclusive, or None to serve the whole file (no header,
+        unsupported unit, multiple ranges or a malformed value)
+
+    Raises:
+        RangeNotSatisfiable: the range starts beyond the end of the file
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    first, last = (part.strip() for part in spec.split("-", 1))
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+
+    if start is None:
+        # Suffix range: the last N bytes
+        if end is None or end <= 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, length - end), length - 1
+
+    if start >= length:
+        raise RangeNotSatisfiable(header)
+    if end is None:
+        end = length - 1
+    if start > end:
+        return None
+    return start, min(end, length - 1)
+
+
+async def iter_grid_out_range(grid_out, start: int, end: int):
+    """Yield bytes start..end (inclusive), seeking straight to the chunk holding start"""
+    remaining = end - start + 1
+    try:
+        grid_out.seek(start)
+        while remaining > 0:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            if len(chunk) > remaining:
+                chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        grid_out.close()
+
+
+def ranged_response(request_headers, length: int, etag: str, filename: str, content_type: str,
+                    body: Callable[[int, int], AsyncIterator[bytes]],
+                    close: Optional[Callable[[], Any]] = None) -> Response:
+    """
+    Build a download response for content of a known length
+
+    Handles If-None-Match (304), If-Range, Range (206 / 416) and plain
+    downloads (200). body(start, end) streams bytes start..end (inclusive);
+    close() releases the source when no body is sent.
+    """
+    headers: Dict[str, str] = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename={filename}"
+    }
+
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        if close:
+            close()
+        return Response(status_code=304, headers={"ETag": etag})
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        # The client's partial copy is stale: send the whole file
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, length)
+    except RangeNotSatisfiable:
+        if close:
+            close()
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{length}", "ETag": etag})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(body(0, length - 1), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        body(start, end),
+        status_code=206,
+        media_type=content_type,
+        headers=headers
+    )
+
+
+def gridfs_download_response(grid_out, request_headers, filename: str, content_type: str) -> Response:
+    """
+    Build the download response for an open GridFS file
+
+    Full file, range, 304 or 416 (see ranged_response), always streaming from
+    GridFS chunk by chunk.
+    """
+    length = grid_out.length
+
+    def body(start: int, end: int) -> AsyncIterator[bytes]:
+        if start == 0 and end == length - 1:
+            return iter_grid_out(grid_out)
+        return iter_grid_out_range(grid_out, start, end)
+
+    return ranged_response(request_headers, length, make_etag(grid_out), filename, content_type,
+                           body, close=grid_out.close)
+
+
+class SplitPartsMissing(LookupError):
+    """Raised when part files of a split manifest no longer exist"""
+
+
+def split_archive_layout(manifest) -> Tuple[List[Segment], int]:
+    """
+    Byte layout of the stored ZIP of a split manifest (see SplitPdfs)
+
+    Sizes and CRCs were recorded when the parts were written and the entry
+    dates come from the manifest upload date, so every download of the
+    archive is the same, byte for byte.
+    """
+    date_time = manifest.upload_date.timetuple()[:6]
+    files = [(part["filename"], part["size_bytes"], part["crc32"], ObjectId(part["file_id"]))
+             for part in manifest.metadata["split_files"]]
+    return stored_archive(files, date_time)
+
+
+async def iter_archive_range(bucket, segments: List[Segment], start: int, end: int):
+    """Yield bytes start..end (inclusive) of an archive layout, opening part files as they are reached"""
+    for offset, length, data in segments:
+        if length == 0 or offset + length <= start:
+            continue
+        if offset > end:
+            break
+        first = max(start, offset) - offset
+        last = min(end, offset + length - 1) - offset
+        if isinstance(data, bytes):
+            yield data[first:last + 1]
+            continue
+        grid_out = await bucket.open_download_stream(data)
+        async for chunk in iter_grid_out_range(grid_out, first, last):
+            yield chunk
+
+
+async def split_archive_response(bucket, manifest, request_headers) -> Response:
+    """
+    Build the download response for a split manifest: its part files as one
+    stored ZIP, assembled while streaming (ranges and 304 included)
+
+    Raises:
+        SplitPartsMissing: a part file was deleted (e.g. by the cleanup)
+    """
+    manifest.close()
+    segments, length = split_archive_layout(manifest)
+    part_ids = [data for _, _, data in segments if not isinstance(data, bytes)]
+    found = len(await bucket.find({"_id": {"$in": part_ids}}).to_list(None))
+    if found != len(part_ids):
+        raise SplitPartsMissing(f"{len(part_ids) - found} split part(s) of {manifest._id} no longer exist")
+
+    return ranged_response(
+        request_headers, length, make_etag(manifest), manifest.filename, "application/zip",
+        lambda start, end: iter_archive_range(bucket, segments, start, end)
+    )
@@ -3,7 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import asyncio
-from database import init_db
+from database import init_db, get_database, close_db
 from auth import auth_backend, fastapi_users
 from schemas import UserCreate, UserRead, UserUpdate
 import traceback
@@ -23,6 +23,12 @@ from routes.admin import router as admin_router
 
 # Import cleanup service
 from cleanup_service import start_cleanup_scheduler
+from worker_pool import start_worker_pool, stop_worker_pool
+from command_scheduler import start_command_scheduler, stop_command_scheduler
+from command_queue import ensure_indexes, migrate_legacy_commands
+from command_events import start_command_events, stop_command_events
+from result_cache import ensure_cache_indexes
+from upload_limit import RequestSizeLimitMiddleware
 from config import settings
 
 
@@ -32,6 +38,13 @@ async def lifespan(app: FastAPI):
     # Startup
     await init_db()
     
+    # Prepare the durable command queue (indexes, commands from older versions)
+    await ensure_indexes(get_database())
+    await ensure_cache_indexes(get_database())
+    migrated = await migrate_legacy_commands(get_database())
+    if migrated:
+        print(f"📥 Requeued {migrated} unfinished commands from before the durable queue")
+    
     # Start cleanup scheduler in the background (if enabled)
     if getattr(settings, 'enable_cleanup_scheduler', True):
         cleanup_task = start_cleanup_scheduler()
@@ -39,8 +52,27 @@ async def lifespan(app: FastAPI):
     else:
         print("🚫 Cleanup scheduler disabled")
     
+    # Start the command execution backend (if this node executes commands)
+    if not settings.run_commands_in_api:
+        print("🚫 Command execution disabled (RUN_COMMANDS_IN_API=false), commands run on standalone command_worker.py workers")
+    elif start_worker_pool():
+        print(f"⚙️ Command execution backend '{settings.command_execution_backend}' started with {settings.worker_pool_size} workers")
+    else:
+        print("⚙️ Command execution backend 'subprocess': each command runs in its own me_shell.py process")
+    
+    # Start command scheduler (bounded, prioritised command execution)
+    start_command_scheduler()
+    
+    # Watch command transitions for the status event streams
+    start_command_events()
+    
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    stop_command_events()
+    stop_command_scheduler()
+    # Joining the workers blocks: keep the event loop serving other shutdown work
+    await asyncio.to_thread(stop_worker_pool)
+    await close_db()
 
 
 # Configure logging
@@ -81,6 +113,10 @@ async def global_exception_handler(request: Request, exc: Exception):
         }
     )
 
+# Reject oversized request bodies before Starlette spools multipart uploads to disk
+# (added before CORS so that 413 responses still carry the CORS headers)
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=settings.max_request_size_mb * 1024 * 1024)
+
 # Add CORS middleware to allow React app to call API
 app.add_middleware(
     CORSMiddleware,
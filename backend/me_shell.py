@@ -14,6 +14,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from gridfs import GridFS
 from bson import ObjectId
 from tools_commands.tools_commands import COMMAND_REGISTRY
+from tools_commands.progress import progress_reporting
 from config import settings
 
 # Set up logging
@@ -40,7 +41,7 @@ async def main():
     try:
         # Connect to MongoDB
         logger.info(f"Connecting to MongoDB: {settings.mongodb_url}")
-        client = AsyncIOMotorClient(settings.mongodb_url)
+        client = AsyncIOMotorClient(settings.mongodb_url, **settings.mongo_client_options())
         db = client[settings.database_name]
         logger.info(f"Connected to database: {settings.database_name}")
         
@@ -68,7 +69,7 @@ async def main():
         
         # Setup GridFS - use pymongo for GridFS since it needs sync client
         logger.info("Setting up GridFS connection")
-        sync_client = pymongo.MongoClient(settings.mongodb_url)
+        sync_client = pymongo.MongoClient(settings.mongodb_url, **settings.mongo_client_options())
         sync_db = sync_client[settings.database_name]
         fs = GridFS(sync_db, collection="tmp_files")
         logger.info("GridFS connection established")
@@ -77,13 +78,15 @@ async def main():
         logger.info(f"Executing command: {shell_command}")
         logger.info(f"Args: {json.dumps(args, indent=2)}")
         
-        # Since we changed merge_pdfs to be sync, check if handler is async
-        if asyncio.iscoroutinefunction(handler):
-            logger.info("Handler is async - using await")
-            result = await handler(args, db, fs)
-        else:
-            logger.info("Handler is sync - calling directly")
-            result = handler(args, sync_db, fs)
+        # Handlers report progress through the sync client (rate-limited)
+        with progress_reporting(sync_db.commands, command_id, settings.progress_update_interval_seconds):
+            # Since we changed merge_pdfs to be sync, check if handler is async
+            if asyncio.iscoroutinefunction(handler):
+                logger.info("Handler is async - using await")
+                result = await handler(args, db, fs)
+            else:
+                logger.info("Handler is sync - calling directly")
+                result = handler(args, sync_db, fs)
         
         # Update command with success
         logger.info("Updating command status with success result")
@@ -112,7 +115,7 @@ async def main():
         logger.exception("Full exception details:")
         
         try:
-            client = AsyncIOMotorClient(settings.mongodb_url)
+            client = AsyncIOMotorClient(settings.mongodb_url, **settings.mongo_client_options())
             db = client[settings.database_name]
             await db.commands.update_one(
                 {"_id": ObjectId(command_id)},
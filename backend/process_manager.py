@@ -5,17 +5,29 @@ Handles command creation and execution with proper subprocess management
 
 import asyncio
 import subprocess
+import sys
 import json
 from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from config import settings
+from database import get_database
+from worker_pool import get_worker_pool
+from command_events import get_command_events
+from result_cache import cache_key_for, lookup_result, store_result
+from command_queue import (
+    STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, claim_command, durable_queue_position,
+    heartbeat, priority_for, queue_fields, release_fields, schedule_retry
+)
 
 async def create_command(shell_command: str, args: Dict[str, Any]) -> str:
     """
     Create a new command entry in MongoDB
     
+    If the same command already ran on identical input files with the same
+    options, the command is created completed, pointing at the cached output
+    (the scheduler then skips it since it is not claimable).
+    
     Args:
         shell_command: The command name to execute
         args: JSON-serializable arguments for the command
@@ -23,63 +35,165 @@ async def create_command(shell_command: str, args: Dict[str, Any]) -> str:
     Returns:
         str: The created command ID
     """
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    db = client[settings.database_name]
+    db = get_database()
     
     command_doc = {
         "shell_command": shell_command,
         "args": args,
-        "exit_state": -1,  # -1 means "not started"
+        "exit_state": -1,  # -1 means "not finished yet" (queued or running)
         "stdout": None,
         "stderr": None,
         "created_at": datetime.utcnow(),
         "started_at": None,
-        "completed_at": None
+        "completed_at": None,
+        **queue_fields(priority_for(shell_command))
     }
     
+    if settings.result_cache_enabled:
+        try:
+            command_doc["cache_key"] = await cache_key_for(db, shell_command, args)
+            cached_result = await lookup_result(db, command_doc["cache_key"]) if command_doc["cache_key"] else None
+        except Exception as e:
+            print(f"WARNING: result cache lookup failed: {e}")
+            cached_result = None
+        
+        if cached_result is not None:
+            now = datetime.utcnow()
+            command_doc.update({
+                "exit_state": 0,
+                "stdout": json.dumps(cached_result, indent=2),
+                "started_at": now,
+                "completed_at": now,
+                "cache_hit": True,
+                **release_fields(STATUS_DONE)
+            })
+            print(f"Result cache hit for {shell_command}")
+    
     result = await db.commands.insert_one(command_doc)
-    client.close()
     
     return str(result.inserted_id)
 
+async def _stream_lines(stream: asyncio.StreamReader, prefix: str, sink: List[str]):
+    """Forward subprocess output line by line as it is produced"""
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        text = line.decode(errors="replace")
+        sink.append(text)
+        print(f"{prefix} {text.rstrip()}")
+
+def _run_me_shell_blocking(command_id: str) -> Tuple[int, str, str]:
+    """Run me_shell.py with a blocking Popen (used from a thread executor only)"""
+    process = subprocess.Popen(
+        [sys.executable, "me_shell.py", command_id],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        cwd="."  # Ensure we're in the backend directory
+    )
+    stdout, stderr = process.communicate()
+    return process.returncode, stdout, stderr
+
+async def _run_me_shell(command_id: str) -> Tuple[int, str, str]:
+    """
+    Run me_shell.py for a command without blocking the event loop
+    
+    Uses an asyncio subprocess and streams stdout/stderr while the command runs.
+    Event loops without subprocess support (e.g. the selector loop on Windows)
+    fall back to running Popen.communicate() in a thread executor.
+    
+    Returns:
+        Tuple of (exit code, stdout, stderr)
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "me_shell.py", command_id,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=".",  # Ensure we're in the backend directory
+            limit=1024 * 1024  # Allow long result lines
+        )
+    except NotImplementedError:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _run_me_shell_blocking, command_id)
+    
+    stdout_lines: List[str] = []
+    stderr_lines: List[str] = []
+    await asyncio.gather(
+        _stream_lines(process.stdout, f"[{command_id} stdout]", stdout_lines),
+        _stream_lines(process.stderr, f"[{command_id} stderr]", stderr_lines)
+    )
+    exit_state = await process.wait()
+    
+    return exit_state, "".join(stdout_lines), "".join(stderr_lines)
+
+async def _publish_state(db, command_id: str, command_doc: Optional[Dict[str, Any]] = None):
+    """Push the current state of a command to its event subscribers (if any)"""
+    events = get_command_events()
+    if not events.is_watched(command_id):
+        return
+    if command_doc is None:
+        command_doc = await db.commands.find_one({"_id": ObjectId(command_id)})
+    if command_doc is not None:
+        events.publish_doc(command_doc)
+
+async def _heartbeat_loop(db, command_id: str):
+    """Keep the lease on a running command alive until cancelled"""
+    interval = max(1, settings.command_lease_seconds // 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await heartbeat(db, command_id):
+                print(f"WARNING: lost lease on command {command_id}")
+                return
+        except Exception as e:
+            print(f"WARNING: heartbeat failed for command {command_id}: {e}")
+
 async def process_command(command_id: str) -> Dict[str, Any]:
     """
-    Execute a command and wait for completion
+    Claim a queued command, execute it and wait for completion
     This function MUST wait for command completion to ensure stable final state
     
+    The command is claimed atomically from the durable queue first, so a command
+    already running on another node (or already finished) is skipped. While it
+    runs, a heartbeat renews the lease. Infrastructure failures (crashed worker,
+    killed subprocess) are retried with backoff; handler errors are final.
+    
     Args:
         command_id: The ID of the command to execute
         
     Returns:
         Dict containing execution results
     """
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    db = client[settings.database_name]
+    db = get_database()
+    
+    command_doc = await claim_command(db, command_id)
+    if command_doc is None:
+        print(f"Command {command_id} is not claimable (running elsewhere, finished or waiting for retry)")
+        return {
+            "command_id": command_id,
+            "skipped": True
+        }
+    
+    await _publish_state(db, command_id, command_doc)
+    heartbeat_task = asyncio.create_task(_heartbeat_loop(db, command_id))
     
     try:
-        # Mark command as started
-        await db.commands.update_one(
-            {"_id": ObjectId(command_id)},
-            {"$set": {"started_at": datetime.utcnow()}}
-        )
-        
-        # Execute the shell command and wait for completion
-        print(f"Starting subprocess for command: {command_id}")
-        
-        # Start subprocess - this will call our Python shell script
-        process = subprocess.Popen(
-            ["python", "me_shell.py", command_id],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd="."  # Ensure we're in the backend directory
-        )
-        
-        # Wait for completion and capture output
-        stdout, stderr = process.communicate()
+        # Execute the command and wait for completion
+        pool = get_worker_pool()
+        if pool is not None:
+            # Warm worker: handlers already imported, connections already open
+            print(f"Dispatching command to worker pool: {command_id} (attempt {command_doc['attempts']})")
+            outcome = await pool.run(command_id)
+            exit_state = outcome["exit_state"]
+            stdout = outcome["stdout"]
+            stderr = outcome["stderr"]
+        else:
+            print(f"Starting subprocess for command: {command_id} (attempt {command_doc['attempts']})")
+            exit_state, stdout, stderr = await _run_me_shell(command_id)
         
-        # Determine exit state
-        exit_state = process.returncode
+        heartbeat_task.cancel()
         
         # Update the MongoDB command entry with final results
         update_data = {
@@ -97,6 +211,19 @@ async def process_command(command_id: str) -> Dict[str, Any]:
             if stderr.strip():
                 print(f"Process stderr: {stderr}")
             
+            # Exit code 1 is a handler error (bad input, etc.) and is final.
+            # Anything else means the process died (signal, OOM) - retry it.
+            if exit_state != 1 and await schedule_retry(
+                db, command_doc, stderr.strip() or f"Exit code {exit_state}"
+            ):
+                print(f"Command {command_id} requeued for retry")
+                await _publish_state(db, command_id)
+                return {
+                    "command_id": command_id,
+                    "exit_state": -1,
+                    "retrying": True
+                }
+            
             # Update with subprocess error if me_shell.py didn't handle it
             await db.commands.update_one(
                 {"_id": ObjectId(command_id)},
@@ -104,6 +231,7 @@ async def process_command(command_id: str) -> Dict[str, Any]:
                     "$set": {
                         "exit_state": exit_state,
                         "stderr": stderr if stderr.strip() else "Command failed with no error output",
+                        **release_fields(STATUS_FAILED),
                         **update_data
                     }
                 }
@@ -113,12 +241,18 @@ async def process_command(command_id: str) -> Dict[str, Any]:
         if exit_state == 0:
             await db.commands.update_one(
                 {"_id": ObjectId(command_id)},
-                {"$set": update_data}
+                {"$set": {**release_fields(STATUS_DONE), **update_data}}
             )
         
         # Return final command state
         final_command = await db.commands.find_one({"_id": ObjectId(command_id)})
-        client.close()
+        await _publish_state(db, command_id, final_command)
+        
+        if final_command.get("cache_key"):
+            try:
+                await store_result(db, final_command)
+            except Exception as e:
+                print(f"WARNING: failed to cache result of command {command_id}: {e}")
         
         return {
             "command_id": command_id,
@@ -129,21 +263,33 @@ async def process_command(command_id: str) -> Dict[str, Any]:
         }
         
     except Exception as e:
+        heartbeat_task.cancel()
+        
         # Handle any errors in process management
         error_msg = f"Process management error: {str(e)}"
         print(f"ERROR: {error_msg}")
         
+        if await schedule_retry(db, command_doc, error_msg):
+            print(f"Command {command_id} requeued for retry")
+            await _publish_state(db, command_id)
+            return {
+                "command_id": command_id,
+                "exit_state": -1,
+                "retrying": True
+            }
+        
         await db.commands.update_one(
             {"_id": ObjectId(command_id)},
             {
                 "$set": {
                     "exit_state": 2,  # 2 = process management error
                     "stderr": error_msg,
-                    "completed_at": datetime.utcnow()
+                    "completed_at": datetime.utcnow(),
+                    **release_fields(STATUS_FAILED)
                 }
             }
         )
-        client.close()
+        await _publish_state(db, command_id)
         
         return {
             "command_id": command_id,
@@ -163,12 +309,10 @@ async def get_command_status(command_id: str) -> Dict[str, Any]:
     Returns:
         Dict containing command status and results
     """
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    db = client[settings.database_name]
+    db = get_database()
     
     try:
         command_doc = await db.commands.find_one({"_id": ObjectId(command_id)})
-        client.close()
         
         if not command_doc:
             return {
@@ -176,6 +320,14 @@ async def get_command_status(command_id: str) -> Dict[str, Any]:
                 "command_id": command_id
             }
         
+        # Position in the local scheduler queue, or in the durable queue
+        # when the command waits for another node / standalone worker
+        from command_scheduler import get_command_scheduler
+        scheduler = get_command_scheduler()
+        queue_position = scheduler.get_queue_position(command_id) if scheduler else None
+        if queue_position is None and command_doc.get("status") == STATUS_QUEUED:
+            queue_position = await durable_queue_position(db, command_doc)
+        
         return {
             "command_id": command_id,
             "shell_command": command_doc.get("shell_command"),
@@ -183,13 +335,16 @@ async def get_command_status(command_id: str) -> Dict[str, Any]:
             "exit_state": command_doc.get("exit_state"),
             "stdout": command_doc.get("stdout"),
             "stderr": command_doc.get("stderr"),
+            "status": command_doc.get("status"),
+            "queue_position": queue_position,
+            "attempts": command_doc.get("attempts"),
+            "progress": command_doc.get("progress"),
             "created_at": command_doc.get("created_at"),
             "started_at": command_doc.get("started_at"),
             "completed_at": command_doc.get("completed_at")
         }
         
     except Exception as e:
-        client.close()
         return {
             "error": f"Failed to get command status: {str(e)}",
             "command_id": command_id
@@ -0,0 +1,160 @@
+"""
+Content-addressed command result cache
+Successful results are stored in the 'command_cache' collection, keyed by
+(command type, ordered SHA-256 of the input files, options, user). Re-running
+the same command on the same files returns the cached output GridFS file
+instead of running the handler again. Entries are per user: the output and
+the stored result (original filenames, file IDs) are never handed to another
+user. Eviction (TTL and size) is done by
+TmpFilesCleanupService.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from bson import ObjectId
+from pymongo import ASCENDING
+
+# Set up logging
+logger = logging.getLogger('result_cache')
+
+# Command args that identify inputs or the requester, not the operation itself
+# (the user is part of the key on its own, see make_cache_key)
+NON_OPTION_ARGS = {"file_id", "file_ids", "user_id", "user_email"}
+
+
+def input_file_ids(args: Dict[str, Any]) -> List[str]:
+    """Input file IDs of a command, in order"""
+    if args.get("file_ids"):
+        return list(args["file_ids"])
+    if args.get("file_id"):
+        return [args["file_id"]]
+    return []
+
+
+def output_file_ids(result: Dict[str, Any]) -> List[str]:
+    """GridFS files produced by a handler ('*_file_id' and '*_file_ids' result fields)"""
+    file_ids = []
+    for key, value in result.items():
+        if key.endswith("_file_id") and isinstance(value, str):
+            file_ids.append(value)
+        elif key.endswith("_file_ids") and isinstance(value, list):
+            file_ids.extend(value)
+    return file_ids
+
+
+def make_cache_key(shell_command: str, input_hashes: List[str], options: Dict[str, Any],
+                   user_id: Optional[str]) -> str:
+    payload = json.dumps(
+        {"command": shell_command, "inputs": input_hashes, "options": options, "user": user_id},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def ensure_cache_indexes(db):
+    await db.command_cache.create_index([("last_used_at", ASCENDING)])
+
+
+async def cache_key_for(db, shell_command: str, args: Dict[str, Any]) -> Optional[str]:
+    """
+    Cache key of a command, or None if it cannot be cached
+    (no inputs, or an input uploaded without a content hash)
+    """
+    file_ids = input_file_ids(args)
+    if not file_ids:
+        return None
+
+    object_ids = [ObjectId(file_id) for file_id in file_ids]
+    cursor = db["tmp_files.files"].find({"_id": {"$in": object_ids}}, {"metadata.sha256": 1})
+    hashes = {}
+    async for file_doc in cursor:
+        hashes[file_doc["_id"]] = (file_doc.get("metadata") or {}).get("sha256")
+
+    input_hashes = [hashes.get(object_id) for object_id in object_ids]
+    if not all(input_hashes):
+        return None
+
+    options = {key: value for key, value in args.items() if key not in NON_OPTION_ARGS}
+    return make_cache_key(shell_command, input_hashes, options, args.get("user_id"))
+
+
+async def lookup_result(db, cache_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Cached result for a key, or None on a miss
+
+    Entries whose output files are gone are dropped.
+    """
+    entry = await db.command_cache.find_one({"_id": cache_key})
+    if entry is None:
+        return None
+
+    outputs = [ObjectId(file_id) for file_id in entry["output_file_ids"]]
+    if await db["tmp_files.files"].count_documents({"_id": {"$in": outputs}}) != len(outputs):
+        logger.warning(f"Cached output files missing for {cache_key[:12]}, dropping cache entry")
+        await db.command_cache.delete_one({"_id": cache_key})
+        return None
+
+    await db.command_cache.update_one(
+        {"_id": cache_key},
+        {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"hits": 1}}
+    )
+    return entry["result"]
+
+
+async def store_result(db, command_doc: Dict[str, Any]) -> bool:
+    """
+    Cache the result of a successful command that has a cache_key
+
+    The output files are marked 'cached' so the time-based tmp_files cleanup
+    leaves them to cache eviction.
+
+    Returns:
+        True if a new cache entry was created
+    """
+    cache_key = command_doc.get("cache_key")
+    if not cache_key or command_doc.get("exit_state") != 0 or not command_doc.get("stdout"):
+        return False
+
+    result = json.loads(command_doc["stdout"])
+    outputs = output_file_ids(result)
+    if not outputs:
+        return False
+
+    object_ids = [ObjectId(file_id) for file_id in outputs]
+    size_bytes = 0
+    found = 0
+    async for file_doc in db["tmp_files.files"].find({"_id": {"$in": object_ids}}, {"length": 1}):
+        size_bytes += file_doc.get("length", 0)
+        found += 1
+    if found != len(object_ids):
+        return False
+
+    now = datetime.utcnow()
+    update = await db.command_cache.update_one(
+        {"_id": cache_key},
+        {"$setOnInsert": {
+            "shell_command": command_doc.get("shell_command"),
+            "result": result,
+            "output_file_ids": outputs,
+            "size_bytes": size_bytes,
+            "source_command_id": str(command_doc["_id"]),
+            "created_at": now,
+            "last_used_at": now,
+            "hits": 0
+        }},
+        upsert=True
+    )
+    if update.upserted_id is None:
+        # Same inputs finished concurrently; this output stays a regular tmp file
+        return False
+
+    await db["tmp_files.files"].update_many(
+        {"_id": {"$in": object_ids}},
+        {"$set": {"metadata.cached": True, "metadata.cache_key": cache_key}}
+    )
+    logger.info(f"Cached {command_doc.get('shell_command')} result {cache_key[:12]} ({size_bytes} bytes)")
+    return True
@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from models import User
 from auth import current_active_user
 from cleanup_service import TmpFilesCleanupService
+from config import settings
 from typing import Optional
 
 router = APIRouter()
@@ -15,7 +16,7 @@ router = APIRouter()
 # Request models
 class CleanupRequest(BaseModel):
     max_age_hours: Optional[int] = 24
-    cleanup_type: Optional[str] = "full"  # "time_based", "command_based", or "full"
+    cleanup_type: Optional[str] = "full"  # "time_based", "command_based", "result_cache", or "full"
 
 # Response models are handled by the cleanup service directly
 
@@ -71,6 +72,13 @@ async def manual_cleanup(
             result = await cleanup_service.cleanup_by_command_status()
             result["cleanup_type"] = "command_based"
             
+        elif request.cleanup_type == "result_cache":
+            result = await cleanup_service.cleanup_result_cache(
+                ttl_hours=settings.result_cache_ttl_hours,
+                max_size_mb=settings.result_cache_max_mb
+            )
+            result["cleanup_type"] = "result_cache"
+            
         else:  # "full" or any other value
             result = await cleanup_service.full_cleanup(request.max_age_hours)
             result["cleanup_type"] = "full"
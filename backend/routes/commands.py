@@ -1,16 +1,42 @@
 """
 Commands API route
 Provides long-polling endpoint for command status checking
+and a server-sent events stream of command state transitions
 """
 
-from fastapi import APIRouter, HTTPException, Path
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
 from process_manager import get_command_status
+from command_events import get_command_events, event_from_doc, event_key, FINAL_EVENTS
+from config import settings
 
 router = APIRouter()
 
+
+async def _wait_for_command(command_id: str, timeout: int) -> dict:
+    """Current command status, once the command is finished or the timeout expired"""
+    events = get_command_events()
+    
+    # Register before reading the status so the final event cannot be missed
+    final = events.watch_final(command_id)
+    try:
+        result = await get_command_status(command_id)
+        if "error" in result or result.get("exit_state") != -1:
+            return result
+        
+        if await events.wait_final(final, timeout):
+            result = await get_command_status(command_id)
+        return result
+    finally:
+        events.release_final(command_id)
+
+
 @router.get("/command/{command_id}")
 async def get_command_endpoint(
-    command_id: str = Path(..., description="The ID of the command to check")
+    command_id: str = Path(..., description="The ID of the command to check"),
+    wait: int = Query(0, ge=0, description="Seconds to wait for the command to finish before answering (long-poll)")
 ):
     """
     Get command status and results
@@ -19,12 +45,19 @@ async def get_command_endpoint(
     - If exit_state == -1: command is still running
     - If exit_state != -1: command finished (success or error)
     
+    With ?wait=N the request blocks until the command finishes or N seconds
+    pass (capped by COMMAND_STATUS_MAX_WAIT_SECONDS), so clients can re-poll
+    immediately instead of on a timer.
+    
     Returns:
         Command details including execution status and results
     """
     
     try:
-        result = await get_command_status(command_id)
+        if wait > 0:
+            result = await _wait_for_command(command_id, min(wait, settings.command_status_max_wait_seconds))
+        else:
+            result = await get_command_status(command_id)
         
         if "error" in result:
             raise HTTPException(
@@ -44,3 +77,78 @@ async def get_command_endpoint(
             status_code=500,
             detail=f"Failed to get command status: {str(e)}"
         )
+
+
+def _format_sse(event: dict) -> str:
+    """Encode an event in text/event-stream format"""
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def _event_stream(command_id: str, queue: asyncio.Queue, first_event: dict):
+    """Yield the current state, then every transition until the command finishes"""
+    try:
+        yield _format_sse(first_event)
+        if first_event["event"] in FINAL_EVENTS:
+            return
+        
+        last_key = event_key(first_event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.command_events_keepalive_seconds)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            
+            if event_key(event) == last_key:
+                continue
+            last_key = event_key(event)
+            
+            yield _format_sse(event)
+            if event["event"] in FINAL_EVENTS:
+                return
+    finally:
+        get_command_events().unsubscribe(command_id, queue)
+
+
+@router.get("/command/{command_id}/events")
+async def command_events_endpoint(
+    command_id: str = Path(..., description="The ID of the command to follow")
+):
+    """
+    Stream command state transitions as server-sent events
+    
+    Events: queued, started, progress, done, failed. The first event is the
+    current state; the stream ends after done or failed. Replaces polling
+    GET /command/{command_id} (waiting clients cost no database queries).
+    
+    Returns:
+        text/event-stream response, each event's data is a JSON object
+    """
+    events = get_command_events()
+    
+    # Subscribe before reading the current state so no transition is missed
+    queue = events.subscribe(command_id)
+    try:
+        result = await get_command_status(command_id)
+        
+        if "error" in result:
+            raise HTTPException(
+                status_code=404,
+                detail=result["error"]
+            )
+    except Exception:
+        events.unsubscribe(command_id, queue)
+        raise
+    
+    first_event = event_from_doc({"_id": command_id, **result})
+    first_event["queue_position"] = result.get("queue_position")
+    
+    return StreamingResponse(
+        _event_stream(command_id, queue, first_event),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering (nginx)
+        }
+    )
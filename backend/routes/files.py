@@ -3,16 +3,17 @@ File download routes for processed files
 Handles downloading of temporary/processed files without requiring user authentication
 """
 
-from fastapi import APIRouter, HTTPException, Path
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Path, Request
 from file_service import FileService
-import io
+from gridfs_http import SplitPartsMissing, gridfs_download_response, split_archive_response
+from gridfs.errors import NoFile
 from bson import ObjectId
 
 router = APIRouter()
 
 @router.get("/processed-files/{file_id}")
 async def download_processed_file(
+    request: Request,
     file_id: str = Path(..., description="The GridFS file ID to download")
 ):
     """
@@ -22,11 +23,15 @@ async def download_processed_file(
     commands (like merged PDFs). It doesn't require user authentication since
     the file_id itself serves as the access token.
     
+    Supports Range requests (resumed downloads, PDF viewers), ETag and
+    If-None-Match (304 Not Modified). Split manifests are downloaded as the
+    ZIP of their part files, assembled while streaming.
+    
     Args:
         file_id: The GridFS ObjectId of the file to download
         
     Returns:
-        StreamingResponse with the file content
+        StreamingResponse with the file content (or byte range), read from GridFS chunk by chunk
     """
     
     try:
@@ -45,43 +50,32 @@ async def download_processed_file(
         # Get the tmp_files bucket
         bucket = await file_service._get_tmp_bucket()
         
-        # Download the file content using the same pattern as FileService
-        content_stream = io.BytesIO()
-        await bucket.download_to_stream(ObjectId(file_id), content_stream)
-        file_bytes = content_stream.getvalue()
-        
-        # Get file metadata
-        cursor = bucket.find({"_id": ObjectId(file_id)})
-        file_doc = await cursor.next()
+        # Opening the stream loads the file document: no separate metadata find
+        grid_out = await bucket.open_download_stream(ObjectId(file_id))
         
-        if not file_doc:
-            raise HTTPException(
-                status_code=404,
-                detail=f"File not found: {file_id}"
-            )
+        if (grid_out.metadata or {}).get("split_manifest"):
+            return await split_archive_response(bucket, grid_out, request.headers)
         
         # Extract filename and content type
-        filename = file_doc.filename or f"processed_file_{file_id}.pdf"
-        content_type = file_doc.metadata.get("content_type", "application/pdf")
+        filename = grid_out.filename or f"processed_file_{file_id}.pdf"
+        content_type = (grid_out.metadata or {}).get("content_type", "application/pdf")
         
-        # Create streaming response
-        return StreamingResponse(
-            io.BytesIO(file_bytes),
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
-        )
+        # Stream chunk by chunk straight from GridFS (full file, range or 304)
+        return gridfs_download_response(grid_out, request.headers, filename, content_type)
         
     except HTTPException:
         # Re-raise HTTP exceptions (400, 404, etc.)
         raise
-    except StopAsyncIteration:
-        # No file found in cursor
+    except NoFile:
         raise HTTPException(
             status_code=404,
             detail=f"File not found: {file_id}"
         )
+    except SplitPartsMissing as e:
+        raise HTTPException(
+            status_code=410,
+            detail=str(e)
+        )
     except Exception as e:
         # Handle any other unexpected errors
         raise HTTPException(
@@ -3,14 +3,14 @@ MergePdfs API route
 Handles PDF file upload and merge command creation
 """
 
-import asyncio
 import logging
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from typing import List
 from models import User
 from auth import current_active_user
 from file_service import FileService
-from process_manager import create_command, process_command
+from process_manager import create_command
+from command_scheduler import require_command_scheduler, SchedulerFullError
 
 # Set up logger for this module
 logger = logging.getLogger(__name__)
@@ -29,7 +29,7 @@ async def merge_pdfs_endpoint(
     1. Validate uploaded files are PDFs
     2. Store files in GridFS tmp_files bucket
     3. Create merge command with file IDs
-    4. Start command processing asynchronously
+    4. Queue the command on the scheduler
     5. Return command ID for polling
     """
     
@@ -52,47 +52,51 @@ async def merge_pdfs_endpoint(
                 detail=f"File '{file.filename}' is not a PDF. Only PDF files are allowed."
             )
     
+    # Admission control: reject before uploading anything when the queue is full.
+    # The queue slot stays reserved until the command is submitted.
+    try:
+        scheduler = require_command_scheduler()
+        await scheduler.admit(str(user.id))
+    except SchedulerFullError as e:
+        logger.warning(f"⏳ Command rejected by scheduler: {str(e)}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    submitted = False
     try:
         logger.info("🔧 Creating FileService instance...")
         file_service = FileService()
-        uploaded_file_ids = []
         
-        # Upload each file to GridFS tmp_files bucket
+        # Reject empty files before anything is uploaded
         for i, file in enumerate(files):
-            logger.info(f"📤 Uploading file {i+1}: {file.filename}")
-            
-            # Read file content
-            content = await file.read()
-            logger.info(f"📊 File size: {len(content)} bytes")
-            
-            if len(content) == 0:
+            logger.info(f"📊 File {i+1}: {file.filename} ({file.size} bytes)")
+            if file.size == 0:
                 logger.error(f"❌ Empty file: {file.filename}")
                 raise HTTPException(
                     status_code=400,
                     detail=f"File '{file.filename}' is empty"
                 )
-            
-            # Upload to tmp_files bucket (different from user files)
-            logger.info(f"🗃️ Calling upload_temp_file for {file.filename}")
-            result = await file_service.upload_temp_file(
-                file_content=content,
-                filename=file.filename,
-                content_type=file.content_type,
-                user_email=user.email,
-                user_id=str(user.id)
+        
+        # Upload all files to GridFS tmp_files bucket concurrently (all or nothing)
+        logger.info(f"📤 Uploading {len(files)} files to tmp_files")
+        result = await file_service.upload_temp_files(
+            files,
+            user_email=user.email,
+            user_id=str(user.id)
+        )
+        
+        if not result.get("success"):
+            logger.error(f"❌ Upload failed, rolled back {result.get('rolled_back')} files: {result}")
+            raise HTTPException(
+                status_code=result.get("status_code", 500),
+                detail=f"Failed to upload file '{result.get('filename')}': {result.get('error')}"
             )
-            
-            logger.info(f"📋 Upload result: {result}")
-            
-            if not result.get("success"):
-                logger.error(f"❌ Upload failed: {result}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to upload file '{file.filename}': {result.get('error')}"
-                )
-            
-            uploaded_file_ids.append(result["file_id"])
-            logger.info(f"✅ File uploaded with ID: {result['file_id']}")
+        
+        uploaded_file_ids = result["file_ids"]
+        logger.info(f"✅ Files uploaded with IDs: {uploaded_file_ids}")
         
         # Create merge command
         logger.info(f"🚀 Creating merge command with file IDs: {uploaded_file_ids}")
@@ -108,8 +112,9 @@ async def merge_pdfs_endpoint(
         logger.info(f"✅ Command created with ID: {command_id}")
         
         # Start command processing asynchronously
-        logger.info("🔄 Starting async command processing...")
-        asyncio.create_task(process_command(command_id))
+        logger.info("🔄 Queueing command for processing...")
+        scheduler.submit(command_id, "MergePdfs", str(user.id), reserved=True)
+        submitted = True
         
         logger.info("🎉 PDF merge request completed successfully")
         return {
@@ -131,3 +136,7 @@ async def merge_pdfs_endpoint(
             status_code=500,
             detail=f"Failed to process PDF merge request: {str(e)}"
         )
+    finally:
+        if not submitted:
+            # Upload or command creation failed: give the queue slot back
+            scheduler.release(str(user.id))
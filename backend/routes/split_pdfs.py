@@ -3,13 +3,15 @@ SplitPdfs API route
 Handles PDF file upload and split command creation
 """
 
-import asyncio
 import logging
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from models import User
 from auth import current_active_user
 from file_service import FileService
-from process_manager import create_command, process_command
+from process_manager import create_command
+from command_scheduler import require_command_scheduler, SchedulerFullError
+from tools_commands.SplitPdfs import split_args
 
 # Set up logger for this module
 logger = logging.getLogger(__name__)
@@ -19,16 +21,27 @@ router = APIRouter()
 @router.post("/splitPdf")
 async def split_pdf_endpoint(
     file: UploadFile = File(...),
+    mode: str = Form("pages"),
+    ranges: Optional[str] = Form(None),
+    chunk_size: Optional[int] = Form(None),
     user: User = Depends(current_active_user)
 ):
     """
     Upload a PDF file and create a split command
     
+    Form fields (optional):
+    - mode: "pages" (one PDF per page, default), "ranges" (one PDF per range),
+      "chunks" (PDFs of chunk_size pages) or "bookmarks" (one PDF per
+      top-level bookmark)
+    - ranges: 1-based page ranges such as "1-3,10-20,25" or "40-"; in pages and
+      chunks mode they select the pages to split
+    - chunk_size: pages per PDF in chunks mode
+    
     Steps:
-    1. Validate uploaded file is a PDF
+    1. Validate uploaded file is a PDF and the split options
     2. Store file in GridFS tmp_files bucket
     3. Create split command with file ID
-    4. Start command processing asynchronously
+    4. Queue the command on the scheduler
     5. Return command ID for polling
     """
     
@@ -43,16 +56,35 @@ async def split_pdf_endpoint(
             detail=f"File '{file.filename}' is not a PDF. Only PDF files are allowed."
         )
     
+    # Validate split options before anything is uploaded
+    try:
+        options = split_args(mode, ranges, chunk_size)
+    except ValueError as e:
+        logger.error(f"❌ Invalid split options: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Admission control: reject before uploading anything when the queue is full.
+    # The queue slot stays reserved until the command is submitted.
+    try:
+        scheduler = require_command_scheduler()
+        await scheduler.admit(str(user.id))
+    except SchedulerFullError as e:
+        logger.warning(f"⏳ Command rejected by scheduler: {str(e)}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    submitted = False
     try:
         logger.info("🔧 Creating FileService instance...")
         file_service = FileService()
         
-        # Read file content
-        logger.info(f"📖 Reading file content...")
-        content = await file.read()
-        logger.info(f"📊 File size: {len(content)} bytes")
+        # Size is known up front: Starlette has already spooled the upload
+        logger.info(f"📊 File size: {file.size} bytes")
         
-        if len(content) == 0:
+        if file.size == 0:
             logger.error(f"❌ Empty file: {file.filename}")
             raise HTTPException(
                 status_code=400,
@@ -62,7 +94,7 @@ async def split_pdf_endpoint(
         # Upload to tmp_files bucket
         logger.info(f"🗃️ Calling upload_temp_file for {file.filename}")
         result = await file_service.upload_temp_file(
-            file_content=content,
+            source=file,  # Streamed into GridFS chunk by chunk
             filename=file.filename,
             content_type=file.content_type,
             user_email=user.email,
@@ -74,7 +106,7 @@ async def split_pdf_endpoint(
         if not result.get("success"):
             logger.error(f"❌ Upload failed: {result}")
             raise HTTPException(
-                status_code=500,
+                status_code=result.get("status_code", 500),
                 detail=f"Failed to upload file '{file.filename}': {result.get('error')}"
             )
         
@@ -82,17 +114,23 @@ async def split_pdf_endpoint(
         logger.info(f"✅ File uploaded with ID: {file_id}")
         
         # Create split command
-        logger.info(f"🚀 Creating split command with file ID: {file_id}")
+        logger.info(f"🚀 Creating split command with file ID: {file_id} ({mode})")
         command_id = await create_command(
             shell_command="SplitPdfs",
-            args={"file_id": file_id}
+            args={
+                "file_id": file_id,
+                **options,  # Part of the result cache key
+                "user_id": str(user.id),
+                "user_email": user.email
+            }
         )
         
         logger.info(f"📝 Command created with ID: {command_id}")
         
         # Start command processing in background
-        logger.info("⚡ Starting command processing in background...")
-        asyncio.create_task(process_command(command_id))
+        logger.info("⚡ Queueing command for background processing...")
+        scheduler.submit(command_id, "SplitPdfs", str(user.id), reserved=True)
+        submitted = True
         
         # Return command ID for client polling
         logger.info(f"✅ Split command initiated successfully: {command_id}")
@@ -113,3 +151,7 @@ async def split_pdf_endpoint(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
+    finally:
+        if not submitted:
+            # Upload or command creation failed: give the queue slot back
+            scheduler.release(str(user.id))
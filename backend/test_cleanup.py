@@ -12,10 +12,12 @@ import os
 sys.path.insert(0, os.path.dirname(__file__))
 
 from cleanup_service import TmpFilesCleanupService
+from database import init_db
 
 async def main():
     """Test cleanup functionality"""
     
+    await init_db()
     cleanup_service = TmpFilesCleanupService()
     
     print("🔍 Getting cleanup statistics...")
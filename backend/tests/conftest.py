@@ -3,6 +3,7 @@ Shared pytest configuration and fixtures for API tests
 """
 import pytest
 import requests
+from bson import ObjectId
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -36,3 +37,72 @@ def test_user_credentials():
         "first_name": "Test",
         "last_name": "User"
     }
+
+
+class FakeGridOut:
+    """A GridFS file being read, handed out in chunk_size pieces"""
+
+    def __init__(self, filename, content, chunk_size):
+        self.filename = filename
+        self.length = len(content)
+        self._chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+    def readchunk(self):
+        return self._chunks.pop(0) if self._chunks else b""
+
+
+class FakeGridIn:
+    """A GridFS file being written: keeps every write and how it ended"""
+
+    def __init__(self, **kwargs):
+        self._id = ObjectId()
+        self.kwargs = kwargs
+        self.filename = kwargs.get("filename")
+        self.metadata = kwargs.get("metadata")
+        self.writes = []
+        self.state = "open"
+
+    @property
+    def content(self):
+        return b"".join(self.writes)
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    def close(self):
+        self.state = "closed"
+
+    def abort(self):
+        self.state = "aborted"
+
+
+class FakeFS:
+    """Stands in for the sync GridFS handle the command handlers get"""
+
+    def __init__(self, chunk_size=4096):
+        self.chunk_size = chunk_size
+        self.documents = {}
+        self.files = []
+
+    def put(self, content, filename="doc.pdf"):
+        """Store an input file, returning its ID as the handlers receive it"""
+        file_id = str(ObjectId())
+        self.documents[file_id] = (filename, content)
+        return file_id
+
+    def get(self, file_id):
+        filename, content = self.documents[str(file_id)]
+        return FakeGridOut(filename, content, self.chunk_size)
+
+    def new_file(self, **kwargs):
+        self.files.append(FakeGridIn(**kwargs))
+        return self.files[-1]
+
+    def delete(self, file_id):
+        self.files = [grid_in for grid_in in self.files if str(grid_in._id) != str(file_id)]
+
+
+@pytest.fixture
+def fake_fs():
+    """An empty FakeFS: put() the inputs, inspect .files for the outputs"""
+    return FakeFS()
@@ -0,0 +1,89 @@
+"""
+Pytest tests for the command event bus
+Covers event mapping, fan-out, de-duplication and unsubscribe (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from bson import ObjectId
+from command_events import CommandEventBus, event_from_doc
+
+
+def _doc(command_id, status, exit_state, attempts=1):
+    return {"_id": ObjectId(command_id), "status": status, "exit_state": exit_state,
+            "attempts": attempts, "stdout": "{}", "stderr": None}
+
+
+def test_event_from_doc():
+    """Queue status maps to the event type; final events carry the output"""
+    command_id = str(ObjectId())
+    assert event_from_doc(_doc(command_id, "queued", -1))["event"] == "queued"
+    assert event_from_doc(_doc(command_id, "running", -1))["event"] == "started"
+
+    running = _doc(command_id, "running", -1)
+    running["progress"] = {"stage": "reading", "items_done": 1, "items_total": 2}
+    progress = event_from_doc(running)
+    assert progress["event"] == "progress"
+    assert progress["progress"]["items_done"] == 1
+
+    done = event_from_doc(_doc(command_id, "done", 0))
+    assert done["event"] == "done"
+    assert done["stdout"] == "{}"
+
+    # Legacy documents without a status fall back to exit_state
+    assert event_from_doc({"_id": command_id, "exit_state": 1})["event"] == "failed"
+
+
+def test_fan_out_and_dedup():
+    """Every subscriber gets each transition once, repeated states are dropped"""
+    async def scenario():
+        bus = CommandEventBus()
+        command_id = str(ObjectId())
+        first = bus.subscribe(command_id)
+        second = bus.subscribe(command_id)
+
+        bus.publish_doc(_doc(command_id, "running", -1))
+        bus.publish_doc(_doc(command_id, "running", -1))  # Seen again by the watcher
+        bus.publish_doc(_doc(command_id, "running", -1, attempts=2))  # Retried
+        bus.publish_doc(_doc(command_id, "done", 0, attempts=2))
+
+        for queue in (first, second):
+            events = [queue.get_nowait()["event"] for _ in range(queue.qsize())]
+            assert events == ["started", "started", "done"]
+
+        # Events for unwatched commands are not buffered
+        bus.publish_doc(_doc(str(ObjectId()), "done", 0))
+        assert bus.watched_ids() == {command_id}
+
+        bus.unsubscribe(command_id, first)
+        bus.unsubscribe(command_id, second)
+        assert bus.watched_ids() == set()
+
+    asyncio.run(scenario())
+
+
+def test_long_poll_waiters_share_one_future():
+    """Waiters on a command share a future resolved by its final event only"""
+    async def scenario():
+        bus = CommandEventBus()
+        command_id = str(ObjectId())
+        first = bus.watch_final(command_id)
+        second = bus.watch_final(command_id)
+        assert first is second
+        assert bus.is_watched(command_id)
+
+        bus.publish_doc(_doc(command_id, "running", -1))
+        assert not await bus.wait_final(first, timeout=0.01)
+
+        bus.publish_doc(_doc(command_id, "failed", 1))
+        assert await bus.wait_final(first, timeout=0.01)
+        assert first.result()["event"] == "failed"
+
+        bus.release_final(command_id)
+        assert bus.is_watched(command_id)
+        bus.release_final(command_id)
+        assert not bus.is_watched(command_id)
+
+    asyncio.run(scenario())
@@ -0,0 +1,197 @@
+"""
+Pytest tests for the durable command queue
+Covers claiming, lease expiry with and without attempts left, retry backoff
+and lease ownership (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import operator
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from bson import ObjectId
+from config import settings
+from command_queue import (
+    STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, claim_command, fail_lost_commands, schedule_retry
+)
+
+OPERATORS = {"$lt": operator.lt, "$lte": operator.le, "$gte": operator.ge}
+
+
+def _value(doc, expression):
+    """Value of an aggregation expression ('$field', {'$ifNull': [...]} or a constant)"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return doc.get(expression[1:])
+    if isinstance(expression, dict) and "$ifNull" in expression:
+        value, default = expression["$ifNull"]
+        value = _value(doc, value)
+        return _value(doc, default) if value is None else value
+    return expression
+
+
+def _matches(doc, query):
+    """Evaluate the subset of MongoDB queries the command queue uses"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, branch) for branch in condition):
+                return False
+        elif key == "$expr":
+            (name, (left, right)), = condition.items()
+            if not OPERATORS[name](_value(doc, left), _value(doc, right)):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(key)
+            if value is None or not all(OPERATORS[name](value, arg) for name, arg in condition.items()):
+                return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class RecordingCommands:
+    """Stands in for db.commands: keeps the documents and every filter and update it was given"""
+
+    def __init__(self, *docs):
+        self.docs = list(docs)
+        self.calls = []
+
+    def _apply(self, doc, update):
+        doc.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        self.calls.append(("find_one_and_update", query, update))
+        for doc in self.docs:
+            if _matches(doc, query):
+                self._apply(doc, update)
+                return dict(doc)
+        return None
+
+    async def update_one(self, query, update):
+        self.calls.append(("update_one", query, update))
+        matched = [doc for doc in self.docs if _matches(doc, query)][:1]
+        for doc in matched:
+            self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    async def update_many(self, query, update):
+        self.calls.append(("update_many", query, update))
+        matched = [doc for doc in self.docs if _matches(doc, query)]
+        for doc in matched:
+            self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+
+def _command(**fields):
+    doc = {
+        "_id": ObjectId(),
+        "status": STATUS_QUEUED,
+        "exit_state": -1,
+        "attempts": 0,
+        "max_attempts": 3,
+        "available_at": datetime.utcnow() - timedelta(seconds=1),
+        "lease_owner": None,
+        "lease_expires_at": None
+    }
+    doc.update(fields)
+    return doc
+
+
+def _expired_lease(attempts, **fields):
+    return _command(status=STATUS_RUNNING, attempts=attempts, lease_owner="crashed:1",
+                    lease_expires_at=datetime.utcnow() - timedelta(seconds=5), **fields)
+
+
+def test_queued_command_is_claimed():
+    command = _command()
+    waiting = _command(available_at=datetime.utcnow() + timedelta(minutes=1))
+    db = SimpleNamespace(commands=RecordingCommands(command, waiting))
+
+    claimed = asyncio.run(claim_command(db, str(command["_id"]), worker_id="me:1"))
+    assert claimed["status"] == STATUS_RUNNING
+    assert claimed["lease_owner"] == "me:1"
+    assert claimed["attempts"] == 1
+    assert claimed["lease_expires_at"] > datetime.utcnow()
+
+    # Already running under a live lease, or waiting for its retry: not claimable
+    assert asyncio.run(claim_command(db, str(command["_id"]), worker_id="other:1")) is None
+    assert asyncio.run(claim_command(db, str(waiting["_id"]), worker_id="me:1")) is None
+
+
+def test_expired_lease_with_attempts_left_is_reclaimed():
+    command = _expired_lease(attempts=1)
+    db = SimpleNamespace(commands=RecordingCommands(command))
+
+    claimed = asyncio.run(claim_command(db, str(command["_id"]), worker_id="me:1"))
+    assert claimed["lease_owner"] == "me:1"
+    assert claimed["attempts"] == 2
+
+
+def test_expired_lease_without_attempts_left_is_failed(monkeypatch):
+    monkeypatch.setattr(settings, "command_max_attempts", 2)
+    exhausted = _expired_lease(attempts=3)
+    # Documents without max_attempts fall back to COMMAND_MAX_ATTEMPTS
+    legacy = _expired_lease(attempts=2)
+    del legacy["max_attempts"]
+    alive = _command(status=STATUS_RUNNING, attempts=3, lease_owner="alive:1",
+                     lease_expires_at=datetime.utcnow() + timedelta(minutes=1))
+    commands = RecordingCommands(exhausted, legacy, alive)
+    db = SimpleNamespace(commands=commands)
+
+    for command, attempts in ((exhausted, 3), (legacy, 2)):
+        assert asyncio.run(claim_command(db, str(command["_id"]), worker_id="me:1")) is None
+        assert command["attempts"] == attempts
+
+    assert asyncio.run(fail_lost_commands(db)) == 2
+    for command in (exhausted, legacy):
+        assert command["status"] == STATUS_FAILED
+        assert command["exit_state"] == 2
+        assert command["lease_owner"] is None
+        assert "lease lost" in command["last_error"]
+    # A command still holding its lease is left alone
+    assert alive["status"] == STATUS_RUNNING
+
+    _, query, _ = commands.calls[-1]
+    assert query["status"] == STATUS_RUNNING
+    assert "$gte" in query["$expr"]
+
+
+@pytest.mark.parametrize("attempts, delay", [(1, 10), (2, 20), (3, 40)])
+def test_retry_backoff_doubles(monkeypatch, attempts, delay):
+    monkeypatch.setattr(settings, "command_retry_backoff_seconds", 10)
+    command = _command(status=STATUS_RUNNING, attempts=attempts, max_attempts=5, lease_owner="me:1",
+                       lease_expires_at=datetime.utcnow() + timedelta(minutes=1))
+    db = SimpleNamespace(commands=RecordingCommands(command))
+
+    before = datetime.utcnow()
+    assert asyncio.run(schedule_retry(db, dict(command), "worker crashed", worker_id="me:1"))
+    assert command["status"] == STATUS_QUEUED
+    assert command["lease_owner"] is None
+    assert command["last_error"] == "worker crashed"
+    waited = (command["available_at"] - before).total_seconds()
+    assert delay <= waited < delay + 1
+
+
+def test_retry_without_attempts_left_is_refused():
+    command = _command(status=STATUS_RUNNING, attempts=3, max_attempts=3, lease_owner="me:1")
+    commands = RecordingCommands(command)
+
+    assert not asyncio.run(schedule_retry(SimpleNamespace(commands=commands), dict(command), "crashed", "me:1"))
+    assert commands.calls == []
+
+
+def test_retry_needs_the_lease():
+    """A worker that lost its lease must not requeue a command another worker now runs"""
+    command = _command(status=STATUS_RUNNING, attempts=1, lease_owner="other:1",
+                       lease_expires_at=datetime.utcnow() + timedelta(minutes=1))
+    commands = RecordingCommands(command)
+
+    assert not asyncio.run(schedule_retry(SimpleNamespace(commands=commands), dict(command), "crashed", "me:1"))
+    assert command["status"] == STATUS_RUNNING
+    assert command["lease_owner"] == "other:1"
+    _, query, _ = commands.calls[0]
+    assert query["lease_owner"] == "me:1"
@@ -0,0 +1,100 @@
+"""
+Pytest tests for the command scheduler
+Covers priority ordering, per-user fairness and admission control (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import pytest
+import command_scheduler
+from command_scheduler import CommandScheduler, SchedulerFullError, require_command_scheduler
+
+
+@pytest.fixture
+def scheduler():
+    return CommandScheduler(
+        max_concurrent=2,
+        max_queue_depth=5,
+        max_queued_per_user=3,
+        priorities={"MergePdfs": 1, "XlsToPdf": 2}
+    )
+
+
+def test_priority_then_round_robin(scheduler):
+    """Higher priority commands run first, users alternate within a priority"""
+    scheduler.submit("xls-a", "XlsToPdf", "alice")
+    scheduler.submit("merge-a1", "MergePdfs", "alice")
+    scheduler.submit("merge-a2", "MergePdfs", "alice")
+    scheduler.submit("merge-b1", "MergePdfs", "bob")
+
+    expected = ["merge-a1", "merge-b1", "merge-a2", "xls-a"]
+    assert scheduler._dispatch_order() == expected
+    assert [scheduler._pop_next() for _ in range(4)] == expected
+    assert scheduler._pop_next() is None
+
+
+def test_queue_position(scheduler):
+    """Queue position follows dispatch order and is None once dequeued"""
+    scheduler.submit("a1", "MergePdfs", "alice")
+    scheduler.submit("a2", "MergePdfs", "alice")
+    scheduler.submit("b1", "MergePdfs", "bob")
+
+    assert scheduler.get_queue_position("b1") == 2
+    assert scheduler.get_queue_position("a2") == 3
+
+    scheduler._pop_next()
+    assert scheduler.get_queue_position("a1") is None
+    assert scheduler.get_queue_position("b1") == 1
+
+
+def test_admission_per_user_limit(scheduler):
+    """A user with too many queued commands gets 429 with Retry-After"""
+    for i in range(3):
+        scheduler.submit(f"a{i}", "MergePdfs", "alice")
+
+    with pytest.raises(SchedulerFullError) as exc_info:
+        scheduler.check_admission("alice")
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after >= 1
+
+    scheduler.check_admission("bob")  # Other users are still admitted
+
+
+def test_admission_queue_full(scheduler):
+    """A full queue rejects everyone with 503"""
+    for i in range(5):
+        scheduler.submit(f"c{i}", "MergePdfs", f"user{i}")
+
+    with pytest.raises(SchedulerFullError) as exc_info:
+        scheduler.check_admission("newcomer")
+    assert exc_info.value.status_code == 503
+
+
+def test_admission_reserves_slots(scheduler):
+    """Slots are taken by admit() itself, so a burst cannot overshoot the limits before submitting"""
+    for _ in range(3):
+        asyncio.run(scheduler.admit("alice"))
+    with pytest.raises(SchedulerFullError) as exc_info:
+        asyncio.run(scheduler.admit("alice"))
+    assert exc_info.value.status_code == 429
+
+    # A submitted command keeps its slot, a failed upload gives it back
+    scheduler.submit("a1", "MergePdfs", "alice", reserved=True)
+    scheduler.release("alice")
+    assert (scheduler.queue_depth, scheduler.reserved) == (1, 1)
+    asyncio.run(scheduler.admit("alice"))
+
+    asyncio.run(scheduler.admit("bob"))
+    asyncio.run(scheduler.admit("bob"))  # 1 queued + 4 reserved: full
+    with pytest.raises(SchedulerFullError) as exc_info:
+        asyncio.run(scheduler.admit("carol"))
+    assert exc_info.value.status_code == 503
+
+
+def test_require_scheduler_not_started(monkeypatch):
+    monkeypatch.setattr(command_scheduler, "command_scheduler", None)
+    with pytest.raises(SchedulerFullError) as exc_info:
+        require_command_scheduler()
+    assert exc_info.value.status_code == 503
@@ -0,0 +1,141 @@
+"""
+Pytest tests for streaming uploads into GridFS
+Covers chunked writes, the content hash and the upload size limit (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import hashlib
+import pytest
+from bson import ObjectId
+from config import settings
+from file_service import FileService, FileTooLargeError, UPLOAD_READ_SIZE
+
+
+class FakeGridIn:
+    """Records what an upload stream receives"""
+
+    def __init__(self, metadata):
+        self._id = ObjectId()
+        self.metadata = metadata
+        self.chunks = []
+        self.closed = False
+        self.aborted = False
+
+    async def write(self, data):
+        self.chunks.append(data)
+
+    async def set(self, name, value):
+        setattr(self, name, value)
+
+    async def close(self):
+        self.closed = True
+
+    async def abort(self):
+        self.aborted = True
+
+
+class FakeBucket:
+    def __init__(self):
+        self.uploads = []
+
+    def open_upload_stream(self, filename, metadata=None):
+        grid_in = FakeGridIn(metadata)
+        self.uploads.append(grid_in)
+        return grid_in
+
+
+class UnsizedSource:
+    """An async source that does not announce its size"""
+
+    def __init__(self, content):
+        self.content = content
+        self.offset = 0
+
+    async def read(self, size=-1):
+        chunk = self.content[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+
+def test_upload_is_streamed_in_chunks():
+    content = os.urandom(UPLOAD_READ_SIZE * 2 + 10)
+    bucket = FakeBucket()
+    upload = asyncio.run(FileService()._stream_upload(bucket, content, "a.pdf", {"user_id": "u"}))
+
+    grid_in = bucket.uploads[0]
+    assert [len(chunk) for chunk in grid_in.chunks] == [UPLOAD_READ_SIZE, UPLOAD_READ_SIZE, 10]
+    assert grid_in.closed and not grid_in.aborted
+    assert upload["size"] == len(content)
+    assert upload["sha256"] == hashlib.sha256(content).hexdigest()
+    assert grid_in.metadata == {"user_id": "u", "file_size": len(content), "sha256": upload["sha256"]}
+
+
+def test_oversized_upload_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "max_upload_size_mb", 1)
+    content = b"x" * (1024 * 1024 + 1)
+
+    # Known size: rejected before anything is written
+    bucket = FakeBucket()
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(FileService()._stream_upload(bucket, content, "big.pdf", {}))
+    assert bucket.uploads == []
+
+    # Unknown size: rejected once the limit is crossed, partial file aborted
+    bucket = FakeBucket()
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(FileService()._stream_upload(bucket, UnsizedSource(content), "big.pdf", {}))
+    assert bucket.uploads[0].aborted and not bucket.uploads[0].closed
+
+
+class BatchFileService(FileService):
+    """FileService whose single-file uploads are simulated"""
+
+    def __init__(self, fail_on=None):
+        super().__init__()
+        self.fail_on = fail_on
+        self.running = 0
+        self.max_running = 0
+        self.deleted = []
+
+    async def upload_temp_file(self, source, filename, content_type, user_email, user_id):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if filename == self.fail_on:
+            return {"success": False, "error": "too big", "status_code": 413}
+        return {"success": True, "file_id": f"id-{filename}"}
+
+    async def delete_temp_files(self, file_ids):
+        self.deleted.extend(file_ids)
+
+
+class NamedFile:
+    def __init__(self, filename):
+        self.filename = filename
+        self.content_type = None
+
+
+def test_batch_upload_is_bounded_and_ordered():
+    service = BatchFileService()
+    files = [NamedFile(f"{index}.jpg") for index in range(10)]
+    result = asyncio.run(service.upload_temp_files(files, "u@example.com", "u", max_concurrency=3))
+
+    assert result["file_ids"] == [f"id-{index}.jpg" for index in range(10)]
+    assert service.max_running == 3
+
+
+def test_batch_upload_failure_rolls_back():
+    service = BatchFileService(fail_on="1.jpg")
+    files = [NamedFile(f"{index}.jpg") for index in range(10)]
+    result = asyncio.run(service.upload_temp_files(files, "u@example.com", "u", max_concurrency=2))
+
+    assert not result["success"]
+    assert result["filename"] == "1.jpg"
+    assert result["status_code"] == 413
+    # Only the file uploaded alongside the failed one was stored, and it is removed again
+    assert service.deleted == ["id-0.jpg"]
+    assert result["rolled_back"] == 1
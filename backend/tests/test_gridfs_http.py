@@ -0,0 +1,153 @@
+"""
+Pytest tests for GridFS download helpers
+Covers Range parsing, ETag matching, 200/206/304/416 responses and split
+archives assembled from their manifest (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import io
+import zipfile
+import zlib
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from gridfs_http import (RangeNotSatisfiable, SplitPartsMissing, etag_matches, gridfs_download_response,
+                         parse_range, split_archive_response)
+
+
+class FakeGridOut:
+    """In-memory stand-in for an open AsyncIOMotorGridOut with 4-byte chunks"""
+
+    def __init__(self, data: bytes, chunk_size: int = 4):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.length = len(data)
+        self.metadata = {"sha256": "abc"}
+        self._id = "id"
+
+    def seek(self, position):
+        self.position = position
+
+    async def readchunk(self):
+        chunk_end = (self.position // self.chunk_size + 1) * self.chunk_size
+        chunk = self.data[self.position:chunk_end]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+
+class FakeBucket:
+    """Just enough of an AsyncIOMotorGridFSBucket to serve split parts"""
+
+    def __init__(self, files):
+        self.files = files
+        self.opened = []
+
+    async def open_download_stream(self, file_id):
+        self.opened.append(file_id)
+        return FakeGridOut(self.files[file_id])
+
+    def find(self, query):
+        return FakeCursor([{"_id": file_id} for file_id in query["_id"]["$in"] if file_id in self.files])
+
+
+def _manifest(parts):
+    manifest = FakeGridOut(b"")
+    manifest.filename = "doc_split_2_pages.zip"
+    manifest.upload_date = datetime(2024, 5, 17, 12, 30)
+    manifest.metadata = {"split_manifest": True, "split_files": [
+        {"filename": name, "file_id": str(file_id), "size_bytes": len(data), "crc32": zlib.crc32(data)}
+        for name, (file_id, data) in parts.items()
+    ]}
+    return manifest
+
+
+def _body(response):
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    # Ignored: other units, multiple ranges, garbage
+    assert parse_range("items=0-1", 100) is None
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("bytes=a-b", 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_download_responses():
+    data = bytes(range(10))
+
+    full = gridfs_download_response(FakeGridOut(data), {}, "f.pdf", "application/pdf")
+    assert full.status_code == 200
+    assert full.headers["etag"] == '"abc"'
+    assert _body(full) == data
+
+    partial = gridfs_download_response(FakeGridOut(data), {"range": "bytes=3-8"}, "f.pdf", "application/pdf")
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 3-8/10"
+    assert _body(partial) == data[3:9]
+
+    stale = gridfs_download_response(FakeGridOut(data), {"range": "bytes=3-8", "if-range": '"old"'}, "f.pdf", "application/pdf")
+    assert stale.status_code == 200
+
+    not_modified = gridfs_download_response(FakeGridOut(data), {"if-none-match": '"abc"'}, "f.pdf", "application/pdf")
+    assert not_modified.status_code == 304
+
+    unsatisfiable = gridfs_download_response(FakeGridOut(data), {"range": "bytes=20-"}, "f.pdf", "application/pdf")
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */10"
+
+
+def test_split_archive_response():
+    parts = {"doc_page_001.pdf": (ObjectId(), b"%PDF-1" * 5), "doc_page_002.pdf": (ObjectId(), b"%PDF-2" * 7)}
+    bucket = FakeBucket({file_id: data for file_id, data in parts.values()})
+
+    full = asyncio.run(split_archive_response(bucket, _manifest(parts), {}))
+    assert full.status_code == 200
+    assert full.media_type == "application/zip"
+    archive_bytes = _body(full)
+    assert int(full.headers["content-length"]) == len(archive_bytes)
+    archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    assert archive.testzip() is None
+    assert [archive.read(name) for name in parts] == [data for _, data in parts.values()]
+
+    # A range is served from the parts it overlaps only; downloads are identical byte for byte
+    bucket.opened = []
+    partial = asyncio.run(split_archive_response(bucket, _manifest(parts), {"range": "bytes=80-"}))
+    assert partial.status_code == 206
+    assert _body(partial) == archive_bytes[80:]
+    assert bucket.opened == [parts["doc_page_002.pdf"][0]]
+
+    del bucket.files[parts["doc_page_001.pdf"][0]]
+    with pytest.raises(SplitPartsMissing):
+        asyncio.run(split_archive_response(bucket, _manifest(parts), {}))
@@ -0,0 +1,58 @@
+"""
+Pytest tests for the streaming GridFS I/O layer of the command handlers
+Covers input spooling, chunked output with tell() and abort on error (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import zipfile
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+from tools_commands import gridfs_io
+from tools_commands.gridfs_io import open_input, open_output
+
+
+def test_input_is_spooled_to_disk(monkeypatch, fake_fs):
+    monkeypatch.setattr(gridfs_io, "SPOOL_MAX_MEMORY", 10)
+    fake_fs.chunk_size = 4
+    content = b"0123456789" * 5
+    with open_input(fake_fs, fake_fs.put(content, "in.pdf")) as source:
+        assert source.stream._rolled  # Larger than SPOOL_MAX_MEMORY: on disk
+        assert source.stream.read() == content
+        assert source.size == len(content)
+
+    with pytest.raises(ValueError):
+        with open_input(fake_fs, "not-an-id"):
+            pass
+
+
+def test_output_is_written_in_pieces(fake_fs):
+    """PdfWriter and ZipFile write straight into the GridFS file"""
+    fs = fake_fs
+    writer = PdfWriter()
+    writer.add_blank_page(100, 100)
+    with open_output(fs, "out.pdf", "application/pdf", metadata={"a": 1}) as output:
+        writer.write(output)
+    grid_in = fs.files[0]
+    assert grid_in.state == "closed"
+    assert grid_in.kwargs["metadata"] == {"a": 1}
+    assert len(grid_in.writes) > 1
+    assert output.length == sum(len(data) for data in grid_in.writes)
+    assert len(PdfReader(io.BytesIO(grid_in.content)).pages) == 1
+
+    with open_output(fs, "out.zip", "application/zip") as output:
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("a.txt", b"hello" * 100)
+    archive = zipfile.ZipFile(io.BytesIO(fs.files[1].content))
+    assert archive.read("a.txt") == b"hello" * 100
+
+
+def test_output_is_aborted_on_error(fake_fs):
+    fs = fake_fs
+    with pytest.raises(RuntimeError):
+        with open_output(fs, "out.pdf", "application/pdf") as output:
+            output.write(b"partial")
+            raise RuntimeError("conversion failed")
+    assert fs.files[0].state == "aborted"
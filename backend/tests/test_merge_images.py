@@ -0,0 +1,61 @@
+"""
+Pytest tests for MergeImages page drawing
+Covers JPEG passthrough embedding and DPI downsampling (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from tools_commands.MergeImages import add_image_page, binary_streams
+
+
+def _draw(images, max_dpi=0):
+    """PDF of one page per (format, size) image, plus its image XObjects"""
+    output = io.BytesIO()
+    with binary_streams():
+        pdf_canvas = canvas.Canvas(output, pagesize=A4)
+        for image_format, size in images:
+            stream = io.BytesIO()
+            Image.new("RGB", size, (200, 30, 30)).save(stream, image_format)
+            stream.seek(0)
+            with Image.open(stream) as image:
+                add_image_page(pdf_canvas, image, stream, max_dpi)
+        pdf_canvas.save()
+
+    reader = PdfReader(io.BytesIO(output.getvalue()))
+    xobjects = [xobject.get_object() for page in reader.pages
+                for xobject in page["/Resources"]["/XObject"].values()]
+    return reader, xobjects
+
+
+def test_jpeg_is_embedded_as_is():
+    reader, xobjects = _draw([("JPEG", (600, 400)), ("JPEG", (600, 400)), ("PNG", (600, 400))])
+    assert len(reader.pages) == 3
+    assert [list(xobject["/Filter"]) for xobject in xobjects] == [["/DCTDecode"], ["/DCTDecode"], ["/FlateDecode"]]
+    # Identical JPEGs share one image object
+    assert xobjects[0].indirect_reference == xobjects[1].indirect_reference
+
+
+def test_large_images_are_downsampled():
+    # Landscape A4 leaves 802 x 555 points for the image: 1114 pixels wide at 100 dpi
+    _, xobjects = _draw([("JPEG", (3000, 2000)), ("PNG", (3000, 2000)), ("JPEG", (300, 200))], max_dpi=100)
+    assert [xobject["/Width"] for xobject in xobjects] == [1114, 1114, 300]
+    # Small enough already: still passed through
+    assert list(xobjects[2]["/Filter"]) == ["/DCTDecode"]
+
+
+def test_binary_streams_are_restored():
+    """Other reportlab users in the process keep the default ASCII85 setting"""
+    default = rl_config.useA85
+    with binary_streams():
+        # Overlapping merges (thread backend) restore it only when the last one ends
+        with binary_streams():
+            assert rl_config.useA85 == 0
+        assert rl_config.useA85 == 0
+    assert rl_config.useA85 == default
@@ -0,0 +1,90 @@
+"""
+Pytest tests for PDF merging
+Covers writing identical objects of the inputs once, pages and annotations
+excepted (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from config import settings
+from tools_commands.MergeImages import binary_streams
+from tools_commands.MergePdfs import merge_pdfs
+from tools_commands.pdf_dedup import deduplicate_objects
+
+
+def _pdf(pages, text):
+    """PDF with the same noisy JPEG on every page, as in scanned letterheads"""
+    buffer = io.BytesIO()
+    Image.frombytes("L", (200, 100), bytes(range(200)) * 100).save(buffer, "JPEG")
+    logo = ImageReader(io.BytesIO(buffer.getvalue()))
+    buffer = io.BytesIO()
+    with binary_streams():
+        pdf_canvas = canvas.Canvas(buffer)
+        for page in range(pages):
+            pdf_canvas.drawImage(logo, 72, 700, width=200, height=100)
+            pdf_canvas.drawString(72, 650, f"{text} {page + 1}")
+            pdf_canvas.showPage()
+        pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def _merge(fs, documents, monkeypatch, dedup):
+    monkeypatch.setattr(settings, "merge_pdfs_dedup", dedup)
+    result = merge_pdfs({"file_ids": [fs.put(document) for document in documents]}, None, fs)
+    return result, fs.files[-1].content
+
+
+def test_shared_objects_are_written_once(monkeypatch, fake_fs):
+    documents = [_pdf(2, "Letter"), _pdf(3, "Invoice")]
+    plain_result, plain = _merge(fake_fs, documents, monkeypatch, dedup=False)
+    result, merged = _merge(fake_fs, documents, monkeypatch, dedup=True)
+
+    assert plain_result["duplicate_objects_removed"] == 0
+    assert result["duplicate_objects_removed"] > 0
+    assert result["merged_size_bytes"] == len(merged) < len(plain)
+    assert result["merge_seconds"] >= 0
+
+    reader = PdfReader(io.BytesIO(merged))
+    assert [page.extract_text().strip() for page in reader.pages] == \
+        ["Letter 1", "Letter 2", "Invoice 1", "Invoice 2", "Invoice 3"]
+    # Both inputs' logo is now a single image object
+    logos = {page["/Resources"]["/XObject"].raw_get(name).idnum
+             for page in reader.pages for name in page["/Resources"]["/XObject"]}
+    assert len(logos) == 1
+
+
+def test_same_file_merged_twice(monkeypatch, fake_fs):
+    document = _pdf(2, "Page")
+    _, merged = _merge(fake_fs, [document, document], monkeypatch, dedup=True)
+    reader = PdfReader(io.BytesIO(merged))
+    # Pages stay distinct objects; everything under them is shared
+    assert len({page.indirect_reference.idnum for page in reader.pages}) == 4
+    assert len({page.raw_get("/Contents").idnum for page in reader.pages}) == 2
+    assert len(merged) < 2 * len(document)
+
+
+def test_annotations_stay_per_page(monkeypatch, fake_fs):
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer)
+    for page in range(3):
+        pdf_canvas.drawString(72, 700, "Home page")
+        pdf_canvas.linkURL("https://example.com", (72, 690, 200, 715))
+        pdf_canvas.showPage()
+    pdf_canvas.save()
+
+    _, merged = _merge(fake_fs, [buffer.getvalue(), buffer.getvalue()], monkeypatch, dedup=True)
+    reader = PdfReader(io.BytesIO(merged))
+    annotation_ids = [annotation.idnum for page in reader.pages for annotation in page["/Annots"]]
+    assert len(annotation_ids) == len(set(annotation_ids)) == 6
+
+
+def test_nothing_to_deduplicate():
+    pdf_writer = PdfWriter()
+    pdf_writer.append(PdfReader(io.BytesIO(_pdf(1, "Only"))))
+    assert deduplicate_objects(pdf_writer) == 0
@@ -0,0 +1,24 @@
+"""
+Pytest tests for the process budget of command handlers
+Covers in-order results and bounded read-ahead of ordered_pool_map (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools_commands.parallelism import ordered_pool_map
+
+
+def test_ordered_pool_map_keeps_order_and_bounds_read_ahead():
+    pulled = []
+
+    def items():
+        for number in range(-10, 0):
+            pulled.append(number)
+            yield number
+
+    results = ordered_pool_map(abs, items(), workers=2, in_flight=2)
+    assert next(results) == (-10, 10)
+    # Two per worker submitted before the first result is handed out
+    assert len(pulled) == 4
+    assert list(results) == [(number, -number) for number in range(-9, 0)]
@@ -0,0 +1,56 @@
+"""
+Pytest tests for handler progress reporting
+Covers rate limiting, stage changes, flushing and the ETA estimate (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from tools_commands.progress import progress_reporting, report_progress
+
+
+class RecordingCollection:
+    """Stands in for db.commands and keeps every progress write"""
+
+    def __init__(self):
+        self.writes = []
+
+    def update_one(self, query, update):
+        self.writes.append(update["$set"]["progress"])
+
+
+def test_report_without_reporter_is_noop():
+    report_progress("reading", 1, 2)
+
+
+def test_rate_limit_and_flush():
+    """Stage changes and stage completion are written at once, the rest is batched"""
+    collection = RecordingCollection()
+    with progress_reporting(collection, str(ObjectId()), min_interval=60):
+        report_progress("splitting", 1, 10, 100)  # New stage: written
+        for page in range(2, 6):
+            report_progress("splitting", page, 10, 100)  # Held back
+        assert len(collection.writes) == 1
+
+    # Leaving the block flushes the latest held-back state
+    assert len(collection.writes) == 2
+    last = collection.writes[-1]
+    assert last["items_done"] == 5
+    assert last["percent"] == 50.0
+    assert last["eta_seconds"] is not None
+
+    with progress_reporting(collection, str(ObjectId()), min_interval=60):
+        report_progress("reading", 1, 2)
+        report_progress("reading", 2, 2)  # Stage finished: written
+        report_progress("writing")  # New stage: written
+    assert [w["stage"] for w in collection.writes[2:]] == ["reading", "reading", "writing"]
+
+
+def test_write_errors_do_not_fail_the_command():
+    class BrokenCollection:
+        def update_one(self, query, update):
+            raise RuntimeError("connection lost")
+
+    with progress_reporting(BrokenCollection(), str(ObjectId())):
+        report_progress("reading", 1, 1)
@@ -0,0 +1,31 @@
+"""
+Pytest tests for the command result cache keys
+Covers key stability, input order, options and user, and output discovery (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_cache import make_cache_key, input_file_ids, output_file_ids
+
+
+def test_cache_key_depends_on_command_inputs_and_options():
+    key = make_cache_key("MergePdfs", ["aa", "bb"], {}, "u1")
+    assert key == make_cache_key("MergePdfs", ["aa", "bb"], {}, "u1")
+
+    # Merge order matters, so does the command type and its options
+    assert key != make_cache_key("MergePdfs", ["bb", "aa"], {}, "u1")
+    assert key != make_cache_key("MergeImages", ["aa", "bb"], {}, "u1")
+    assert key != make_cache_key("MergePdfs", ["aa", "bb"], {"mode": "ranges"}, "u1")
+
+    # Another user never gets this user's output or stored result
+    assert key != make_cache_key("MergePdfs", ["aa", "bb"], {}, "u2")
+
+
+def test_input_and_output_file_ids():
+    assert input_file_ids({"file_ids": ["a", "b"], "user_id": "u"}) == ["a", "b"]
+    assert input_file_ids({"file_id": "a"}) == ["a"]
+    assert input_file_ids({"user_id": "u"}) == []
+
+    result = {"success": True, "merged_file_id": "m", "page_file_ids": ["p1", "p2"], "total_pages": 2}
+    assert output_file_ids(result) == ["m", "p1", "p2"]
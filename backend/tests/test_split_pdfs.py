@@ -0,0 +1,178 @@
+"""
+Pytest tests for PDF splitting
+Covers split modes, batching, parallel serialisation order and the ZIP and
+per-part outputs (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import tempfile
+import zipfile
+import zlib
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+from config import settings
+from tools_commands import SplitPdfs
+from tools_commands.SplitPdfs import part_batches, split_args, split_pages, split_parts, split_pdfs, split_workers
+
+
+class _Source:
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+
+
+def _pdf(pages):
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer)
+    for page in range(pages):
+        pdf_canvas.drawString(100, 700, f"Page {page + 1}")
+        pdf_canvas.showPage()
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def _texts(pdf):
+    return [page.extract_text().strip() for page in PdfReader(io.BytesIO(pdf)).pages]
+
+
+def test_split_modes():
+    pdf_reader = PdfReader(io.BytesIO(_pdf(10)))
+    assert split_parts("pages", pdf_reader, 10)[0] == [(page, page + 1) for page in range(10)]
+    assert split_parts("pages", pdf_reader, 10, "2-3, 9-")[0] == [(1, 2), (2, 3), (8, 9), (9, 10)]
+    assert split_parts("ranges", pdf_reader, 10, "2-3,5,8-20")[0] == [(1, 3), (4, 5), (7, 10)]
+    assert split_parts("chunks", pdf_reader, 10, chunk_size=4)[0] == [(0, 4), (4, 8), (8, 10)]
+    assert split_parts("chunks", pdf_reader, 10, "1-5", 2)[0] == [(0, 2), (2, 4), (4, 5)]
+
+    with pytest.raises(ValueError):
+        split_parts("ranges", pdf_reader, 10, "11-12")
+    for mode, ranges, chunk_size in [("slices", None, None), ("ranges", None, None), ("chunks", None, 0),
+                                     ("bookmarks", "1-2", None), ("pages", "3-1", None), ("pages", "a", None)]:
+        with pytest.raises(ValueError):
+            split_args(mode, ranges, chunk_size)
+
+    # Defaults are left out of the command args
+    assert split_args() == {}
+    assert split_args("chunks", None, 5) == {"mode": "chunks", "chunk_size": 5}
+
+
+def test_bookmark_mode():
+    pdf_writer = PdfWriter()
+    pdf_writer.append(PdfReader(io.BytesIO(_pdf(6))))
+    chapter = pdf_writer.add_outline_item("Chapter 1", 2)
+    pdf_writer.add_outline_item("Section 1.1", 3, parent=chapter)
+    pdf_writer.add_outline_item("Chapter 2", 4)
+    buffer = io.BytesIO()
+    pdf_writer.write(buffer)
+
+    parts, titles = split_parts("bookmarks", PdfReader(io.BytesIO(buffer.getvalue())), 6)
+    assert parts == [(0, 2), (2, 4), (4, 6)]
+    assert titles == [None, "Chapter 1", "Chapter 2"]
+
+    with pytest.raises(ValueError):
+        split_parts("bookmarks", PdfReader(io.BytesIO(_pdf(3))), 3)
+
+
+def test_only_selected_pages_are_written(monkeypatch, fake_fs):
+    monkeypatch.setattr(settings, "split_output", "zip")
+    fs = fake_fs
+    result = split_pdfs({"file_id": fs.put(_pdf(10)), "mode": "ranges", "ranges": "2-3,5"}, None, fs)
+    assert result["split_mode"] == "ranges"
+    assert [info["page_count"] for info in result["split_files"]] == [2, 1]
+
+    archive = zipfile.ZipFile(io.BytesIO(fs.files[0].content))
+    assert archive.namelist() == ["doc_pages_002-003.pdf", "doc_pages_005-005.pdf"]
+    assert _texts(archive.read("doc_pages_002-003.pdf")) == ["Page 2", "Page 3"]
+
+
+def test_parts_are_stored_separately(fake_fs):
+    fs = fake_fs
+    result = split_pdfs({"file_id": fs.put(_pdf(4)), "mode": "chunks", "chunk_size": 3}, None, fs)
+    *parts, manifest = fs.files
+    assert result["output_file_id"] == str(manifest._id)
+    assert result["part_file_ids"] == [str(part._id) for part in parts]
+    assert manifest.content == b""
+    assert manifest.metadata["split_manifest"]
+    assert manifest.metadata["zip_size"] == result["zip_size_bytes"]
+
+    # The manifest holds what the ZIP download is assembled from
+    for part, info in zip(parts, manifest.metadata["split_files"]):
+        content = part.content
+        assert (info["file_id"], info["size_bytes"], info["crc32"]) == \
+            (str(part._id), len(content), zlib.crc32(content))
+    assert [_texts(part.content) for part in parts] == [["Page 1", "Page 2", "Page 3"], ["Page 4"]]
+
+
+def test_split_progress_counts_part_bytes(monkeypatch, fake_fs):
+    fs = fake_fs
+    reports = []
+    monkeypatch.setattr(SplitPdfs, "report_progress", lambda stage, *counts: reports.append((stage, *counts)))
+    result = split_pdfs({"file_id": fs.put(_pdf(5)), "mode": "chunks", "chunk_size": 2}, None, fs)
+    splitting = [report[1:] for report in reports if report[0] == "splitting"]
+    sizes = [len(part.content) for part in fs.files[:-1]]
+    assert [(done, total) for done, total, _ in splitting] == [(1, 3), (2, 3), (3, 3)]
+    assert [written for _, _, written in splitting] == [sum(sizes[:index + 1]) for index in range(3)]
+    assert result["part_file_ids"] == [str(part._id) for part in fs.files[:-1]]
+
+
+def test_parts_are_deleted_on_failure(monkeypatch, fake_fs):
+    fs = fake_fs
+    file_id = fs.put(_pdf(3))
+    original_new_file = fs.new_file
+
+    def new_file(**kwargs):
+        if kwargs["filename"].endswith(".zip"):
+            raise IOError("GridFS unavailable")
+        return original_new_file(**kwargs)
+
+    monkeypatch.setattr(fs, "new_file", new_file)
+    with pytest.raises(IOError):
+        split_pdfs({"file_id": file_id}, None, fs)
+    assert fs.files == []
+
+
+def test_parallel_split_keeps_part_order(monkeypatch):
+    monkeypatch.setattr(settings, "split_range_pages", 3)
+    assert part_batches([(0, 1), (1, 3), (3, 4), (4, 9), (9, 10)], 3) == \
+        [[(0, 1), (1, 3)], [(3, 4)], [(4, 9)], [(9, 10)]]
+
+    content = _pdf(10)
+    source = _Source(content)
+    pdf_reader = PdfReader(source.stream)
+    parts = [(page, page + 1) for page in range(8)] + [(8, 10)]
+
+    shared_paths = []
+    mkstemp = tempfile.mkstemp
+
+    def recording_mkstemp(**kwargs):
+        descriptor, path = mkstemp(**kwargs)
+        shared_paths.append(path)
+        return descriptor, path
+
+    monkeypatch.setattr(tempfile, "mkstemp", recording_mkstemp)
+    inline = list(split_pages(source, pdf_reader, parts, workers=1))
+    parallel = list(split_pages(source, pdf_reader, parts, workers=2))
+    # The shared copy of the source is removed once the pool is done
+    assert len(shared_paths) == 1 and not os.path.exists(shared_paths[0])
+    assert [_texts(part) for part in parallel] == \
+        [[f"Page {page + 1}"] for page in range(8)] + [["Page 9", "Page 10"]]
+    assert [len(part) for part in parallel] == [len(part) for part in inline]
+
+
+def test_split_workers_share_the_cores(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+    monkeypatch.setattr(settings, "command_execution_backend", "process-pool")
+    monkeypatch.setattr(settings, "scheduler_max_concurrent", 8)
+    monkeypatch.setattr(settings, "worker_pool_size", 4)
+    monkeypatch.setattr(settings, "split_workers", 0)
+    assert split_workers() == 4  # 16 cores / 4 pooled commands
+
+    monkeypatch.setattr(settings, "command_execution_backend", "subprocess")
+    assert split_workers() == 2  # 16 cores / 8 scheduled commands
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    assert split_workers() == 1
+
+    monkeypatch.setattr(settings, "split_workers", 3)
+    assert split_workers() == 3
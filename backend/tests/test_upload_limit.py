@@ -0,0 +1,57 @@
+"""
+Pytest tests for the request body size limit
+Covers rejection from Content-Length and while a chunked body is received (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from upload_limit import RequestSizeLimitMiddleware
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=1024)
+    app.state.handled = 0
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        app.state.handled += 1
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+
+def _multipart(size):
+    boundary = b"limit-test"
+    return boundary, (b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="a.pdf"\r\n'
+                      b"Content-Type: application/pdf\r\n\r\n" + b"x" * size + b"\r\n--" + boundary + b"--\r\n")
+
+
+def test_small_upload_passes(client):
+    response = client.post("/upload", files={"file": ("a.pdf", b"x" * 100, "application/pdf")})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_declared_size_is_rejected_up_front(client):
+    response = client.post("/upload", files={"file": ("a.pdf", b"x" * 4096, "application/pdf")})
+    assert response.status_code == 413
+    assert client.app.state.handled == 0
+
+
+def test_chunked_body_is_cut_off(client):
+    boundary, body = _multipart(4096)
+
+    def chunks():
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    response = client.post("/upload", content=chunks(),
+                           headers={"Content-Type": f"multipart/form-data; boundary={boundary.decode()}"})
+    assert response.status_code == 413
+    assert client.app.state.handled == 0
@@ -0,0 +1,158 @@
+"""
+Pytest tests for the warm worker pool
+Covers worker recycling, crash isolation, shutdown of busy workers and the
+thread backend, with stub handlers (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+import logging
+import time
+import pytest
+from bson import ObjectId
+import worker_pool
+from worker_pool import ThreadWorkerPool, WorkerCrashedError, WorkerPool
+
+# Command IDs the stub database maps to the 'Crash' and 'Sleep' handlers (everything else runs 'Pid')
+CRASH_IDS = {"000000000000000000000bad"}
+SLEEP_IDS = {"0000000000000000000051ee"}
+
+
+class _StubCommands:
+    """Stands in for the workers' sync db.commands"""
+
+    def find_one(self, query):
+        command_id = str(query["_id"])
+        shell_command = "Crash" if command_id in CRASH_IDS else "Sleep" if command_id in SLEEP_IDS else "Pid"
+        return {"_id": query["_id"], "shell_command": shell_command, "args": {}}
+
+    def update_one(self, query, update):
+        pass
+
+
+def _crash(args, db, fs):
+    os._exit(1)  # The worker process dies mid-command
+
+
+def _sleep(args, db, fs):
+    time.sleep(60)
+    return {}
+
+
+STUB_REGISTRY = {"Pid": lambda args, db, fs: {"pid": os.getpid()}, "Crash": _crash, "Sleep": _sleep}
+
+
+def _load_stub_handlers():
+    worker_pool._sync_db = type("StubDb", (), {"commands": _StubCommands()})()
+    worker_pool._fs = None
+    worker_pool._registry = STUB_REGISTRY
+
+
+def _stub_worker_main(conn):
+    """Worker process entry point: the real worker loop, with stub handlers instead of MongoDB"""
+    logging.basicConfig(level=logging.WARNING)  # Keeps _init_worker from adding a log file
+    worker_pool._load_handlers = _load_stub_handlers
+    worker_pool._worker_main(conn)
+
+
+def _pid(outcome):
+    assert outcome["exit_state"] == 0
+    return json.loads(outcome["stdout"].split("Result: ", 1)[1])["pid"]
+
+
+@pytest.fixture
+def start_pool(monkeypatch):
+    monkeypatch.setattr(worker_pool, "_worker_main", _stub_worker_main)
+    pools = []
+
+    def start(size, max_tasks_per_worker):
+        pool = WorkerPool(size=size, max_tasks_per_worker=max_tasks_per_worker)
+        pool.start()
+        pools.append(pool)
+        return pool
+
+    yield start
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_worker_is_recycled_after_max_tasks(start_pool):
+    pool = start_pool(size=1, max_tasks_per_worker=2)
+
+    async def scenario():
+        return [_pid(await pool.run(str(ObjectId()))) for _ in range(5)]
+
+    pids = asyncio.run(scenario())
+    assert pids[0] == pids[1] != pids[2] == pids[3] != pids[4]
+    assert len(set(pids)) == 3
+
+
+def test_crash_fails_only_its_command(start_pool):
+    pool = start_pool(size=1, max_tasks_per_worker=50)
+    crash_id = next(iter(CRASH_IDS))
+
+    async def scenario():
+        before = await pool.run(str(ObjectId()))
+        # The commands queued behind the crash wait for the same slot
+        outcomes = await asyncio.gather(
+            pool.run(crash_id), *[pool.run(str(ObjectId())) for _ in range(3)], return_exceptions=True
+        )
+        return before, outcomes
+
+    before, outcomes = asyncio.run(scenario())
+    assert isinstance(outcomes[0], WorkerCrashedError)
+    # The slot replaced its worker and kept serving the queue
+    pids = {_pid(outcome) for outcome in outcomes[1:]}
+    assert len(pids) == 1 and _pid(before) not in pids
+
+
+def test_shutdown_terminates_busy_workers(start_pool):
+    pool = start_pool(size=1, max_tasks_per_worker=50)
+    sleep_id = next(iter(SLEEP_IDS))
+
+    async def scenario():
+        assert _pid(await pool.run(str(ObjectId())))  # Worker is up
+        running = asyncio.ensure_future(pool.run(sleep_id))
+        await asyncio.sleep(0.5)
+        process = pool._slots[0].process
+        started = time.monotonic()
+        await asyncio.to_thread(pool.shutdown, 1)
+        stopped_after = time.monotonic() - started
+        with pytest.raises(WorkerCrashedError):
+            await running
+        return process, stopped_after
+
+    process, stopped_after = asyncio.run(scenario())
+    assert stopped_after < 10
+    assert not process.is_alive()
+    assert pool._slots == []
+
+
+def test_thread_backend_runs_handlers_in_process(monkeypatch):
+    def fail(args, db, fs):
+        raise ValueError("bad input")
+
+    monkeypatch.setattr(worker_pool, "_load_handlers", lambda: None)
+    monkeypatch.setattr(worker_pool, "_sync_client", None)
+    monkeypatch.setattr(worker_pool, "_sync_db", type("StubDb", (), {"commands": _StubCommands()})())
+    monkeypatch.setattr(worker_pool, "_registry", {"Pid": lambda args, db, fs: {"pid": os.getpid()}, "Crash": fail})
+    pool = ThreadWorkerPool(size=2)
+    pool.start()
+
+    async def scenario():
+        return await asyncio.gather(
+            *[pool.run(str(ObjectId())) for _ in range(3)], pool.run(next(iter(CRASH_IDS)))
+        )
+
+    try:
+        outcomes = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert [_pid(outcome) for outcome in outcomes[:3]] == [os.getpid()] * 3
+    # A failing handler fails its command, not the process
+    assert outcomes[3]["exit_state"] == 1
+    assert "bad input" in outcomes[3]["stderr"]
+    assert pool._executor is None
@@ -0,0 +1,124 @@
+"""
+Pytest tests for Excel sheet rendering
+Covers row chunking into parts, batching, result order, inline rendering into one
+document and worker count selection (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import pytest
+from PyPDF2 import PdfReader
+from config import settings
+from tools_commands.XlsToPdf import batch_jobs, render_batch, render_batches, render_workers, sheet_jobs
+
+
+def _rows(count):
+    yield ("A", "B")
+    for row in range(count):
+        yield (row, None)
+
+
+def test_sheet_is_cut_into_parts():
+    jobs = list(sheet_jobs("Sheet", _rows(10), part_rows=4, block_rows=2))
+    assert [len(job["rows"]) for job in jobs] == [4, 4, 2]
+    assert [job["title"] for job in jobs] == ["Sheet", None, None]
+    assert jobs[0]["header"] == ["A", "B"]
+    assert jobs[0]["rows"][0] == ["0", ""]
+
+    # Exact multiple of part_rows: no empty trailing part
+    assert [len(job["rows"]) for job in sheet_jobs("Sheet", _rows(8), 4, 2)] == [4, 4]
+    # Header only, or nothing at all
+    assert [job["rows"] for job in sheet_jobs("Sheet", _rows(0), 4, 2)] == [[]]
+    assert list(sheet_jobs("Sheet", iter([]), 4, 2)) == []
+
+
+def test_parallel_render_keeps_sheet_order():
+    # Later sheets are shorter, so they tend to finish first
+    jobs = [job for index in range(4)
+            for job in sheet_jobs(f"Sheet {index}", _rows((4 - index) * 40), 1000, 50)]
+    rendered = list(render_batches(iter([job] for job in jobs), workers=2))
+    assert [titles for titles, _, _ in rendered] == [[job["title"]] for job in jobs]
+    titles = [PdfReader(io.BytesIO(pdf)).pages[0].extract_text().splitlines()[0] for _, pdf, _ in rendered]
+    assert titles == [job["title"] for job in jobs]
+
+
+def test_small_sheets_share_one_document():
+    jobs = [job for index in range(3) for job in sheet_jobs(f"Sheet {index}", _rows(3), 1000, 50)]
+    jobs += list(sheet_jobs("Wide", iter([tuple("ABCDEFGHIJ"), tuple(range(10))]), 1000, 50))
+    assert [len(batch) for batch in batch_jobs(jobs, 4)] == [1, 1, 2]
+    assert [len(batch) for batch in batch_jobs(jobs, 100)] == [4]
+
+    # One page per sheet, each in its own orientation, no re-parsing needed
+    pdf, pages = render_batch(jobs)
+    reader = PdfReader(io.BytesIO(pdf))
+    assert pages == len(reader.pages) == 4
+    assert [page.extract_text().splitlines()[0] for page in reader.pages] == \
+        ["Sheet 0", "Sheet 1", "Sheet 2", "Wide"]
+    widths = [float(page.mediabox.width) for page in reader.pages]
+    assert widths[0] == widths[2] < widths[3]
+
+
+def test_small_conversions_render_inline(monkeypatch):
+    from tools_commands import XlsToPdf
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("render workers started for a small conversion")
+
+    monkeypatch.setattr(XlsToPdf, "ordered_pool_map", no_pool)
+    jobs = [job for index in range(3) for job in sheet_jobs(f"Sheet {index}", _rows(20), 1000, 50)]
+    rendered = list(render_batches(iter([job] for job in jobs), workers=4, min_rows=100))
+    assert [titles for titles, _, _ in rendered] == [["Sheet 0", "Sheet 1", "Sheet 2"]]
+
+
+def test_inline_conversion_is_one_document():
+    """Batches rendered inline are laid out into a single document, not joined afterwards"""
+    jobs = [job for index in range(2) for job in sheet_jobs(f"Sheet {index}", _rows(3000), 2500, 200)]
+    batches = list(batch_jobs(jobs, 2500))
+    assert len(batches) == 4
+
+    rendered = list(render_batches(iter(batches), workers=1))
+    assert len(rendered) == 1
+    titles, pdf, pages = rendered[0]
+    assert titles == ["Sheet 0", None, "Sheet 1", None]
+    reader = PdfReader(io.BytesIO(pdf))
+    assert pages == len(reader.pages)
+    starts = [page.extract_text().splitlines()[0] for page in reader.pages]
+    assert starts.count("Sheet 0") == starts.count("Sheet 1") == 1
+
+    assert list(render_batches(iter([]), workers=1)) == []
+
+
+def test_render_workers(monkeypatch):
+    monkeypatch.setattr(settings, "xls_render_workers", 3)
+    assert render_workers() == 3
+
+    # 0 = the command's share of the cores, not one process per core
+    monkeypatch.setattr(settings, "xls_render_workers", 0)
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+    monkeypatch.setattr(settings, "command_execution_backend", "process-pool")
+    monkeypatch.setattr(settings, "scheduler_max_concurrent", 8)
+    monkeypatch.setattr(settings, "worker_pool_size", 4)
+    assert render_workers() == 4
+    monkeypatch.setattr(os, "cpu_count", lambda: 2)
+    assert render_workers() == 1
+
+
+def test_render_profile(monkeypatch):
+    from tools_commands import render_profile
+    from tools_commands.render_profile import RenderProfile, get_render_profile
+
+    profile = RenderProfile({"landscape_min_columns": 4, "font_size": 9})
+    assert profile.page_size(3)[0] < profile.page_size(4)[0]  # Wide sheets go landscape
+    assert profile.column_widths(4, profile.page_size(4)) is profile.column_widths(4, profile.page_size(4))
+    assert ('FONTSIZE', (0, 1), (-1, -1), 9) in [tuple(cmd) for cmd in profile.table_style.getCommands()]
+
+    with pytest.raises(ValueError):
+        RenderProfile({"colour": "red"})
+
+    # Built once per process from the settings, then reused
+    monkeypatch.setattr(render_profile, "_profile", None)
+    monkeypatch.setattr(settings, "xls_render_profile", {"grid_width": 1})
+    assert get_render_profile() is get_render_profile()
+    assert get_render_profile().options["grid_width"] == 1
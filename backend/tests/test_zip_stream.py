@@ -0,0 +1,73 @@
+"""
+Pytest tests for the streaming ZIP writer
+Covers the store/deflate policy, headers without data descriptors, ZIP64 and
+lazily assembled stored archives (no server needed)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import struct
+import zipfile
+import zlib
+from tools_commands.zip_stream import ZipStreamWriter, stored_archive
+
+
+class _WriteOnly:
+    """Output without seek() or tell(), like a GridFS upload"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def test_entries_are_stored_or_deflated():
+    text = b"lorem ipsum dolor sit amet " * 2000
+    noise = os.urandom(100000)
+    output = _WriteOnly()
+    with ZipStreamWriter(output, min_deflate_gain=0.1) as zip_writer:
+        assert not zip_writer.write("text.txt", text).stored
+        assert zip_writer.write("noise.bin", noise).stored
+        assert zip_writer.write("forced.txt", text, zipfile.ZIP_STORED).stored
+        assert zip_writer.write("empty.txt", b"").stored
+        zip_writer.write("ünïcode.txt", b"x")
+
+    archive = zipfile.ZipFile(io.BytesIO(output.buffer.getvalue()))
+    assert archive.testzip() is None
+    assert archive.read("text.txt") == text and archive.read("noise.bin") == noise
+    assert archive.read("ünïcode.txt") == b"x"
+    assert [info.compress_type for info in archive.infolist()][:3] == \
+        [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED, zipfile.ZIP_STORED]
+    # Sizes are in the local headers: no data descriptors
+    assert all(not info.flag_bits & 0x08 for info in archive.infolist())
+    flags, = struct.unpack("<H", output.buffer.getvalue()[6:8])
+    assert flags == 0
+
+
+def test_zip64_entry_count():
+    output = _WriteOnly()
+    with ZipStreamWriter(output) as zip_writer:
+        for index in range(zipfile.ZIP_FILECOUNT_LIMIT + 2):
+            zip_writer.write(f"{index}", b"")
+    archive = zipfile.ZipFile(io.BytesIO(output.buffer.getvalue()))
+    assert len(archive.infolist()) == zipfile.ZIP_FILECOUNT_LIMIT + 2
+
+
+def test_stored_archive_layout():
+    files = {"a.pdf": b"%PDF-a" * 100, "b.pdf": b"", "c.pdf": os.urandom(5000)}
+    segments, size = stored_archive([(name, len(data), zlib.crc32(data), name) for name, data in files.items()],
+                                    (2024, 5, 17, 12, 30, 0))
+    # Contiguous segments, file contents referenced by their source
+    assert [offset for offset, _, _ in segments] == \
+        [sum(length for _, length, _ in segments[:index]) for index in range(len(segments))]
+    assembled = b"".join(data if isinstance(data, bytes) else files[data] for _, _, data in segments)
+    assert len(assembled) == size
+
+    archive = zipfile.ZipFile(io.BytesIO(assembled))
+    assert archive.testzip() is None
+    assert archive.namelist() == list(files)
+    assert all(archive.read(name) == data for name, data in files.items())
+    assert archive.getinfo("a.pdf").date_time == (2024, 5, 17, 12, 30, 0)
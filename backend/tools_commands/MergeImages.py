@@ -1,18 +1,28 @@
 """
 MergeImages command handler
 Converts multiple image files to PDF and merges them into a single PDF
+All pages are drawn on one reportlab canvas that is written straight into
+GridFS (no per-page PDF parsed back and copied). JPEGs that need no conversion
+are embedded as they are; with MERGE_IMAGES_MAX_DPI larger images are
+downsampled to that resolution on the page first.
 """
 
+import hashlib
 import io
 import logging
-from typing import Dict, Any, List
-from bson import ObjectId
+import math
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
 import gridfs
 from PIL import Image
-from PyPDF2 import PdfWriter
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.utils import ImageReader
+from config import settings
+from .gridfs_io import open_input, open_output
+from .progress import report_progress
 
 # Set up logging for this module
 logger = logging.getLogger('MergeImages')
@@ -20,6 +30,155 @@ logger = logging.getLogger('MergeImages')
 # Supported image formats
 SUPPORTED_IMAGE_FORMATS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff'}
 
+# Merges currently writing binary streams (see binary_streams)
+_binary_streams_lock = threading.Lock()
+_binary_streams_users = 0
+_saved_use_a85 = rl_config.useA85
+
+# Downsampled JPEGs are stored as JPEG again, at this quality
+DOWNSAMPLED_JPEG_QUALITY = 85
+
+@contextmanager
+def binary_streams():
+    """
+    Have reportlab write binary streams instead of ASCII85 while in the block
+    
+    ASCII85 would add 25% to every embedded image. reportlab reads the switch
+    (rl_config.useA85) until the canvas is saved, and it is process-wide, so
+    it is only changed for the lifetime of a canvas and restored when the last
+    overlapping merge (thread backend) has finished.
+    """
+    global _binary_streams_users, _saved_use_a85
+    with _binary_streams_lock:
+        if _binary_streams_users == 0:
+            _saved_use_a85 = rl_config.useA85
+            rl_config.useA85 = 0
+        _binary_streams_users += 1
+    try:
+        yield
+    finally:
+        with _binary_streams_lock:
+            _binary_streams_users -= 1
+            if _binary_streams_users == 0:
+                rl_config.useA85 = _saved_use_a85
+
+
+class JpegPassthrough:
+    """
+    A JPEG file for Canvas.drawImage, embedded as is (DCTDecode)
+    
+    reportlab only copies JPEG data for file names, and decodes ImageReader
+    objects to name them; this gives it the file handle (jpeg_fh) and a
+    content hash as name instead, so identical images are stored once.
+    """
+    
+    def __init__(self, stream):
+        self._stream = stream
+        stream.seek(0)
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+        self._name = f"jpeg-{digest.hexdigest()}"
+    
+    def jpeg_fh(self):
+        self._stream.seek(0)
+        return self._stream
+    
+    def __str__(self) -> str:
+        return self._name
+
+
+def add_image_page(pdf_canvas: canvas.Canvas, image: Image.Image, stream=None, max_dpi: int = 0):
+    """
+    Draw an image as the next page of the canvas, A4 in the image's orientation
+    
+    The image is scaled to fit inside a 20 point margin, keeping its aspect
+    ratio, and centered on the page. With max_dpi, images with more pixels
+    than that resolution needs at their printed size are downsampled first
+    (JPEGs are decoded at reduced scale and stored as JPEG again). Given the
+    stream the image was opened from, a JPEG needing neither conversion nor
+    downsampling is embedded without being decoded or re-encoded.
+    """
+    # Get image dimensions
+    img_width, img_height = image.size
+    logger.info(f"Image dimensions: {img_width}x{img_height}")
+    
+    # Determine page orientation based on image aspect ratio
+    if img_width > img_height:
+        # Landscape
+        page_width, page_height = A4[1], A4[0]  # Swap dimensions for landscape
+        orientation = "landscape"
+    else:
+        # Portrait
+        page_width, page_height = A4
+        orientation = "portrait"
+    
+    logger.info(f"Using {orientation} orientation ({page_width}x{page_height})")
+    
+    # Calculate scaling to fit image on page while preserving aspect ratio
+    # Leave some margin (20 points on each side)
+    margin = 20
+    available_width = page_width - (2 * margin)
+    available_height = page_height - (2 * margin)
+    
+    # Calculate scale factors
+    width_scale = available_width / img_width
+    height_scale = available_height / img_height
+    
+    # Use the smaller scale to ensure image fits within page
+    scale = min(width_scale, height_scale)
+    
+    # Calculate final image dimensions
+    final_width = img_width * scale
+    final_height = img_height * scale
+    
+    # Center image on page
+    x_offset = (page_width - final_width) / 2
+    y_offset = (page_height - final_height) / 2
+    
+    logger.info(f"Scaled image to {final_width}x{final_height}, centered at ({x_offset}, {y_offset})")
+    
+    # Pixels needed at max_dpi for the printed size (72 points per inch)
+    target_size: Optional[Tuple[int, int]] = None
+    if max_dpi > 0:
+        target_size = (math.ceil(final_width / 72 * max_dpi), math.ceil(final_height / 72 * max_dpi))
+        if img_width <= target_size[0] and img_height <= target_size[1]:
+            target_size = None
+    
+    is_jpeg = image.format == 'JPEG'
+    if stream is not None and target_size is None and is_jpeg and image.mode in ('RGB', 'L'):
+        logger.info("Embedding JPEG data as is")
+        drawable = JpegPassthrough(stream)
+    else:
+        if target_size is not None:
+            # Decode JPEGs at the smallest DCT scale still covering the target, then resample
+            image.draft(None, target_size)
+        
+        # Convert to RGB if necessary (for PDF compatibility)
+        if image.mode not in ('RGB', 'L'):
+            logger.info(f"Converting image from {image.mode} to RGB")
+            image = image.convert('RGB')
+        
+        if target_size is None:
+            drawable = ImageReader(image)
+        else:
+            image.thumbnail(target_size)
+            logger.info(f"Downsampled image to {image.size[0]}x{image.size[1]} ({max_dpi} dpi)")
+            if is_jpeg:
+                downsampled = io.BytesIO()
+                image.save(downsampled, "JPEG", quality=DOWNSAMPLED_JPEG_QUALITY)
+                drawable = JpegPassthrough(downsampled)
+            else:
+                drawable = ImageReader(image)
+    
+    # Draw image on its own page of the shared canvas
+    pdf_canvas.setPageSize((page_width, page_height))
+    pdf_canvas.drawImage(drawable, x_offset, y_offset,
+                         width=final_width, height=final_height,
+                         preserveAspectRatio=True)
+    pdf_canvas.showPage()
+
+
 def merge_images(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
     """
     Convert multiple image files from GridFS to PDF pages and merge into a single PDF
@@ -28,7 +187,7 @@ def merge_images(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
         args: Dict containing 'file_ids' - list of GridFS file IDs
         db: MongoDB database connection
         fs: GridFS instance for tmp_files bucket
-        
+    
     Returns:
         Dict containing 'merged_file_id' of the resulting merged PDF
     """
@@ -42,143 +201,66 @@ def merge_images(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
     
     logger.info(f"Starting image to PDF conversion and merge of {len(file_ids)} files: {file_ids}")
     
-    # Create PDF writer for merged output
-    pdf_writer = PdfWriter()
     processed_files = []
+    bytes_processed = 0
+    
+    # Generate filename for merged PDF
+    merged_filename = f"merged_images_{len(file_ids)}_files.pdf"
     
     try:
-        # Process each image file
-        for i, file_id_str in enumerate(file_ids):
-            logger.info(f"Processing file {i+1}/{len(file_ids)}: {file_id_str}")
+        # One canvas for all pages, saved straight into GridFS
+        with binary_streams(), open_output(fs, merged_filename, "application/pdf") as output:
+            pdf_canvas = canvas.Canvas(output, pagesize=A4)
             
-            # Convert string ID to ObjectId
-            try:
-                file_id = ObjectId(file_id_str)
-            except Exception as e:
-                raise ValueError(f"Invalid file ID '{file_id_str}': {str(e)}")
+            # Process each image file
+            for i, file_id_str in enumerate(file_ids):
+                logger.info(f"Processing file {i+1}/{len(file_ids)}: {file_id_str}")
+                
+                # Spool file from GridFS to a local seekable file
+                with open_input(fs, file_id_str) as source:
+                    processed_files.append({
+                        "id": file_id_str,
+                        "filename": source.filename,
+                        "size": source.size
+                    })
+                    
+                    # Convert image to PDF page
+                    try:
+                        # Load image using PIL
+                        with Image.open(source.stream) as image:
+                            add_image_page(pdf_canvas, image, source.stream, settings.merge_images_max_dpi)
+                        logger.info(f"Successfully added page for {source.filename}")
+                    
+                    except Exception as e:
+                        raise ValueError(f"Failed to convert image '{source.filename}' to PDF: {str(e)}")
+                    
+                    bytes_processed += source.size
+                    report_progress("converting", i + 1, len(file_ids), bytes_processed)
             
-            # Download file from GridFS
-            try:
-                grid_file = fs.get(file_id)
-                file_content = grid_file.read()
-                processed_files.append({
-                    "id": file_id_str,
-                    "filename": grid_file.filename,
-                    "size": len(file_content)
-                })
-                logger.info(f"Downloaded {grid_file.filename} ({len(file_content)} bytes)")
-            except gridfs.NoFile:
-                raise ValueError(f"File with ID '{file_id_str}' not found in GridFS")
-            except Exception as e:
-                raise ValueError(f"Failed to download file '{file_id_str}': {str(e)}")
+            # Write merged PDF
+            report_progress("writing")
+            total_pages = pdf_canvas.getPageNumber() - 1
+            pdf_canvas.save()
             
-            # Convert image to PDF page
-            try:
-                # Load image using PIL
-                image = Image.open(io.BytesIO(file_content))
-                
-                # Convert to RGB if necessary (for PDF compatibility)
-                if image.mode not in ('RGB', 'L'):
-                    logger.info(f"Converting image from {image.mode} to RGB")
-                    image = image.convert('RGB')
-                
-                # Get image dimensions
-                img_width, img_height = image.size
-                logger.info(f"Image dimensions: {img_width}x{img_height}")
-                
-                # Determine page orientation based on image aspect ratio
-                if img_width > img_height:
-                    # Landscape
-                    page_width, page_height = A4[1], A4[0]  # Swap dimensions for landscape
-                    orientation = "landscape"
-                else:
-                    # Portrait
-                    page_width, page_height = A4
-                    orientation = "portrait"
-                
-                logger.info(f"Using {orientation} orientation ({page_width}x{page_height})")
-                
-                # Calculate scaling to fit image on page while preserving aspect ratio
-                # Leave some margin (20 points on each side)
-                margin = 20
-                available_width = page_width - (2 * margin)
-                available_height = page_height - (2 * margin)
-                
-                # Calculate scale factors
-                width_scale = available_width / img_width
-                height_scale = available_height / img_height
-                
-                # Use the smaller scale to ensure image fits within page
-                scale = min(width_scale, height_scale)
-                
-                # Calculate final image dimensions
-                final_width = img_width * scale
-                final_height = img_height * scale
-                
-                # Center image on page
-                x_offset = (page_width - final_width) / 2
-                y_offset = (page_height - final_height) / 2
-                
-                logger.info(f"Scaled image to {final_width}x{final_height}, centered at ({x_offset}, {y_offset})")
-                
-                # Create PDF page with image
-                pdf_buffer = io.BytesIO()
-                c = canvas.Canvas(pdf_buffer, pagesize=(page_width, page_height))
-                
-                # Draw image on canvas
-                img_reader = ImageReader(image)
-                c.drawImage(img_reader, x_offset, y_offset, 
-                           width=final_width, height=final_height,
-                           preserveAspectRatio=True)
-                
-                c.save()
-                
-                # Read the created PDF page
-                pdf_buffer.seek(0)
-                from PyPDF2 import PdfReader
-                page_reader = PdfReader(pdf_buffer)
-                
-                # Add page to the merged PDF
-                pdf_writer.add_page(page_reader.pages[0])
-                logger.info(f"Successfully added page for {grid_file.filename}")
-                
-            except Exception as e:
-                raise ValueError(f"Failed to convert image '{grid_file.filename}' to PDF: {str(e)}")
-        
-        # Create merged PDF in memory
-        merged_buffer = io.BytesIO()
-        pdf_writer.write(merged_buffer)
-        merged_content = merged_buffer.getvalue()
-        
-        logger.info(f"Merged PDF created successfully ({len(merged_content)} bytes)")
-        
-        # Generate filename for merged PDF
-        merged_filename = f"merged_images_{len(file_ids)}_files.pdf"
-        
-        # Upload merged PDF to GridFS
-        merged_file_id = fs.put(
-            merged_content,
-            filename=merged_filename,
-            content_type="application/pdf",
-            metadata={
+            output.set_metadata({
                 "original_files": processed_files,
                 "merge_type": "image_to_pdf_merge",
-                "total_pages": len(pdf_writer.pages)
-            }
-        )
+                "total_pages": total_pages
+            })
         
-        logger.info(f"Merged PDF uploaded to GridFS with ID: {merged_file_id}")
+        merged_file_id = output.file_id
+        logger.info(f"Merged PDF uploaded to GridFS with ID: {merged_file_id} ({output.length} bytes)")
         
         # Return success result
         return {
             "success": True,
             "merged_file_id": str(merged_file_id),
             "merged_filename": merged_filename,
-            "total_pages": len(pdf_writer.pages),
+            "total_pages": total_pages,
             "original_files": processed_files,
-            "merged_size_bytes": len(merged_content)
+            "merged_size_bytes": output.length
         }
-        
+    
     except Exception as e:
         # Ensure proper error handling
         logger.error(f"Image to PDF merge failed: {str(e)}")
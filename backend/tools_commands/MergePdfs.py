@@ -1,15 +1,21 @@
 """
 MergePdfs command handler
 Merges multiple PDF files into a single PDF
+Identical objects of the inputs (shared fonts, images, ICC profiles, a file
+merged twice) are written once unless MERGE_PDFS_DEDUP is off.
 """
 
-import io
 import json
 import logging
+import time
+from contextlib import ExitStack
 from typing import Dict, Any, List
-from bson import ObjectId
 import gridfs
 from PyPDF2 import PdfWriter, PdfReader
+from config import settings
+from .gridfs_io import open_input, open_output
+from .pdf_dedup import deduplicate_objects
+from .progress import report_progress
 
 # Set up logging for this module
 logger = logging.getLogger('MergePdfs')
@@ -24,7 +30,8 @@ def merge_pdfs(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
         fs: GridFS instance for tmp_files bucket
         
     Returns:
-        Dict containing 'merged_file_id' of the resulting merged PDF
+        Dict containing 'merged_file_id' of the resulting merged PDF, its
+        size, the duplicate objects removed and the merge time
     """
     
     file_ids = args.get("file_ids", [])
@@ -35,75 +42,69 @@ def merge_pdfs(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
         raise ValueError("At least 2 PDF files are required for merging")
     
     logger.info(f"Starting PDF merge of {len(file_ids)} files: {file_ids}")
+    started = time.perf_counter()
     
     # Create PDF writer for merged output
     pdf_writer = PdfWriter()
     processed_files = []
+    bytes_processed = 0
     
     try:
-        # Process each PDF file
-        for i, file_id_str in enumerate(file_ids):
-            logger.info(f"Processing file {i+1}/{len(file_ids)}: {file_id_str}")
-            
-            # Convert string ID to ObjectId
-            try:
-                file_id = ObjectId(file_id_str)
-            except Exception as e:
-                raise ValueError(f"Invalid file ID '{file_id_str}': {str(e)}")
-            
-            # Download file from GridFS
-            try:
-                grid_file = fs.get(file_id)
-                file_content = grid_file.read()
+        # Inputs stay open until the writer has written: PyPDF2 reads page
+        # content from the source files lazily
+        with ExitStack() as inputs:
+            # Process each PDF file
+            for i, file_id_str in enumerate(file_ids):
+                logger.info(f"Processing file {i+1}/{len(file_ids)}: {file_id_str}")
+                
+                # Spool file from GridFS to a local seekable file
+                source = inputs.enter_context(open_input(fs, file_id_str))
                 processed_files.append({
                     "id": file_id_str,
-                    "filename": grid_file.filename,
-                    "size": len(file_content)
+                    "filename": source.filename,
+                    "size": source.size
                 })
-                logger.info(f"Downloaded {grid_file.filename} ({len(file_content)} bytes)")
-            except gridfs.NoFile:
-                raise ValueError(f"File with ID '{file_id_str}' not found in GridFS")
-            except Exception as e:
-                raise ValueError(f"Failed to download file '{file_id_str}': {str(e)}")
-            
-            # Read PDF content
-            try:
-                pdf_buffer = io.BytesIO(file_content)
-                pdf_reader = PdfReader(pdf_buffer)
                 
-                # Add all pages from this PDF to the writer
-                page_count = len(pdf_reader.pages)
-                logger.info(f"Adding {page_count} pages from {grid_file.filename}")
-                
-                for page_num in range(page_count):
-                    pdf_writer.add_page(pdf_reader.pages[page_num])
+                # Read PDF content
+                try:
+                    pdf_reader = PdfReader(source.stream)
                     
-            except Exception as e:
-                raise ValueError(f"Failed to read PDF file '{grid_file.filename}': {str(e)}")
-        
-        # Create merged PDF in memory
-        merged_buffer = io.BytesIO()
-        pdf_writer.write(merged_buffer)
-        merged_content = merged_buffer.getvalue()
-        
-        logger.info(f"Merged PDF created successfully ({len(merged_content)} bytes)")
-        
-        # Generate filename for merged PDF
-        merged_filename = f"merged_pdf_{len(file_ids)}_files.pdf"
-        
-        # Upload merged PDF to GridFS
-        merged_file_id = fs.put(
-            merged_content,
-            filename=merged_filename,
-            content_type="application/pdf",
-            metadata={
+                    # Add all pages from this PDF to the writer
+                    page_count = len(pdf_reader.pages)
+                    logger.info(f"Adding {page_count} pages from {source.filename}")
+                    
+                    for page_num in range(page_count):
+                        pdf_writer.add_page(pdf_reader.pages[page_num])
+                        
+                except Exception as e:
+                    raise ValueError(f"Failed to read PDF file '{source.filename}': {str(e)}")
+                
+                bytes_processed += source.size
+                report_progress("reading", i + 1, len(file_ids), bytes_processed)
+            
+            # Generate filename for merged PDF
+            merged_filename = f"merged_pdf_{len(file_ids)}_files.pdf"
+            
+            # Every input's copy of a shared resource was cloned separately: keep one
+            duplicates_removed = 0
+            if settings.merge_pdfs_dedup:
+                report_progress("deduplicating")
+                duplicates_removed = deduplicate_objects(pdf_writer)
+            
+            # Write merged PDF straight into GridFS
+            report_progress("writing")
+            with open_output(fs, merged_filename, "application/pdf", metadata={
                 "original_files": processed_files,
                 "merge_type": "pdf_merge",
-                "total_pages": len(pdf_writer.pages)
-            }
-        )
+                "total_pages": len(pdf_writer.pages),
+                "duplicate_objects_removed": duplicates_removed
+            }) as output:
+                pdf_writer.write(output)
         
-        logger.info(f"Merged PDF uploaded to GridFS with ID: {merged_file_id}")
+        merged_file_id = output.file_id
+        merge_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Merged PDF uploaded to GridFS with ID: {merged_file_id} ({output.length} bytes, "
+                    f"{duplicates_removed} duplicate objects removed, {merge_seconds}s)")
         
         # Return success result
         return {
@@ -112,7 +113,9 @@ def merge_pdfs(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
             "merged_filename": merged_filename,
             "total_pages": len(pdf_writer.pages),
             "original_files": processed_files,
-            "merged_size_bytes": len(merged_content)
+            "merged_size_bytes": output.length,
+            "duplicate_objects_removed": duplicates_removed,
+            "merge_seconds": merge_seconds
         }
         
     except Exception as e:
@@ -1,60 +1,283 @@
 """
 SplitPdfs command handler
 Splits a PDF file into individual pages and creates a ZIP archive
+PDFs of more than SPLIT_RANGE_PAGES pages are serialised in page ranges across
+a process pool (SPLIT_WORKERS, by default the command's share of the cores);
+every worker maps the source from one shared temp file and the parts are
+written in page order. By default (SPLIT_OUTPUT=parts) every part is stored
+as its own GridFS file and the result is a manifest the download route
+assembles a stored ZIP from on the fly; with SPLIT_OUTPUT=zip the ZIP is
+streamed into GridFS entry by entry and pages that deflate saves less than
+SPLIT_ZIP_MIN_DEFLATE_GAIN of are stored as they are.
 """
 
 import io
 import json
 import logging
-import zipfile
-from typing import Dict, Any
-from bson import ObjectId
+import mmap
+import os
+import shutil
+import tempfile
+import zlib
+from contextlib import closing
+from functools import partial
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import gridfs
+from bson import ObjectId
 from PyPDF2 import PdfWriter, PdfReader
+from config import settings
+from .gridfs_io import open_input, open_output
+from .parallelism import ordered_pool_map, pool_workers
+from .progress import report_progress
+from .zip_stream import ZipStreamWriter, stored_archive
 
 # Set up logging for this module
 logger = logging.getLogger('SplitPdfs')
 
+# How a document is cut into output PDFs: one per page, one per requested range,
+# chunks of 'chunk_size' pages, or one per top-level bookmark
+SPLIT_MODES = ("pages", "ranges", "chunks", "bookmarks")
+
+# A part of the document to write as one PDF: pages start..end-1 (0-based)
+PageRange = Tuple[int, int]
+
+# How split results are stored: one GridFS file per part plus a manifest, or one ZIP file
+SPLIT_OUTPUTS = ("parts", "zip")
+
+# Source PDF of this split worker process: (path, reader), opened on first use
+_worker_source: Optional[Tuple[str, PdfReader]] = None
+
+
+def parse_page_ranges(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """
+    Parse "1-3, 10-20, 25, 40-" into 1-based inclusive (first, last) ranges
+    (last is None for an open end)
+    
+    Raises:
+        ValueError: malformed, empty or reversed range
+    """
+    ranges = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        first, separator, last = item.partition("-")
+        try:
+            first_page = int(first)
+            last_page = (int(last) if last.strip() else None) if separator else first_page
+        except ValueError:
+            raise ValueError(f"Invalid page range '{item}'")
+        if first_page < 1 or (last_page is not None and last_page < first_page):
+            raise ValueError(f"Invalid page range '{item}'")
+        ranges.append((first_page, last_page))
+    if not ranges:
+        raise ValueError("No page ranges given")
+    return ranges
+
+
+def selected_ranges(spec: Optional[str], total_pages: int) -> List[PageRange]:
+    """The requested page ranges of the document (all pages when spec is empty)"""
+    if not spec:
+        return [(0, total_pages)]
+    ranges = []
+    for first_page, last_page in parse_page_ranges(spec):
+        if first_page > total_pages:
+            raise ValueError(f"Page range starting at {first_page} is outside the document ({total_pages} pages)")
+        ranges.append((first_page - 1, min(last_page or total_pages, total_pages)))
+    return ranges
+
+
+def bookmark_parts(pdf_reader: PdfReader, total_pages: int) -> Tuple[List[PageRange], List[Optional[str]]]:
+    """Parts starting at each top-level bookmark (pages before the first form their own part)"""
+    starts: Dict[int, Optional[str]] = {}
+    for item in pdf_reader.outline:
+        # Nested lists hold the children of the previous bookmark
+        if isinstance(item, list):
+            continue
+        page_num = pdf_reader.get_destination_page_number(item)
+        if page_num is not None and 0 <= page_num < total_pages:
+            starts.setdefault(page_num, item.title)
+    if not starts:
+        raise ValueError("PDF has no bookmarks to split at")
+    
+    if 0 not in starts:
+        starts[0] = None
+    bounds = sorted(starts) + [total_pages]
+    parts = list(zip(bounds[:-1], bounds[1:]))
+    return parts, [starts[start] for start, _ in parts]
+
+
+def split_args(mode: str = "pages", ranges: Optional[str] = None,
+               chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Validated split options as command args
+    
+    Defaults are left out, so a plain split keeps the args (and result cache
+    key) it always had.
+    
+    Raises:
+        ValueError: unknown mode or options that do not fit it
+    """
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode '{mode}' (expected one of: {', '.join(SPLIT_MODES)})")
+    if mode == "bookmarks" and ranges:
+        raise ValueError("Page ranges cannot be combined with the bookmarks split mode")
+    if mode == "ranges" and not ranges:
+        raise ValueError("The ranges split mode needs page ranges")
+    if mode == "chunks" and (not chunk_size or chunk_size < 1):
+        raise ValueError("The chunks split mode needs a positive chunk_size")
+    
+    args: Dict[str, Any] = {}
+    if mode != "pages":
+        args["mode"] = mode
+    if ranges:
+        parse_page_ranges(ranges)
+        args["ranges"] = ranges
+    if mode == "chunks":
+        args["chunk_size"] = chunk_size
+    return args
+
+
+def split_parts(mode: str, pdf_reader: PdfReader, total_pages: int, ranges: Optional[str] = None,
+                chunk_size: Optional[int] = None) -> Tuple[List[PageRange], List[Optional[str]]]:
+    """
+    Page ranges to write as separate PDFs for a split mode, and their titles
+    
+    Only these pages are ever serialised, so selecting a few pages of a large
+    document costs in proportion to the selection.
+    
+    Raises:
+        ValueError: unknown mode or options that do not fit it
+    """
+    split_args(mode, ranges, chunk_size)
+    if mode == "bookmarks":
+        return bookmark_parts(pdf_reader, total_pages)
+    
+    selection = selected_ranges(ranges, total_pages)
+    if mode == "ranges":
+        parts = selection
+    elif mode == "chunks":
+        parts = [(first, min(first + chunk_size, end)) for start, end in selection
+                 for first in range(start, end, chunk_size)]
+    else:
+        parts = [(page_num, page_num + 1) for start, end in selection for page_num in range(start, end)]
+    return parts, [None] * len(parts)
+
+
+def part_pdf(pdf_reader: PdfReader, part: PageRange) -> bytes:
+    """A PDF of the pages of one part"""
+    pdf_writer = PdfWriter()
+    for page_num in range(*part):
+        pdf_writer.add_page(pdf_reader.pages[page_num])
+    part_buffer = io.BytesIO()
+    pdf_writer.write(part_buffer)
+    return part_buffer.getvalue()
+
+
+def split_page_ranges(path: str, parts: List[PageRange]) -> List[bytes]:
+    """
+    Serialise parts of the PDF at path, one PDF per part
+    
+    Runs in a split worker: the source is memory-mapped and parsed once per
+    process, then reused for every batch that worker gets.
+    """
+    global _worker_source
+    if _worker_source is None or _worker_source[0] != path:
+        with open(path, 'rb') as source_file:
+            source_map = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+        _worker_source = (path, PdfReader(source_map))
+    pdf_reader = _worker_source[1]
+    return [part_pdf(pdf_reader, part) for part in parts]
+
+
+def split_workers() -> int:
+    """Split processes to use (SPLIT_WORKERS, 0 = this command's share of the cores)"""
+    return pool_workers(settings.split_workers)
+
+
+def part_batches(parts: List[PageRange], batch_pages: int) -> List[List[PageRange]]:
+    """Consecutive parts grouped into batches of at most batch_pages pages (a bigger part alone)"""
+    batches: List[List[PageRange]] = []
+    pages_in_batch = 0
+    for part in parts:
+        part_pages = part[1] - part[0]
+        if not batches or pages_in_batch + part_pages > max(1, batch_pages):
+            batches.append([])
+            pages_in_batch = 0
+        batches[-1].append(part)
+        pages_in_batch += part_pages
+    return batches
+
+
+def split_pages(source, pdf_reader: PdfReader, parts: List[PageRange], workers: int) -> Iterator[bytes]:
+    """
+    Yield the PDFs of the parts of the source, in order
+    
+    With more than one worker and more than SPLIT_RANGE_PAGES pages to write,
+    batches of parts are serialised concurrently in a process pool
+    (ordered_pool_map, so finished parts waiting to be zipped stay bounded);
+    otherwise inline.
+    """
+    batches = part_batches(parts, settings.split_range_pages)
+    if workers <= 1 or len(batches) <= 1:
+        for part in parts:
+            yield part_pdf(pdf_reader, part)
+        return
+    
+    # Workers open the source by path: copy the spooled input to a named file,
+    # closed before they start (Windows cannot reopen a delete-on-close file)
+    descriptor, shared_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(descriptor, "wb") as shared_source:
+            source.stream.seek(0)
+            shutil.copyfileobj(source.stream, shared_source)
+        
+        workers = min(workers, len(batches))
+        for _, part_pdfs in ordered_pool_map(partial(split_page_ranges, shared_path), batches, workers):
+            yield from part_pdfs
+    finally:
+        # The pool has shut down: no worker holds the file open any more
+        os.remove(shared_path)
+
+
 def split_pdfs(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
     """
-    Split a PDF file into individual pages and create a ZIP archive
+    Split a PDF file into individual pages (or ranges, chunks, bookmarked
+    sections) and create a ZIP archive
     
     Args:
-        args: Dict containing 'file_id' - GridFS file ID of the PDF to split
+        args: Dict containing 'file_id' - GridFS file ID of the PDF to split,
+              optional 'mode' (see SPLIT_MODES, default "pages"), 'ranges'
+              (e.g. "1-3,10-20,25", 1-based) and 'chunk_size' (chunks mode)
         db: MongoDB database connection
         fs: GridFS instance for tmp_files bucket
         
     Returns:
-        Dict containing 'output_file_id' of the resulting ZIP archive
+        Dict containing 'output_file_id' of the resulting ZIP archive (or of
+        its manifest, with the parts in 'part_file_ids' and 'split_files')
     """
     
     file_id_str = args.get("file_id")
     if not file_id_str:
         raise ValueError("No file_id provided for PDF split")
     
-    logger.info(f"Starting PDF split for file: {file_id_str}")
+    mode = args.get("mode") or "pages"
+    logger.info(f"Starting PDF split ({mode}) for file: {file_id_str}")
     
-    # Convert string ID to ObjectId
-    try:
-        file_id = ObjectId(file_id_str)
-    except Exception as e:
-        raise ValueError(f"Invalid file ID '{file_id_str}': {str(e)}")
-    
-    # Download PDF from GridFS
-    try:
-        grid_file = fs.get(file_id)
-        file_content = grid_file.read()
-        original_filename = grid_file.filename or "document.pdf"
-        logger.info(f"Downloaded {original_filename} ({len(file_content)} bytes)")
-    except gridfs.NoFile:
-        raise ValueError(f"File with ID '{file_id_str}' not found in GridFS")
-    except Exception as e:
-        raise ValueError(f"Failed to download file '{file_id_str}': {str(e)}")
+    # Spool PDF from GridFS to a local seekable file (kept open while splitting)
+    with open_input(fs, file_id_str) as source:
+        original_filename = source.filename or "document.pdf"
+        return _split_source(fs, source, original_filename, mode, args.get("ranges"), args.get("chunk_size"))
+
+
+def _split_source(fs: gridfs.GridFS, source, original_filename: str, mode: str = "pages",
+                  ranges: Optional[str] = None, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """Split an opened input PDF into parts, stored in GridFS as separate files or as one ZIP"""
+    file_id_str = source.file_id
     
     # Read PDF content
     try:
-        pdf_buffer = io.BytesIO(file_content)
-        pdf_reader = PdfReader(pdf_buffer)
+        pdf_reader = PdfReader(source.stream)
         total_pages = len(pdf_reader.pages)
         
         logger.info(f"PDF has {total_pages} pages to split")
@@ -65,84 +288,156 @@ def split_pdfs(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
     except Exception as e:
         raise ValueError(f"Failed to read PDF file: {str(e)}")
     
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
-    split_files_info = []
+    # Only the pages of these parts are read and serialised
+    parts, titles = split_parts(mode, pdf_reader, total_pages, ranges, chunk_size)
+    selected_pages = sum(end - start for start, end in parts)
+    logger.info(f"Writing {len(parts)} part(s) with {selected_pages} of {total_pages} pages")
+    
+    # Generate filename for ZIP
+    base_name = original_filename.rsplit('.', 1)[0]  # Remove .pdf extension
+    if mode == "pages":
+        zip_filename = f"{base_name}_split_{len(parts)}_pages.zip"
+    else:
+        zip_filename = f"{base_name}_split_{len(parts)}_parts.zip"
+    
+    workers = split_workers()
+    if selected_pages > settings.split_range_pages:
+        logger.info(f"Splitting pages with up to {workers} worker(s)")
+    
+    if settings.split_output not in SPLIT_OUTPUTS:
+        raise ValueError(f"Unknown SPLIT_OUTPUT '{settings.split_output}' (expected one of {', '.join(SPLIT_OUTPUTS)})")
+    
+    split_files_info: List[Dict[str, Any]] = []
+    metadata = {
+        "original_file": {
+            "id": file_id_str,
+            "filename": original_filename,
+            "size": source.size
+        },
+        "split_type": "pdf_split",
+        "split_mode": mode,
+        "total_pages": total_pages,
+        "split_files": split_files_info
+    }
     
     try:
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Split each page into a separate PDF
-            for page_num in range(total_pages):
-                logger.info(f"Processing page {page_num + 1}/{total_pages}")
-                
-                # Create a new PDF with just this page
-                pdf_writer = PdfWriter()
-                pdf_writer.add_page(pdf_reader.pages[page_num])
-                
-                # Write page PDF to buffer
-                page_buffer = io.BytesIO()
-                pdf_writer.write(page_buffer)
-                page_content = page_buffer.getvalue()
-                
-                # Generate filename for this page
-                base_name = original_filename.rsplit('.', 1)[0]  # Remove .pdf extension
-                page_filename = f"{base_name}_page_{page_num + 1:03d}.pdf"
-                
-                # Add to ZIP
-                zip_file.writestr(page_filename, page_content)
-                
-                split_files_info.append({
-                    "page_number": page_num + 1,
-                    "filename": page_filename,
-                    "size_bytes": len(page_content)
-                })
-                
-                logger.info(f"Added {page_filename} ({len(page_content)} bytes) to ZIP")
-        
-        # Get ZIP content
-        zip_content = zip_buffer.getvalue()
-        logger.info(f"ZIP archive created successfully ({len(zip_content)} bytes, {total_pages} files)")
+        # Pages arrive in order, a few ranges at a time
+        with closing(split_pages(source, pdf_reader, parts, workers)) as part_contents:
+            named_parts = _named_parts(base_name, mode, parts, titles, part_contents)
+            if settings.split_output == "zip":
+                zip_file_id, zip_size = _write_zip(fs, zip_filename, named_parts, split_files_info, metadata)
+                part_file_ids = None
+            else:
+                zip_file_id, zip_size, part_file_ids = _write_parts(fs, zip_filename, named_parts,
+                                                                    split_files_info, metadata)
         
-        # Generate filename for ZIP
-        base_name = original_filename.rsplit('.', 1)[0]
-        zip_filename = f"{base_name}_split_{total_pages}_pages.zip"
-        
-        # Upload ZIP to GridFS
-        zip_file_id = fs.put(
-            zip_content,
-            filename=zip_filename,
-            content_type="application/zip",
-            metadata={
-                "original_file": {
-                    "id": file_id_str,
-                    "filename": original_filename,
-                    "size": len(file_content)
-                },
-                "split_type": "pdf_split",
-                "total_pages": total_pages,
-                "split_files": split_files_info
-            }
-        )
-        
-        logger.info(f"ZIP archive uploaded to GridFS with ID: {zip_file_id}")
+        logger.info(f"Split result stored in GridFS with ID: {zip_file_id} ({zip_size} bytes as ZIP, {len(parts)} files)")
         
         # Return success result with standardized field names
-        return {
+        result = {
             "success": True,
             "output_file_id": str(zip_file_id),
             "output_filename": zip_filename,
+            "split_mode": mode,
             "total_pages": total_pages,
             "original_file": {
                 "id": file_id_str,
                 "filename": original_filename,
-                "size_bytes": len(file_content)
+                "size_bytes": source.size
             },
             "split_files": split_files_info,
-            "zip_size_bytes": len(zip_content)
+            "zip_size_bytes": zip_size
         }
+        if part_file_ids is not None:
+            # Listed so the result cache and cleanup treat the parts with the manifest
+            result["part_file_ids"] = part_file_ids
+        return result
         
     except Exception as e:
         # Ensure proper error handling
         logger.error(f"PDF split failed: {str(e)}")
         logger.exception("Full exception details:")
         raise  # Re-raise to be caught by myshell.py
+
+
+def _named_parts(base_name: str, mode: str, parts: List[PageRange], titles: List[Optional[str]],
+                 part_contents: Iterator[bytes]) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+    """Yield (split_files entry, PDF) for every part, reporting progress in bytes of parts written"""
+    bytes_written = 0
+    for part_index, ((start, end), page_content) in enumerate(zip(parts, part_contents)):
+        logger.info(f"Processing part {part_index + 1}/{len(parts)} (pages {start + 1}-{end})")
+        
+        # Generate filename for this part
+        if mode == "pages":
+            page_filename = f"{base_name}_page_{start + 1:03d}.pdf"
+        else:
+            page_filename = f"{base_name}_pages_{start + 1:03d}-{end:03d}.pdf"
+        
+        file_info = {
+            "page_number": start + 1,
+            "page_count": end - start,
+            "filename": page_filename,
+            "size_bytes": len(page_content)
+        }
+        if titles[part_index]:
+            file_info["title"] = titles[part_index]
+        yield file_info, page_content
+        
+        bytes_written += len(page_content)
+        report_progress("splitting", part_index + 1, len(parts), bytes_written)
+
+
+def _write_zip(fs: gridfs.GridFS, zip_filename: str, named_parts, split_files_info: List[Dict[str, Any]],
+               metadata: Dict[str, Any]) -> Tuple[Any, int]:
+    """Write the parts as one ZIP archive straight into GridFS; returns (file ID, size)"""
+    with open_output(fs, zip_filename, "application/zip") as output:
+        with ZipStreamWriter(output, settings.split_zip_min_deflate_gain) as zip_writer:
+            for file_info, page_content in named_parts:
+                entry = zip_writer.write(file_info["filename"], page_content)
+                file_info["compression"] = "stored" if entry.stored else "deflated"
+                split_files_info.append(file_info)
+                logger.info(f"Added {file_info['filename']} ({len(page_content)} bytes) to ZIP")
+        output.set_metadata(metadata)
+    return output.file_id, output.length
+
+
+def _write_parts(fs: gridfs.GridFS, zip_filename: str, named_parts, split_files_info: List[Dict[str, Any]],
+                 metadata: Dict[str, Any]) -> Tuple[Any, int, List[str]]:
+    """
+    Store every part as its own GridFS file, then an empty manifest file
+    listing them (with the sizes and CRCs the ZIP download is assembled from)
+    
+    Returns:
+        (manifest file ID, size of the assembled ZIP, part file IDs)
+    """
+    part_file_ids: List[str] = []
+    try:
+        for file_info, page_content in named_parts:
+            with open_output(fs, file_info["filename"], "application/pdf",
+                             metadata={"content_type": "application/pdf"}) as output:
+                output.write(page_content)
+            file_info["file_id"] = str(output.file_id)
+            file_info["crc32"] = zlib.crc32(page_content)
+            file_info["compression"] = "stored"
+            split_files_info.append(file_info)
+            part_file_ids.append(str(output.file_id))
+            logger.info(f"Stored {file_info['filename']} ({len(page_content)} bytes) as {output.file_id}")
+        
+        # The archive size depends on names and sizes only, not on entry dates
+        _, zip_size = stored_archive(
+            [(info["filename"], info["size_bytes"], info["crc32"], None) for info in split_files_info],
+            (1980, 1, 1, 0, 0, 0)
+        )
+        with open_output(fs, zip_filename, "application/zip", metadata={
+            **metadata,
+            "split_manifest": True,
+            "content_type": "application/zip",
+            "zip_size": zip_size
+        }) as manifest:
+            pass
+    except BaseException:
+        # Don't leave orphaned parts behind
+        for part_file_id in part_file_ids:
+            fs.delete(ObjectId(part_file_id))
+        raise
+    return manifest.file_id, zip_size, part_file_ids
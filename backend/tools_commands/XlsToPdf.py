@@ -1,22 +1,34 @@
 """
 XlsToPdf command handler
 Converts Excel files (.xls, .xlsx) to PDF format
+Workbooks are read in read-only (streaming) mode and each sheet is cut into
+render jobs of at most XLS_PART_ROWS rows, drawn as tables of
+XLS_TABLE_BLOCK_ROWS rows with a repeated header, so memory stays bounded and
+layout time grows linearly with rows. Large conversions group consecutive
+jobs into documents of up to XLS_PART_ROWS rows, render them in parallel
+across a process pool (XLS_RENDER_WORKERS) and join their pages in workbook
+order. Conversions of fewer than XLS_PARALLEL_MIN_ROWS rows (or with a single
+render worker) are laid out inline as one document, job by job, and stored
+exactly as rendered: starting the workers (and importing reportlab in each)
+would cost more than it saves. Styles come from the shared render profile
+(render_profile.py).
 """
 
 import io
 import logging
-from typing import Dict, Any, List
-from bson import ObjectId
+from itertools import chain, islice
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 import gridfs
 import openpyxl
 from openpyxl.utils import get_column_letter
 from PyPDF2 import PdfWriter, PdfReader
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
+from reportlab.platypus import BaseDocTemplate, NextPageTemplate, PageBreak, Paragraph, Spacer, Table
+from config import settings
+from .gridfs_io import open_input, open_output
+from .parallelism import ordered_pool_map, pool_workers
+from .progress import report_progress
+from .render_profile import RenderProfile, get_render_profile
 
 # Set up logging for this module
 logger = logging.getLogger('XlsToPdf')
@@ -24,6 +36,270 @@ logger = logging.getLogger('XlsToPdf')
 # Supported Excel formats
 SUPPORTED_EXCEL_FORMATS = {'.xls', '.xlsx', '.xlsm'}
 
+# A part of a sheet to render: 'title' (first part only), 'header', 'rows'
+# and 'block_rows'. Every part starts on a new page.
+SheetJob = Dict[str, Any]
+
+
+def clean_row(row) -> List[str]:
+    """Cell values as strings (None becomes an empty string)"""
+    return ['' if cell_value is None else str(cell_value) for cell_value in row]
+
+
+def sheet_jobs(title: str, rows: Iterable, part_rows: int, block_rows: int) -> Iterator[SheetJob]:
+    """
+    Cut the rows of one sheet (header first) into render jobs of at most part_rows rows
+    
+    Rows are consumed lazily, so only one part is held in memory at a time.
+    Yields nothing for an empty sheet.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = clean_row(header)
+    
+    part: List[List[str]] = []
+    part_title: Optional[str] = title
+    for row in rows:
+        if len(part) == part_rows:
+            # Only yielded once another row exists: no empty trailing part
+            yield {"title": part_title, "header": header, "rows": part, "block_rows": block_rows}
+            part_title = None
+            part = []
+        part.append(clean_row(row))
+    
+    yield {"title": part_title, "header": header, "rows": part, "block_rows": block_rows}
+
+
+def _job_flowables(job: SheetJob, profile: RenderProfile) -> Tuple[str, List[Any]]:
+    """Page orientation and flowables (title, table blocks) of one sheet part"""
+    header, rows = job["header"], job["rows"]
+    
+    # Read-only worksheets may yield ragged rows: pad to a common width
+    num_columns = max([len(header)] + [len(row) for row in rows])
+    header = header + [''] * (num_columns - len(header))
+    
+    # Determine page orientation based on number of columns
+    orientation = profile.orientation(num_columns)
+    col_widths = profile.column_widths(num_columns, profile.page_size(num_columns))
+    
+    elements = []
+    
+    # Add sheet title (first part of a sheet only)
+    if job["title"]:
+        elements.append(Paragraph(job["title"], profile.title_style))
+        elements.append(Spacer(1, 0.2*inch))
+    
+    # Create one table per block of rows, each repeating the header
+    block_rows = job["block_rows"]
+    for start in range(0, max(len(rows), 1), block_rows):
+        block = [row + [''] * (num_columns - len(row)) for row in rows[start:start + block_rows]]
+        table = Table([header] + block, colWidths=col_widths, repeatRows=1)
+        table.setStyle(profile.table_style)
+        elements.append(table)
+    
+    return orientation, elements
+
+
+class _FlowableStream(list):
+    """
+    Flowables handed to reportlab's build() as they are produced
+    
+    build() checks len() before taking each flowable, so refilling the list
+    there from an iterator of chunks keeps only the current sheet part's
+    flowables in memory instead of the whole document's.
+    """
+    
+    def __init__(self, chunks: Iterator[List[Any]]):
+        super().__init__()
+        self._chunks = chunks
+    
+    def __len__(self) -> int:
+        while not list.__len__(self):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self.extend(chunk)
+        return list.__len__(self)
+
+
+def render_batch(jobs: Iterable[SheetJob], profile: Optional[RenderProfile] = None) -> Tuple[bytes, int]:
+    """
+    Render consecutive sheet parts into one PDF document
+    
+    Each part starts on a new page, in portrait or landscape as its width
+    requires. Tables are drawn in blocks of job['block_rows'] rows: reportlab's
+    layout of one huge table is superlinear, of fixed-size blocks linear.
+    Parts are laid out as they are pulled from jobs, so only one part's rows
+    and flowables are held at a time. In a render worker process it is given
+    a list (picklable data in and out). Styles come from the process-wide
+    render profile unless one is given.
+    
+    Returns:
+        (PDF content, page count)
+    """
+    profile = profile or get_render_profile()
+    
+    # The first part decides the orientation of the first page template
+    jobs = iter(jobs)
+    first_part = [_job_flowables(job, profile) for job in islice(jobs, 1)]
+    first_orientation = first_part[0][0] if first_part else "portrait"
+    
+    def chunks() -> Iterator[List[Any]]:
+        if first_part:
+            yield first_part.pop()[1]
+        for job in jobs:
+            orientation, flowables = _job_flowables(job, profile)
+            yield [NextPageTemplate(orientation), PageBreak()] + flowables
+    
+    # Create PDF for these sheets
+    pdf_buffer = io.BytesIO()
+    doc = BaseDocTemplate(
+        pdf_buffer,
+        pageTemplates=profile.page_templates(first_orientation),
+        leftMargin=profile.left_margin,
+        rightMargin=profile.right_margin,
+        topMargin=profile.top_margin,
+        bottomMargin=profile.bottom_margin
+    )
+    
+    # Build PDF
+    doc.build(_FlowableStream(chunks()))
+    return pdf_buffer.getvalue(), doc.page
+
+
+def batch_jobs(jobs: Iterable[SheetJob], max_rows: int) -> Iterator[List[SheetJob]]:
+    """
+    Group consecutive sheet parts into batches of at most max_rows rows
+    
+    Many small sheets share one document (and its fixed cost) while a full
+    part stays on its own; parts are never split or reordered.
+    """
+    batch: List[SheetJob] = []
+    batch_rows = 0
+    for job in jobs:
+        job_rows = max(len(job["rows"]), 1)
+        if batch and batch_rows + job_rows > max_rows:
+            yield batch
+            batch, batch_rows = [], 0
+        batch.append(job)
+        batch_rows += job_rows
+    if batch:
+        yield batch
+
+
+def render_workers() -> int:
+    """Render processes to use (XLS_RENDER_WORKERS, 0 = the command's share of the cores)"""
+    return pool_workers(settings.xls_render_workers)
+
+
+def _batch_rows(batch: List[SheetJob]) -> int:
+    """Rows of a batch, counted as in batch_jobs"""
+    return sum(max(len(job["rows"]), 1) for job in batch)
+
+
+def render_batches(batches: Iterable[List[SheetJob]], workers: int,
+                   min_rows: int = 0) -> Iterator[Tuple[List[Optional[str]], bytes, int]]:
+    """
+    Render batches of sheet parts, yielding (part titles, PDF, page count) in order
+    
+    Batches are pulled lazily. With more than one worker and more than one
+    batch holding at least min_rows rows in total, they are rendered
+    concurrently in a process pool (ordered_pool_map, so the rows waiting to
+    be rendered stay bounded), one document per batch. Otherwise every part
+    is laid out inline into a single document, yielded once. Only the batches
+    needed to reach min_rows are read ahead to decide.
+    """
+    batches = iter(batches)
+    first_batches: List[List[SheetJob]] = []
+    first_rows = 0
+    for batch in batches:
+        first_batches.append(batch)
+        first_rows += _batch_rows(batch)
+        if len(first_batches) > 1 and first_rows >= min_rows:
+            break
+    batches = chain(first_batches, batches)
+    if workers <= 1 or len(first_batches) <= 1 or first_rows < min_rows:
+        if not first_batches:
+            return
+        # One document: nothing to parse back and join page by page
+        titles: List[Optional[str]] = []
+        
+        def parts() -> Iterator[SheetJob]:
+            sheets = 0
+            for batch in batches:
+                for job in batch:
+                    titles.append(job["title"])
+                    if job["title"]:
+                        sheets += 1
+                        report_progress("rendering", sheets)
+                    yield job
+        
+        pdf_content, page_count = render_batch(parts())
+        yield titles, pdf_content, page_count
+        return
+    
+    for batch, (pdf_content, page_count) in ordered_pool_map(render_batch, batches, workers):
+        yield [job["title"] for job in batch], pdf_content, page_count
+
+
+def _workbook_jobs(fs: gridfs.GridFS, file_ids: List[str], processed_files: List[Dict[str, Any]]) -> Iterator[SheetJob]:
+    """
+    Stream the render jobs of every sheet of every workbook, in order
+    
+    Workbooks are opened in read-only mode: rows are parsed from the file as
+    they are consumed instead of loading the whole workbook.
+    """
+    part_rows = settings.xls_part_rows
+    block_rows = settings.xls_table_block_rows
+    bytes_processed = 0
+    
+    for i, file_id_str in enumerate(file_ids):
+        logger.info(f"Processing file {i+1}/{len(file_ids)}: {file_id_str}")
+        
+        # Spool file from GridFS to a local seekable file
+        with open_input(fs, file_id_str) as source:
+            processed_files.append({
+                "id": file_id_str,
+                "filename": source.filename,
+                "size": source.size
+            })
+            
+            try:
+                # Load Excel file using openpyxl (streaming)
+                workbook = openpyxl.load_workbook(source.stream, read_only=True, data_only=True)
+            except Exception as e:
+                raise ValueError(f"Failed to convert Excel file '{source.filename}' to PDF: {str(e)}")
+            
+            try:
+                logger.info(f"Excel file loaded. Sheets: {workbook.sheetnames}")
+                
+                # Process each sheet
+                for sheet_index, sheet_name in enumerate(workbook.sheetnames):
+                    logger.info(f"Processing sheet {sheet_index + 1}/{len(workbook.sheetnames)}: {sheet_name}")
+                    
+                    parts = 0
+                    for job in sheet_jobs(f"{source.filename} - {sheet_name}",
+                                          workbook[sheet_name].iter_rows(values_only=True),
+                                          part_rows, block_rows):
+                        parts += 1
+                        yield job
+                    
+                    if parts == 0:
+                        logger.info(f"Skipping empty sheet: {sheet_name}")
+            except Exception as e:
+                logger.error(f"Failed to convert Excel file '{source.filename}': {str(e)}")
+                logger.exception("Full exception details:")
+                raise ValueError(f"Failed to convert Excel file '{source.filename}' to PDF: {str(e)}")
+            finally:
+                workbook.close()
+            
+            logger.info(f"Completed processing {source.filename}")
+            bytes_processed += source.size
+            report_progress("converting", i + 1, len(file_ids), bytes_processed)
+
+
 def xls_to_pdf(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
     """
     Convert multiple Excel files from GridFS to PDF and merge into a single PDF
@@ -32,7 +308,7 @@ def xls_to_pdf(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
         args: Dict containing 'file_ids' - list of GridFS file IDs
         db: MongoDB database connection
         fs: GridFS instance for tmp_files bucket
-        
+    
     Returns:
         Dict containing 'merged_file_id' of the resulting merged PDF
     """
@@ -49,181 +325,31 @@ def xls_to_pdf(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
     total_sheets_converted = 0
     
     try:
-        # Process each Excel file
-        for i, file_id_str in enumerate(file_ids):
-            logger.info(f"Processing file {i+1}/{len(file_ids)}: {file_id_str}")
-            
-            # Convert string ID to ObjectId
-            try:
-                file_id = ObjectId(file_id_str)
-            except Exception as e:
-                raise ValueError(f"Invalid file ID '{file_id_str}': {str(e)}")
-            
-            # Download file from GridFS
-            try:
-                grid_file = fs.get(file_id)
-                file_content = grid_file.read()
-                processed_files.append({
-                    "id": file_id_str,
-                    "filename": grid_file.filename,
-                    "size": len(file_content)
-                })
-                logger.info(f"Downloaded {grid_file.filename} ({len(file_content)} bytes)")
-            except gridfs.NoFile:
-                raise ValueError(f"File with ID '{file_id_str}' not found in GridFS")
-            except Exception as e:
-                raise ValueError(f"Failed to download file '{file_id_str}': {str(e)}")
-            
-            # Convert Excel to PDF pages
-            try:
-                # Load Excel file using openpyxl
-                excel_buffer = io.BytesIO(file_content)
-                workbook = openpyxl.load_workbook(excel_buffer, data_only=True)
-                
-                logger.info(f"Excel file loaded. Sheets: {workbook.sheetnames}")
-                
-                # Process each sheet
-                for sheet_index, sheet_name in enumerate(workbook.sheetnames):
-                    logger.info(f"Processing sheet {sheet_index + 1}/{len(workbook.sheetnames)}: {sheet_name}")
-                    
-                    sheet = workbook[sheet_name]
-                    
-                    # Skip empty sheets
-                    if sheet.max_row == 0 or sheet.max_column == 0:
-                        logger.info(f"Skipping empty sheet: {sheet_name}")
-                        continue
-                    
-                    # Extract data from sheet
-                    data = []
-                    for row in sheet.iter_rows(values_only=True):
-                        # Convert None values to empty strings and handle all types
-                        cleaned_row = []
-                        for cell_value in row:
-                            if cell_value is None:
-                                cleaned_row.append('')
-                            else:
-                                cleaned_row.append(str(cell_value))
-                        data.append(cleaned_row)
-                    
-                    if not data:
-                        logger.info(f"No data in sheet: {sheet_name}")
-                        continue
-                    
-                    logger.info(f"Extracted {len(data)} rows from sheet {sheet_name}")
-                    
-                    # Create PDF for this sheet
-                    pdf_buffer = io.BytesIO()
-                    
-                    # Determine page orientation based on number of columns
-                    num_columns = len(data[0]) if data else 0
-                    if num_columns > 8:
-                        pagesize = landscape(A4)
-                    else:
-                        pagesize = A4
-                    
-                    doc = SimpleDocTemplate(
-                        pdf_buffer,
-                        pagesize=pagesize,
-                        leftMargin=0.5*inch,
-                        rightMargin=0.5*inch,
-                        topMargin=0.75*inch,
-                        bottomMargin=0.5*inch
-                    )
-                    
-                    # Build PDF content
-                    elements = []
-                    styles = getSampleStyleSheet()
-                    
-                    # Add sheet title
-                    title_style = ParagraphStyle(
-                        'SheetTitle',
-                        parent=styles['Heading1'],
-                        fontSize=14,
-                        textColor=colors.HexColor('#1a56db'),
-                        spaceAfter=12,
-                        alignment=TA_CENTER
-                    )
-                    
-                    title_text = f"{grid_file.filename} - {sheet_name}"
-                    elements.append(Paragraph(title_text, title_style))
-                    elements.append(Spacer(1, 0.2*inch))
-                    
-                    # Calculate column widths dynamically
-                    page_width = pagesize[0] - doc.leftMargin - doc.rightMargin
-                    col_width = page_width / num_columns if num_columns > 0 else page_width
-                    
-                    # Limit column width for readability
-                    max_col_width = 2.5 * inch
-                    min_col_width = 0.5 * inch
-                    col_width = max(min_col_width, min(col_width, max_col_width))
-                    
-                    col_widths = [col_width] * num_columns
-                    
-                    # Create table
-                    table = Table(data, colWidths=col_widths, repeatRows=1)
-                    
-                    # Style the table
-                    table_style = TableStyle([
-                        # Header row styling
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a56db')),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, 0), 10),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('TOPPADDING', (0, 0), (-1, 0), 12),
-                        
-                        # Body styling
-                        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                        ('FONTSIZE', (0, 1), (-1, -1), 8),
-                        ('TOPPADDING', (0, 1), (-1, -1), 6),
-                        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                        
-                        # Grid
-                        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                        
-                        # Alternating row colors
-                        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')])
-                    ])
-                    
-                    table.setStyle(table_style)
-                    elements.append(table)
-                    
-                    # Add page break if not the last sheet
-                    if sheet_index < len(workbook.sheetnames) - 1:
-                        elements.append(PageBreak())
-                    
-                    # Build PDF
-                    doc.build(elements)
-                    
-                    # Read the created PDF
-                    pdf_buffer.seek(0)
-                    sheet_pdf = PdfReader(pdf_buffer)
-                    
-                    # Add all pages from this sheet to the merged PDF
-                    for page in sheet_pdf.pages:
-                        pdf_writer.add_page(page)
-                    
-                    total_sheets_converted += 1
-                    logger.info(f"Successfully converted sheet {sheet_name} to PDF ({len(sheet_pdf.pages)} pages)")
-                
-                workbook.close()
-                logger.info(f"Completed processing {grid_file.filename}")
-                
-            except Exception as e:
-                logger.error(f"Failed to convert Excel file '{grid_file.filename}': {str(e)}")
-                logger.exception("Full exception details:")
-                raise ValueError(f"Failed to convert Excel file '{grid_file.filename}' to PDF: {str(e)}")
+        # Read, render (in parallel) and collect sheet parts in workbook order
+        workers = render_workers()
+        logger.info(f"Rendering sheets with up to {workers} worker(s)")
+        jobs = _workbook_jobs(fs, file_ids, processed_files)
+        rendered = render_batches(batch_jobs(jobs, settings.xls_part_rows), workers, settings.xls_parallel_min_rows)
         
-        # Create merged PDF in memory
-        merged_buffer = io.BytesIO()
-        pdf_writer.write(merged_buffer)
-        merged_content = merged_buffer.getvalue()
+        # An inline conversion is a single document, stored exactly as rendered;
+        # pooled batches are joined by appending their page objects (content
+        # streams are copied as is)
+        first_batches = list(islice(rendered, 2))
+        single_document = len(first_batches) == 1
+        total_pages = 0
         
-        logger.info(f"Merged PDF created successfully ({len(merged_content)} bytes, {total_sheets_converted} sheets)")
+        for titles, batch_content, page_count in chain(first_batches, rendered):
+            if not single_document:
+                for page in PdfReader(io.BytesIO(batch_content)).pages:
+                    pdf_writer.add_page(page)
+            
+            total_pages += page_count
+            for title in titles:
+                if title:
+                    total_sheets_converted += 1
+                    logger.info(f"Successfully converted sheet {title} to PDF")
+            logger.info(f"Rendered {len(titles)} sheet part(s) ({page_count} pages)")
+            report_progress("rendering", total_sheets_converted)
         
         # Generate filename for merged PDF
         if len(file_ids) == 1:
@@ -231,32 +357,33 @@ def xls_to_pdf(args: Dict[str, Any], db, fs: gridfs.GridFS) -> Dict[str, Any]:
         else:
             merged_filename = f"excel_to_pdf_{len(file_ids)}_files.pdf"
         
-        # Upload merged PDF to GridFS
-        merged_file_id = fs.put(
-            merged_content,
-            filename=merged_filename,
-            content_type="application/pdf",
-            metadata={
-                "original_files": processed_files,
-                "conversion_type": "excel_to_pdf",
-                "total_pages": len(pdf_writer.pages),
-                "total_sheets_converted": total_sheets_converted
-            }
-        )
+        # Write merged PDF straight into GridFS
+        report_progress("writing")
+        with open_output(fs, merged_filename, "application/pdf", metadata={
+            "original_files": processed_files,
+            "conversion_type": "excel_to_pdf",
+            "total_pages": total_pages,
+            "total_sheets_converted": total_sheets_converted
+        }) as output:
+            if single_document:
+                output.write(first_batches[0][1])
+            else:
+                pdf_writer.write(output)
         
-        logger.info(f"Merged PDF uploaded to GridFS with ID: {merged_file_id}")
+        merged_file_id = output.file_id
+        logger.info(f"Merged PDF uploaded to GridFS with ID: {merged_file_id} ({output.length} bytes)")
         
         # Return success result
         return {
             "success": True,
             "merged_file_id": str(merged_file_id),
             "merged_filename": merged_filename,
-            "total_pages": len(pdf_writer.pages),
+            "total_pages": total_pages,
             "total_sheets_converted": total_sheets_converted,
             "original_files": processed_files,
-            "merged_size_bytes": len(merged_content)
+            "merged_size_bytes": output.length
         }
-        
+    
     except Exception as e:
         # Ensure proper error handling
         logger.error(f"Excel to PDF conversion failed: {str(e)}")
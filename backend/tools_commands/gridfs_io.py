@@ -0,0 +1,121 @@
+"""
+Streaming GridFS I/O for command handlers
+Inputs are copied chunk by chunk into a spooled temporary file (in memory up to
+SPOOL_MAX_MEMORY, on disk above) so PyPDF2, Pillow and openpyxl get a seekable
+file without the whole upload being held in a bytes object. Outputs are written
+straight into a GridFS file, which flushes one chunk at a time.
+"""
+
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from bson import ObjectId
+import gridfs
+
+# Set up logging for this module
+logger = logging.getLogger('gridfs_io')
+
+# Inputs up to this size stay in memory, larger ones are spilled to a temp file
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+
+class GridFSInput:
+    """A GridFS file copied into a local, seekable file ('stream')"""
+
+    def __init__(self, file_id: str, filename: Optional[str], size: int, stream):
+        self.file_id = file_id
+        self.filename = filename
+        self.size = size
+        self.stream = stream
+
+
+class GridFSOutput:
+    """
+    Write-only file object over a GridFS upload
+
+    Provides the tell() that PdfWriter and ZipFile need (GridIn has none);
+    ZipFile falls back to data descriptors because there is no seek().
+    """
+
+    def __init__(self, grid_in):
+        self._grid_in = grid_in
+        self._position = 0
+
+    @property
+    def file_id(self) -> ObjectId:
+        return self._grid_in._id
+
+    @property
+    def length(self) -> int:
+        return self._position
+
+    def write(self, data) -> int:
+        self._grid_in.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        # GridIn flushes full chunks by itself, the rest on close
+        pass
+
+    def set_metadata(self, metadata: Dict[str, Any]):
+        """Replace the file metadata (stored when the upload is closed)"""
+        self._grid_in.metadata = metadata
+
+
+@contextmanager
+def open_input(fs: gridfs.GridFS, file_id_str: str) -> Iterator[GridFSInput]:
+    """
+    Spool a GridFS file into a local seekable file, removed when the block exits
+
+    Raises:
+        ValueError: invalid ID, missing file or download failure
+    """
+    try:
+        file_id = ObjectId(file_id_str)
+    except Exception as e:
+        raise ValueError(f"Invalid file ID '{file_id_str}': {str(e)}")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        try:
+            grid_out = fs.get(file_id)
+            while True:
+                chunk = grid_out.readchunk()
+                if not chunk:
+                    break
+                spool.write(chunk)
+            spool.seek(0)
+        except gridfs.NoFile:
+            raise ValueError(f"File with ID '{file_id_str}' not found in GridFS")
+        except Exception as e:
+            raise ValueError(f"Failed to download file '{file_id_str}': {str(e)}")
+
+        logger.info(f"Downloaded {grid_out.filename} ({grid_out.length} bytes)")
+        yield GridFSInput(file_id_str, grid_out.filename, grid_out.length, spool)
+    finally:
+        spool.close()
+
+
+@contextmanager
+def open_output(fs: gridfs.GridFS, filename: str, content_type: str,
+                metadata: Optional[Dict[str, Any]] = None) -> Iterator[GridFSOutput]:
+    """
+    Write a new GridFS file chunk by chunk
+
+    The file is committed when the block exits normally and aborted (its
+    chunks deleted) when it raises.
+    """
+    grid_in = fs.new_file(filename=filename, content_type=content_type, metadata=metadata or {})
+    output = GridFSOutput(grid_in)
+    try:
+        yield output
+    except BaseException:
+        grid_in.abort()
+        raise
+    grid_in.close()
+    logger.info(f"Uploaded {filename} to GridFS ({output.length} bytes)")
@@ -0,0 +1,61 @@
+"""
+Process budget of command handlers
+Handlers that start their own process pool (SplitPdfs, XlsToPdf) run next to
+other commands: up to SCHEDULER_MAX_CONCURRENT at a time, and no more than
+WORKER_POOL_SIZE when commands run in the worker pool. A pool of one process
+per core in every one of them would oversubscribe the node, so by default a
+command gets its share of the cores instead. ordered_pool_map runs their
+work in such a pool with bounded read-ahead and results in input order.
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar
+from config import settings
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+def concurrent_commands() -> int:
+    """Commands this node runs at the same time"""
+    concurrent = settings.scheduler_max_concurrent
+    if settings.command_execution_backend != "subprocess":
+        concurrent = min(concurrent, settings.worker_pool_size)
+    return max(1, concurrent)
+
+
+def command_cpu_share() -> int:
+    """Cores available to one command (at least one)"""
+    return max(1, (os.cpu_count() or 1) // concurrent_commands())
+
+
+def pool_workers(configured: int) -> int:
+    """Processes for a handler's pool: the configured count, or the command's core share when 0"""
+    return max(1, configured or command_cpu_share())
+
+
+def ordered_pool_map(fn: Callable[[Item], Result], items: Iterable[Item], workers: int,
+                     in_flight: int = 2) -> Iterator[Tuple[Item, Result]]:
+    """
+    Run fn on every item in a process pool, yielding (item, result) in input order
+    
+    Items are pulled lazily and at most in_flight per worker are submitted
+    ahead of the consumer, so inputs and finished results waiting to be
+    consumed stay bounded. The pool is spawned, not forked: the caller may
+    hold MongoDB connections. fn must be picklable (a module-level function
+    or a functools.partial of one).
+    """
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Futures are consumed in submission order whatever order they finish in
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(fn, item)))
+            if len(pending) >= workers * in_flight:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
@@ -0,0 +1,166 @@
+"""
+Identical object deduplication for PdfWriter
+PyPDF2 clones every page's resources into the writer per source document, so
+fonts, images and ICC profiles shared by the inputs (or a file merged twice)
+end up in the output once per copy. deduplicate_objects hashes the indirect
+objects of a writer and keeps one of each, repeating until objects that only
+differed in references to duplicates are merged too, then renumbers what is
+left so the writer's xref table stays consecutive.
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, List, Set
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+# Set up logging for this module
+logger = logging.getLogger('pdf_dedup')
+
+# Objects that must stay distinct even when identical (a page can only appear
+# once in the tree, an annotation in the /Annots of one page only)
+KEPT_TYPES = ("/Page", "/Pages", "/Catalog", "/Annot")
+
+
+class _HashWriter:
+    """Stream stand-in that feeds write_to_stream output into a hash"""
+    
+    def __init__(self, digest):
+        self.digest = digest
+    
+    def write(self, data: bytes):
+        self.digest.update(data)
+
+
+def _kept(mapping: Dict[int, int], idnum: int) -> int:
+    """Number of the object kept for idnum (a kept object may be merged in a later pass)"""
+    while idnum in mapping:
+        idnum = mapping[idnum]
+    return idnum
+
+
+def _update(digest, obj: Any, mapping: Dict[int, int], stream_digests: Dict[int, bytes]):
+    """Feed a canonical form of obj into digest, references replaced by their kept object"""
+    if isinstance(obj, IndirectObject):
+        digest.update(b"R%d;" % _kept(mapping, obj.idnum))
+    elif isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj):
+            digest.update(key.encode("utf-8", "surrogatepass") + b"=")
+            _update(digest, obj[key], mapping, stream_digests)
+        digest.update(b">>")
+        if isinstance(obj, StreamObject):
+            # Stream data never changes: hash it once
+            data_digest = stream_digests.get(id(obj))
+            if data_digest is None:
+                data_digest = stream_digests[id(obj)] = hashlib.sha256(obj._data).digest()
+            digest.update(b"stream" + data_digest)
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            _update(digest, item, mapping, stream_digests)
+            digest.update(b",")
+        digest.update(b"]")
+    else:
+        digest.update(type(obj).__name__.encode() + b":")
+        obj.write_to_stream(_HashWriter(digest), None)
+        digest.update(b";")
+
+
+def _annotation_ids(objects: List[Any]) -> Set[int]:
+    """Numbers of the objects listed in an /Annots array, with or without /Type /Annot"""
+    annotation_ids: Set[int] = set()
+    for obj in objects:
+        if not isinstance(obj, DictionaryObject) or "/Annots" not in obj:
+            continue
+        annots = obj.raw_get("/Annots")
+        if isinstance(annots, IndirectObject):
+            annots = objects[annots.idnum - 1]
+        if isinstance(annots, ArrayObject):
+            annotation_ids.update(item.idnum for item in annots if isinstance(item, IndirectObject))
+    return annotation_ids
+
+
+def _renumber(obj: Any, numbers: Dict[int, int], pdf_writer: PdfWriter) -> Any:
+    """Point the references in obj (recursively, in place) at their new object numbers"""
+    if isinstance(obj, IndirectObject):
+        return IndirectObject(numbers[obj.idnum], 0, pdf_writer)
+    if isinstance(obj, DictionaryObject):
+        for key, value in list(obj.items()):
+            if isinstance(value, (IndirectObject, DictionaryObject, ArrayObject)):
+                obj[key] = _renumber(value, numbers, pdf_writer)
+    elif isinstance(obj, ArrayObject):
+        for index, value in enumerate(obj):
+            if isinstance(value, (IndirectObject, DictionaryObject, ArrayObject)):
+                obj[index] = _renumber(value, numbers, pdf_writer)
+    return obj
+
+
+def deduplicate_objects(pdf_writer: PdfWriter) -> int:
+    """
+    Write identical indirect objects and streams of pdf_writer only once
+    
+    Call after the last page is added and before write(); the writer's object
+    list is rebuilt, so PageObjects taken from it earlier must not be reused.
+    
+    Returns:
+        Number of objects removed
+    """
+    objects: List[Any] = pdf_writer._objects
+    kept_ids = {pdf_writer._root.idnum, pdf_writer._info.idnum, pdf_writer._pages.idnum}
+    kept_ids |= _annotation_ids(objects)
+    candidates = [
+        idnum for idnum, obj in enumerate(objects, 1)
+        if obj is not None and idnum not in kept_ids
+        and not (isinstance(obj, DictionaryObject) and obj.get("/Type") in KEPT_TYPES)
+    ]
+    
+    # Duplicate object number -> number of the identical object kept
+    mapping: Dict[int, int] = {}
+    stream_digests: Dict[int, bytes] = {}
+    passes = 0
+    while True:
+        passes += 1
+        kept: Dict[bytes, int] = {}
+        merged = 0
+        for idnum in candidates:
+            digest = hashlib.sha256()
+            _update(digest, objects[idnum - 1], mapping, stream_digests)
+            key = digest.digest()
+            if key in kept:
+                mapping[idnum] = kept[key]
+                merged += 1
+            else:
+                kept[key] = idnum
+        if not merged:
+            break
+        # Objects referring to the duplicates just merged may be identical now
+        candidates = list(kept.values())
+    
+    if not mapping:
+        return 0
+    
+    # Keep the survivors in their order and number them consecutively
+    numbers: Dict[int, int] = {}
+    survivors: List[Any] = []
+    for idnum, obj in enumerate(objects, 1):
+        if idnum not in mapping:
+            survivors.append(obj)
+            numbers[idnum] = len(survivors)
+    for idnum in mapping:
+        numbers[idnum] = numbers[_kept(mapping, idnum)]
+    
+    for obj in survivors:
+        _renumber(obj, numbers, pdf_writer)
+        if getattr(obj, "indirect_reference", None) is not None:
+            obj.indirect_reference = IndirectObject(numbers[obj.indirect_reference.idnum], 0, pdf_writer)
+    pdf_writer._objects = survivors
+    pdf_writer._root = IndirectObject(numbers[pdf_writer._root.idnum], 0, pdf_writer)
+    pdf_writer._info = IndirectObject(numbers[pdf_writer._info.idnum], 0, pdf_writer)
+    pdf_writer._pages = IndirectObject(numbers[pdf_writer._pages.idnum], 0, pdf_writer)
+    pdf_writer._root_object = pdf_writer._root.get_object()
+    pdf_writer._idnum_hash = {}
+    pdf_writer._id_translated = {}
+    
+    logger.info(f"Removed {len(mapping)} duplicate objects of {len(objects)} ({passes} passes)")
+    return len(mapping)
@@ -0,0 +1,126 @@
+"""
+Progress reporting for command handlers
+Handlers call report_progress() at natural checkpoints; the executor
+(me_shell.py or the worker pool) installs a reporter for the running command
+that writes batched, rate-limited updates to the 'progress' field of its
+command document.
+"""
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional
+from bson import ObjectId
+
+# Set up logging for this module
+logger = logging.getLogger('progress')
+
+# Reporter of the command running in the current thread / context
+_current_reporter: contextvars.ContextVar = contextvars.ContextVar("progress_reporter", default=None)
+
+
+class ProgressReporter:
+    """
+    Collects progress updates of one command and writes at most one update
+    every min_interval seconds (stage changes and stage completion are
+    written immediately). Write errors are logged, never raised: progress
+    must not fail a command.
+    """
+
+    def __init__(self, collection, command_id: str, min_interval: float = 1.0):
+        self.collection = collection
+        self.command_id = command_id
+        self.min_interval = min_interval
+        self.stage: Optional[str] = None
+        self.items_done: Optional[int] = None
+        self.items_total: Optional[int] = None
+        self.bytes_processed: Optional[int] = None
+        self._stage_started = time.monotonic()
+        self._last_write = 0.0
+        self._pending = False
+
+    def report(self, stage: str, items_done: Optional[int] = None,
+               items_total: Optional[int] = None, bytes_processed: Optional[int] = None):
+        now = time.monotonic()
+        stage_changed = stage != self.stage
+        if stage_changed:
+            self.stage = stage
+            self._stage_started = now
+
+        self.items_done = items_done
+        self.items_total = items_total
+        if bytes_processed is not None:
+            self.bytes_processed = bytes_processed
+
+        stage_finished = items_total is not None and items_done == items_total
+        if stage_changed or stage_finished or now - self._last_write >= self.min_interval:
+            self._write(now)
+        else:
+            self._pending = True
+
+    def flush(self):
+        """Write the latest state if an update was held back by the rate limit"""
+        if self._pending:
+            self._write(time.monotonic())
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        """Progress document stored on the command"""
+        progress: Dict[str, Any] = {
+            "stage": self.stage,
+            "items_done": self.items_done,
+            "items_total": self.items_total,
+            "bytes_processed": self.bytes_processed,
+            "percent": None,
+            "eta_seconds": None,
+            "updated_at": datetime.utcnow()
+        }
+        if self.items_total and self.items_done is not None:
+            progress["percent"] = round(100 * self.items_done / self.items_total, 1)
+            if self.items_done > 0:
+                # Linear estimate from the pace of the current stage
+                elapsed = now - self._stage_started
+                remaining = self.items_total - self.items_done
+                progress["eta_seconds"] = round(elapsed / self.items_done * remaining, 1)
+        return progress
+
+    def _write(self, now: float):
+        self._last_write = now
+        self._pending = False
+        try:
+            self.collection.update_one(
+                {"_id": ObjectId(self.command_id)},
+                {"$set": {"progress": self.snapshot(now)}}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to store progress of command {self.command_id}: {e}")
+
+
+@contextmanager
+def progress_reporting(collection, command_id: str, min_interval: float = 1.0):
+    """Install a reporter for the command executed inside the with block"""
+    reporter = ProgressReporter(collection, command_id, min_interval)
+    token = _current_reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        reporter.flush()
+        _current_reporter.reset(token)
+
+
+def report_progress(stage: str, items_done: Optional[int] = None,
+                    items_total: Optional[int] = None, bytes_processed: Optional[int] = None):
+    """
+    Report handler progress (no-op when no reporter is installed)
+
+    Args:
+        stage: Short name of the current step (e.g. "reading", "writing")
+        items_done: Items (files, pages, sheets) finished in this stage
+        items_total: Items in this stage, if known
+        bytes_processed: Total bytes processed so far (input read, or output
+            written for stages such as splitting that emit parts)
+    """
+    reporter = _current_reporter.get()
+    if reporter is not None:
+        reporter.report(stage, items_done, items_total, bytes_processed)
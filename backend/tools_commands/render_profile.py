@@ -0,0 +1,146 @@
+"""
+Rendering profile for XlsToPdf
+Fonts, colours, paddings and page layout of the PDF tables, built once per
+process (API, worker or render worker) and shared by every sheet instead of
+rebuilding the reportlab styles for each one. Options can be overridden with
+XLS_RENDER_PROFILE (JSON object, see DEFAULT_PROFILE for the keys).
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Frame, PageTemplate, TableStyle
+from config import settings
+
+# Set up logging for this module
+logger = logging.getLogger('render_profile')
+
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "font": "Helvetica",
+    "header_font": "Helvetica-Bold",
+    "font_size": 8,
+    "header_font_size": 10,
+    "title_font_size": 14,
+    "accent_color": "#1a56db",  # Title and header background
+    "header_text_color": "#f5f5f5",
+    "stripe_color": "#f3f4f6",  # Every other body row
+    "grid_color": "#808080",
+    "grid_width": 0.5,
+    "cell_padding": 6,
+    "header_padding": 12,
+    "landscape_min_columns": 9,  # Sheets this wide are printed in landscape
+    "min_col_width": 0.5,  # Inches
+    "max_col_width": 2.5,  # Inches
+    "margins": [0.5, 0.5, 0.75, 0.5]  # Left, right, top, bottom in inches
+}
+
+
+class RenderProfile:
+    """Prebuilt reportlab styles and layout rules shared by all rendered sheets"""
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        options = options or {}
+        unknown = set(options) - set(DEFAULT_PROFILE)
+        if unknown:
+            raise ValueError(f"Unknown XLS render profile options: {sorted(unknown)}")
+        self.options = {**DEFAULT_PROFILE, **options}
+        opts = self.options
+
+        self.landscape_min_columns = opts["landscape_min_columns"]
+        self.left_margin, self.right_margin, self.top_margin, self.bottom_margin = (
+            margin * inch for margin in opts["margins"]
+        )
+        self._column_widths: Dict[Tuple[int, float], List[float]] = {}
+
+        accent = colors.HexColor(opts["accent_color"])
+        self.title_style = ParagraphStyle(
+            'SheetTitle',
+            parent=getSampleStyleSheet()['Heading1'],
+            fontSize=opts["title_font_size"],
+            textColor=accent,
+            spaceAfter=12,
+            alignment=TA_CENTER
+        )
+
+        # Row ranges are relative (0 = header, 1..-1 = body), so one style fits every table
+        self.table_style = TableStyle([
+            # Header row styling
+            ('BACKGROUND', (0, 0), (-1, 0), accent),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor(opts["header_text_color"])),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), opts["header_font"]),
+            ('FONTSIZE', (0, 0), (-1, 0), opts["header_font_size"]),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), opts["header_padding"]),
+            ('TOPPADDING', (0, 0), (-1, 0), opts["header_padding"]),
+
+            # Body styling
+            ('FONTNAME', (0, 1), (-1, -1), opts["font"]),
+            ('FONTSIZE', (0, 1), (-1, -1), opts["font_size"]),
+            ('TOPPADDING', (0, 1), (-1, -1), opts["cell_padding"]),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), opts["cell_padding"]),
+            ('LEFTPADDING', (0, 0), (-1, -1), opts["cell_padding"]),
+            ('RIGHTPADDING', (0, 0), (-1, -1), opts["cell_padding"]),
+
+            # Grid
+            ('GRID', (0, 0), (-1, -1), opts["grid_width"], colors.HexColor(opts["grid_color"])),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+
+            # Alternating row colors
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor(opts["stripe_color"])])
+        ])
+
+    def orientation(self, num_columns: int) -> str:
+        """'landscape' for wide sheets, else 'portrait'"""
+        return "landscape" if num_columns >= self.landscape_min_columns else "portrait"
+    
+    def page_size(self, num_columns: int) -> Tuple[float, float]:
+        """Portrait A4, or landscape for wide sheets"""
+        return landscape(A4) if self.orientation(num_columns) == "landscape" else A4
+    
+    def page_templates(self, first: str) -> List[PageTemplate]:
+        """
+        Portrait and landscape page templates (ids = orientation) for a
+        document mixing both, 'first' being the template of the first page
+        
+        Frames keep layout state, so every document gets new ones.
+        """
+        templates = []
+        for orientation in (first, "landscape" if first == "portrait" else "portrait"):
+            size = landscape(A4) if orientation == "landscape" else A4
+            frame = Frame(
+                self.left_margin,
+                self.bottom_margin,
+                size[0] - self.left_margin - self.right_margin,
+                size[1] - self.top_margin - self.bottom_margin,
+                id=f"{orientation}-frame"
+            )
+            templates.append(PageTemplate(id=orientation, frames=[frame], pagesize=size))
+        return templates
+
+    def column_widths(self, num_columns: int, page_size: Tuple[float, float]) -> List[float]:
+        """Equal column widths filling the page, clamped for readability (memoized)"""
+        key = (num_columns, page_size[0])
+        if key not in self._column_widths:
+            page_width = page_size[0] - self.left_margin - self.right_margin
+            col_width = page_width / num_columns if num_columns > 0 else page_width
+            col_width = max(self.options["min_col_width"] * inch,
+                            min(col_width, self.options["max_col_width"] * inch))
+            self._column_widths[key] = [col_width] * num_columns
+        return self._column_widths[key]
+
+
+# Profile of this process, built on first use
+_profile: Optional[RenderProfile] = None
+
+
+def get_render_profile() -> RenderProfile:
+    """Process-wide profile built from XLS_RENDER_PROFILE"""
+    global _profile
+    if _profile is None:
+        _profile = RenderProfile(settings.xls_render_profile)
+        logger.info(f"XLS render profile ready: {_profile.options}")
+    return _profile
@@ -0,0 +1,230 @@
+"""
+Streaming ZIP writer
+Writes entries whose content is known when they are added straight to a
+write-only file object (such as a GridFS upload, which cannot seek). CRC and
+sizes go into each local header, so no data descriptors are needed and stored
+entries stay readable by streaming unzippers. Each entry is deflated at most
+once, and stored as is when deflating saves too little. The header and
+central directory builders are also used to assemble stored archives lazily
+from entries whose CRC and size are already known.
+"""
+
+import logging
+import struct
+import time
+import zipfile
+import zlib
+from typing import Any, List, Optional, Tuple
+
+# Set up logging for this module
+logger = logging.getLogger('zip_stream')
+
+# Bytes from the middle of an entry deflated to estimate whether the whole
+# entry is worth deflating (headers at the start tend to compress well)
+SAMPLE_BYTES = 16 * 1024
+
+# Unix regular file, rw------- (as zipfile.writestr)
+EXTERNAL_ATTR = (0o100600 << 16)
+
+# Sizes and offsets from this value on need ZIP64 fields
+ZIP64_MARKER = 0xFFFFFFFF
+
+# Part of a lazily assembled archive: (offset, length, generated bytes or file source)
+Segment = Tuple[int, int, Any]
+
+
+class ZipEntry:
+    """A written entry, kept for the central directory"""
+    
+    def __init__(self, name: str, compress_type: int, crc: int, file_size: int,
+                 compress_size: int, header_offset: int, date_time: tuple):
+        self.name = name
+        self.compress_type = compress_type
+        self.crc = crc
+        self.file_size = file_size
+        self.compress_size = compress_size
+        self.header_offset = header_offset
+        self.date_time = date_time
+    
+    @property
+    def stored(self) -> bool:
+        return self.compress_type == zipfile.ZIP_STORED
+
+
+def deflate_gain(data: bytes, sample_bytes: int = SAMPLE_BYTES) -> float:
+    """Fraction of a sample_bytes sample saved by a fast deflate (0 = none)"""
+    start = max(0, (len(data) - sample_bytes) // 2)
+    sample = data[start:start + sample_bytes]
+    if not sample:
+        return 0.0
+    compressor = zlib.compressobj(1, zlib.DEFLATED, -15)
+    compressed = compressor.compress(sample) + compressor.flush()
+    return 1 - len(compressed) / len(sample)
+
+
+def _encode_name(name: str) -> Tuple[bytes, int]:
+    """Encoded name and flag bits (0x800 = UTF-8 name)"""
+    try:
+        return name.encode('ascii'), 0
+    except UnicodeEncodeError:
+        return name.encode('utf-8'), 0x800
+
+
+def _dos_date_time(date_time: tuple) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    dos_date = (max(year, 1980) - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    return dos_time, dos_date
+
+
+def _extract_version(entry: ZipEntry, zip64: bool = False) -> int:
+    if zip64:
+        return zipfile.ZIP64_VERSION
+    return zipfile.DEFAULT_VERSION if entry.compress_type == zipfile.ZIP_DEFLATED else 10
+
+
+def local_header(entry: ZipEntry) -> bytes:
+    """Local file header of an entry (with CRC and sizes, no data descriptor)"""
+    if entry.file_size >= ZIP64_MARKER or entry.compress_size >= ZIP64_MARKER:
+        raise ValueError(f"ZIP entry '{entry.name}' is too large ({entry.file_size} bytes)")
+    encoded_name, flag_bits = _encode_name(entry.name)
+    dos_time, dos_date = _dos_date_time(entry.date_time)
+    return struct.pack(
+        zipfile.structFileHeader, zipfile.stringFileHeader,
+        _extract_version(entry), 0, flag_bits, entry.compress_type, dos_time, dos_date,
+        entry.crc, entry.compress_size, entry.file_size, len(encoded_name), 0
+    ) + encoded_name
+
+
+def central_directory(entries: List[ZipEntry], directory_offset: int) -> bytes:
+    """Central directory and end records of an archive whose entries end at directory_offset"""
+    records = []
+    for entry in entries:
+        encoded_name, flag_bits = _encode_name(entry.name)
+        extra = b''
+        header_offset = entry.header_offset
+        if header_offset >= ZIP64_MARKER:
+            extra = struct.pack('<HHQ', 1, 8, header_offset)
+            header_offset = ZIP64_MARKER
+        dos_time, dos_date = _dos_date_time(entry.date_time)
+        extract_version = _extract_version(entry, zip64=bool(extra))
+        records.append(struct.pack(
+            zipfile.structCentralDir, zipfile.stringCentralDir,
+            extract_version, 3, extract_version, 0, flag_bits, entry.compress_type,
+            dos_time, dos_date, entry.crc, entry.compress_size, entry.file_size,
+            len(encoded_name), len(extra), 0, 0, 0, EXTERNAL_ATTR, header_offset
+        ) + encoded_name + extra)
+    directory_size = sum(len(record) for record in records)
+    
+    count = len(entries)
+    if (count > zipfile.ZIP_FILECOUNT_LIMIT or directory_offset >= ZIP64_MARKER
+            or directory_size >= ZIP64_MARKER):
+        end64_offset = directory_offset + directory_size
+        records.append(struct.pack(
+            zipfile.structEndArchive64, zipfile.stringEndArchive64,
+            44, zipfile.ZIP64_VERSION, zipfile.ZIP64_VERSION, 0, 0,
+            count, count, directory_size, directory_offset
+        ))
+        records.append(struct.pack(zipfile.structEndArchive64Locator,
+                                   zipfile.stringEndArchive64Locator, 0, end64_offset, 1))
+        count = min(count, 0xFFFF)
+        directory_size = min(directory_size, ZIP64_MARKER)
+        directory_offset = min(directory_offset, ZIP64_MARKER)
+    records.append(struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive,
+                               0, 0, count, count, directory_size, directory_offset, 0))
+    return b''.join(records)
+
+
+def stored_archive(files: List[Tuple[str, int, int, Any]], date_time: tuple) -> Tuple[List[Segment], int]:
+    """
+    Layout of a stored (uncompressed) archive of (name, size, crc32, source) files
+    
+    Nothing is read: the archive is known down to the byte from the sizes and
+    CRCs alone, so it can be streamed (or a range of it served) by copying
+    each source as is between the generated headers.
+    
+    Returns:
+        (segments, archive size); a segment is (offset, length, data) where
+        data is generated bytes or the source of a file
+    """
+    segments: List[Segment] = []
+    entries = []
+    offset = 0
+    for name, size, crc, source in files:
+        entry = ZipEntry(name, zipfile.ZIP_STORED, crc, size, size, offset, date_time)
+        header = local_header(entry)
+        segments.append((offset, len(header), header))
+        segments.append((offset + len(header), size, source))
+        offset += len(header) + size
+        entries.append(entry)
+    directory = central_directory(entries, offset)
+    segments.append((offset, len(directory), directory))
+    return segments, offset + len(directory)
+
+
+class ZipStreamWriter:
+    """
+    Write a ZIP archive sequentially to a file object with write()
+    
+    Entries are deflated unless that saves less than min_deflate_gain of
+    their size (0.1 = 10%); already compressed data is detected on a sample
+    and stored without being deflated at all. The central directory is
+    written by close(). ZIP64 records are added when the archive needs them.
+    """
+    
+    def __init__(self, output, min_deflate_gain: float = 0.0, compresslevel: int = 6):
+        self._output = output
+        self._offset = 0
+        self._closed = False
+        self.min_deflate_gain = min_deflate_gain
+        self.compresslevel = compresslevel
+        self.entries: List[ZipEntry] = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        # An archive abandoned on error is left without central directory
+        if exc_type is None:
+            self.close()
+    
+    def _write(self, data: bytes):
+        self._output.write(data)
+        self._offset += len(data)
+    
+    def write(self, name: str, data: bytes, compress_type: Optional[int] = None) -> ZipEntry:
+        """
+        Add an entry; compress_type forces ZIP_STORED or ZIP_DEFLATED
+        
+        Returns:
+            The entry as written (compression method and sizes)
+        """
+        if self._closed:
+            raise ValueError("Cannot write to a closed ZIP archive")
+        
+        payload = data
+        if compress_type is None:
+            compress_type = zipfile.ZIP_STORED
+            if self.min_deflate_gain <= 0 or deflate_gain(data) >= self.min_deflate_gain:
+                compress_type = zipfile.ZIP_DEFLATED
+        if compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            if len(payload) > len(data) * (1 - self.min_deflate_gain):
+                # Not worth it after all: store the original bytes
+                compress_type, payload = zipfile.ZIP_STORED, data
+        
+        entry = ZipEntry(name, compress_type, zlib.crc32(data), len(data), len(payload),
+                         self._offset, time.localtime(time.time())[:6])
+        self._write(local_header(entry))
+        self._write(payload)
+        self.entries.append(entry)
+        return entry
+    
+    def close(self):
+        """Write the central directory (and ZIP64 end records when needed)"""
+        if self._closed:
+            return
+        self._closed = True
+        self._write(central_directory(self.entries, self._offset))
+        logger.info(f"ZIP archive written: {len(self.entries)} entries, {self._offset} bytes")
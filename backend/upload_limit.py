@@ -0,0 +1,83 @@
+"""
+Request body size limit
+ASGI middleware enforcing MAX_REQUEST_SIZE_MB before Starlette parses (and
+spools to disk) a multipart body: requests declaring a larger Content-Length
+are answered 413 without reading the body, and bodies without a usable
+Content-Length (chunked uploads) are cut off with 413 as soon as the limit is
+crossed while they are received. The per-file MAX_UPLOAD_SIZE_MB is still
+checked when each file is copied into GridFS (see FileService._stream_upload).
+"""
+
+import json
+import logging
+from starlette.exceptions import HTTPException
+
+# Set up logging for this module
+logger = logging.getLogger('upload_limit')
+
+
+class RequestTooLargeError(HTTPException):
+    """Raised from receive() when the body exceeds the limit (FastAPI passes HTTPExceptions through form parsing)"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(status_code=413, detail=f"Request body exceeds the maximum size of {max_bytes // (1024 * 1024)} MB")
+
+
+class RequestSizeLimitMiddleware:
+    """Reject request bodies larger than max_bytes with 413"""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send, error: RequestTooLargeError):
+        body = json.dumps({"detail": error.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_bytes:
+            logger.warning(f"Rejected {scope['method']} {scope['path']}: Content-Length {declared} > {self.max_bytes}")
+            await self._reject(send, RequestTooLargeError(self.max_bytes))
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    logger.warning(f"Rejected {scope['method']} {scope['path']}: body exceeded {self.max_bytes} bytes")
+                    raise RequestTooLargeError(self.max_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestTooLargeError as e:
+            # Raised outside a route's form parsing (e.g. a middleware reading the body)
+            if response_started:
+                raise
+            await self._reject(send, e)
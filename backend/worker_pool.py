@@ -0,0 +1,399 @@
+"""
+Warm worker pool for command execution
+Keeps long-lived worker processes that import the command handlers once and
+reuse their MongoDB/GridFS connections, instead of spawning me_shell.py per command.
+A thread backend runs the same handlers inside the API process.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from config import settings
+from tools_commands.progress import progress_reporting
+
+# Set up logging
+logger = logging.getLogger('worker_pool')
+
+EXECUTION_BACKENDS = ("subprocess", "thread", "process-pool")
+
+# Per-worker state, populated once by _load_handlers() in every worker process
+# (or in the API process for the thread backend)
+_sync_client = None
+_sync_db = None
+_fs = None
+_registry = None
+
+
+def _init_worker():
+    """
+    Initializer for pool workers
+
+    Runs once per worker process: imports the heavy handler modules
+    (PyPDF2, reportlab, openpyxl, PIL) and opens the MongoDB/GridFS connections
+    that every command executed by this worker will reuse.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('worker_pool.log'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+    _load_handlers()
+
+    logger.info(f"Worker {os.getpid()} ready. Available commands: {list(_registry.keys())}")
+
+
+def _load_handlers():
+    """Import the command registry and open the sync MongoDB client and GridFS handle"""
+    global _sync_client, _sync_db, _fs, _registry
+
+    import pymongo
+    from gridfs import GridFS
+    from tools_commands.tools_commands import COMMAND_REGISTRY
+
+    _sync_client = pymongo.MongoClient(settings.mongodb_url, **settings.mongo_client_options())
+    _sync_db = _sync_client[settings.database_name]
+    _fs = GridFS(_sync_db, collection="tmp_files")
+    _registry = COMMAND_REGISTRY
+
+
+def _worker_main(conn):
+    """
+    Entry point of a worker process
+
+    Receives command IDs over its pipe and answers with the execution outcome
+    until it gets the None sentinel (shutdown or recycling).
+    """
+    _init_worker()
+    conn.send("ready")
+
+    while True:
+        try:
+            command_id = conn.recv()
+        except EOFError:
+            break
+        if command_id is None:
+            break
+        conn.send(run_command(command_id))
+
+
+def run_command(command_id: str) -> Dict[str, Any]:
+    """
+    Execute a command inside a pool worker
+
+    Mirrors me_shell.py: loads the command document, runs the registered handler
+    and stores the result (or the error) on the command document.
+
+    Args:
+        command_id: The ID of the command to execute
+
+    Returns:
+        Dict with 'exit_state', 'stdout' and 'stderr' (same meaning as the
+        return code and output streams of a me_shell.py subprocess)
+    """
+    from bson import ObjectId
+
+    logger.info(f"Worker {os.getpid()}/{threading.current_thread().name} executing command: {command_id}")
+
+    try:
+        command_doc = _sync_db.commands.find_one({"_id": ObjectId(command_id)})
+        if not command_doc:
+            error_msg = f"Error: Command {command_id} not found"
+            logger.error(error_msg)
+            return {"exit_state": 1, "stdout": "", "stderr": error_msg}
+
+        shell_command = command_doc.get("shell_command")
+        args = command_doc.get("args", {})
+
+        if shell_command not in _registry:
+            error_msg = f"Unknown command '{shell_command}'. Available: {list(_registry.keys())}"
+            logger.error(error_msg)
+            _sync_db.commands.update_one(
+                {"_id": ObjectId(command_id)},
+                {"$set": {"exit_state": 1, "stdout": None, "stderr": f"Error: {error_msg}"}}
+            )
+            return {"exit_state": 1, "stdout": "", "stderr": f"Error: {error_msg}"}
+
+        handler = _registry[shell_command]
+        logger.info(f"Executing command: {shell_command}")
+        with progress_reporting(_sync_db.commands, command_id, settings.progress_update_interval_seconds):
+            result = handler(args, _sync_db, _fs)
+
+        result_json = json.dumps(result, indent=2)
+        _sync_db.commands.update_one(
+            {"_id": ObjectId(command_id)},
+            {"$set": {"exit_state": 0, "stdout": result_json, "stderr": None}}
+        )
+
+        logger.info(f"Command {command_id} completed successfully")
+        return {
+            "exit_state": 0,
+            "stdout": f"Command completed successfully\nResult: {result_json}",
+            "stderr": ""
+        }
+
+    except Exception as e:
+        error_msg = f"Command failed: {str(e)}"
+        stderr_output = f"{error_msg}\n\nTraceback:\n{traceback.format_exc()}"
+        logger.error(f"Command execution error: {error_msg}")
+
+        try:
+            _sync_db.commands.update_one(
+                {"_id": ObjectId(command_id)},
+                {"$set": {"exit_state": 1, "stdout": None, "stderr": stderr_output}}
+            )
+        except Exception as update_error:
+            logger.error(f"Failed to update command status: {update_error}")
+
+        return {"exit_state": 1, "stdout": "", "stderr": stderr_output}
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a worker process dies while executing a command"""
+
+
+class _WorkerSlot(threading.Thread):
+    """
+    Owns one worker process and feeds it commands from the pool queue
+
+    The slot thread blocks on the worker pipe, so the event loop never does.
+    It restarts its worker after max_tasks_per_worker commands (recycling)
+    or after a crash, which only fails the command that was running on it.
+    """
+
+    def __init__(self, pool: "WorkerPool", index: int):
+        super().__init__(name=f"worker-slot-{index}", daemon=True)
+        self.pool = pool
+        self.process = None
+        self.conn = None
+        self.tasks_done = 0
+
+    def _spawn(self):
+        """Start a fresh worker process and wait until it has finished importing"""
+        while True:
+            ctx = multiprocessing.get_context("spawn")
+            parent_conn, child_conn = ctx.Pipe()
+            # Not daemonic: handlers may start their own process pools
+            self.process = ctx.Process(target=_worker_main, args=(child_conn,))
+            self.process.start()
+            child_conn.close()
+            self.conn = parent_conn
+            try:
+                self.conn.recv()  # "ready"
+                break
+            except (EOFError, OSError):
+                if self.pool._stopping:
+                    self._stop_worker(graceful=False)
+                    return
+                logger.error(f"{self.name}: worker failed to start (exit code {self.process.exitcode}), retrying in 5s")
+                self._stop_worker(graceful=False)
+                time.sleep(5)
+        self.tasks_done = 0
+        logger.info(f"{self.name}: worker {self.process.pid} started")
+
+    def _stop_worker(self, graceful: bool = True):
+        """Stop the current worker process"""
+        if self.process is None:
+            return
+        try:
+            if graceful:
+                self.conn.send(None)
+                self.process.join(timeout=10)
+        except (OSError, EOFError):
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=5)
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def run(self):
+        self._spawn()
+        if self.process is None:
+            return  # Pool stopped before the worker was ready
+
+        while True:
+            task = self.pool._tasks.get()
+            if task is None:
+                self._stop_worker()
+                return
+
+            command_id, future, loop = task
+
+            try:
+                self.conn.send(command_id)
+                outcome = self.conn.recv()
+                self.tasks_done += 1
+                loop.call_soon_threadsafe(_resolve, future, outcome, None)
+            except (EOFError, OSError) as e:
+                self.process.join(timeout=5)
+                exit_code = self.process.exitcode
+                logger.error(f"{self.name}: worker died while running {command_id} (exit code {exit_code})")
+                self._stop_worker(graceful=False)
+                error = WorkerCrashedError(f"Worker process died while executing command (exit code {exit_code}): {e}")
+                loop.call_soon_threadsafe(_resolve, future, None, error)
+                if self.pool._stopping:
+                    return  # Terminated by shutdown(): no replacement
+                self._spawn()
+                continue
+
+            if self.tasks_done >= self.pool.max_tasks_per_worker:
+                logger.info(f"{self.name}: recycling worker {self.process.pid} after {self.tasks_done} tasks")
+                self._stop_worker()
+                self._spawn()
+
+
+def _resolve(future: asyncio.Future, outcome: Optional[Dict[str, Any]], error: Optional[Exception]):
+    """Complete an asyncio future from the event loop thread (ignores cancelled waiters)"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(outcome)
+
+
+class WorkerPool:
+    """Pool of pre-started worker processes executing commands by ID"""
+
+    def __init__(self, size: int, max_tasks_per_worker: int):
+        self.size = size
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._tasks: "queue.Queue" = queue.Queue()
+        self._slots = []
+        self._stopping = False
+
+    def start(self):
+        """Start all worker slots (each one spawns and warms up its worker)"""
+        self._slots = [_WorkerSlot(self, i) for i in range(self.size)]
+        for slot in self._slots:
+            slot.start()
+        logger.info(f"Worker pool started: {self.size} workers, recycled every {self.max_tasks_per_worker} tasks")
+
+    async def run(self, command_id: str) -> Dict[str, Any]:
+        """
+        Execute a command on a pool worker without blocking the event loop
+
+        Raises:
+            WorkerCrashedError: if the worker process died during execution
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._tasks.put((command_id, future, loop))
+        return await future
+
+    def shutdown(self, timeout: float = 15):
+        """
+        Stop all workers once they finish their current command
+
+        Workers still running a command after timeout seconds are terminated:
+        worker processes are not daemonic, so interpreter exit would otherwise
+        wait for them. Their commands' leases expire and the durable queue
+        runs them again.
+        """
+        self._stopping = True
+        for _ in self._slots:
+            self._tasks.put(None)
+        # The slots stop their workers concurrently: share one deadline between them
+        deadline = time.monotonic() + timeout
+        for slot in self._slots:
+            slot.join(timeout=max(0, deadline - time.monotonic()))
+        for slot in self._slots:
+            process = slot.process
+            if slot.is_alive() and process is not None and process.is_alive():
+                logger.warning(f"{slot.name}: terminating worker {process.pid}, still busy after {timeout}s")
+                process.terminate()
+            slot.join(timeout=5)
+        self._slots = []
+        logger.info("Worker pool stopped")
+
+
+class ThreadWorkerPool:
+    """
+    Runs handlers on a thread pool inside the current process
+
+    No interpreter start and no IPC: the handlers share one sync MongoDB client
+    and GridFS handle. Handlers are CPU bound and share the GIL, so this suits
+    small jobs; a crashing handler takes the API process down with it.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        _load_handlers()
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="command")
+        logger.info(f"Thread worker pool started: {self.size} threads")
+
+    async def run(self, command_id: str) -> Dict[str, Any]:
+        """Execute a command on a pool thread without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, run_command, command_id)
+
+    def shutdown(self):
+        """Wait for running commands, then release the threads and the sync client"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if _sync_client is not None:
+            _sync_client.close()
+        logger.info("Thread worker pool stopped")
+
+
+# Global pool instance (None for the subprocess backend or when not started)
+worker_pool = None
+
+
+def start_worker_pool():
+    """
+    Start the global worker pool for the configured execution backend
+
+    Returns:
+        The pool, or None for the subprocess backend (me_shell.py per command)
+    """
+    global worker_pool
+
+    backend = settings.command_execution_backend
+    if backend not in EXECUTION_BACKENDS:
+        raise ValueError(f"Unknown COMMAND_EXECUTION_BACKEND '{backend}'. Available: {list(EXECUTION_BACKENDS)}")
+
+    if backend == "subprocess":
+        return None
+
+    if backend == "thread":
+        worker_pool = ThreadWorkerPool(size=settings.worker_pool_size)
+    else:
+        worker_pool = WorkerPool(
+            size=settings.worker_pool_size,
+            max_tasks_per_worker=settings.worker_max_tasks_per_child
+        )
+    worker_pool.start()
+    return worker_pool
+
+
+def stop_worker_pool():
+    """Shut down the global worker pool"""
+    global worker_pool
+
+    if worker_pool is not None:
+        worker_pool.shutdown()
+        worker_pool = None
+
+
+def get_worker_pool():
+    """Get the global worker pool (None for the subprocess backend)"""
+    return worker_pool
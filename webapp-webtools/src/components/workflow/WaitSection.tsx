@@ -14,12 +14,15 @@ export default function WaitSection({ commandId, onComplete, onError }: WaitSect
   const [error, setError] = useState<string | null>(null)
 
   useEffect(() => {
-    let pollInterval: number
+    let cancelled = false
 
-    const pollStatus = async () => {
+    // Returns true once the command reached a final state (or polling failed)
+    const pollStatus = async (): Promise<boolean> => {
       try {
         console.log('🔄 Polling command status:', commandId)
-        const response = await processApi.getCommandStatus(commandId)
+        // Long-poll: the server holds the request until the command finishes (max 30s)
+        const response = await processApi.getCommandStatus(commandId, 30)
+        if (cancelled) return true
         console.log('📥 Command status:', response)
         
         setCommandStatus(response)
@@ -28,6 +31,7 @@ export default function WaitSection({ commandId, onComplete, onError }: WaitSect
         if (response.exit_state === -1) {
           // Still processing
           setStatus('Processing your files...')
+          return false
         } else if (response.exit_state === 0) {
           // Success!
           setStatus('Processing complete!')
@@ -51,34 +55,34 @@ export default function WaitSection({ commandId, onComplete, onError }: WaitSect
             setError(errorMsg)
             onError?.(errorMsg)
           }
-          
-          // Stop polling
-          clearInterval(pollInterval)
         } else {
           // Failed
           const errorMsg = response.stderr || 'Processing failed'
           console.error('❌ Processing failed:', errorMsg)
           setError(errorMsg)
           onError?.(errorMsg)
-          clearInterval(pollInterval)
         }
+        return true
       } catch (err: any) {
+        if (cancelled) return true
         console.error('❌ Polling error:', err)
         const errorMsg = err.message || 'Network error'
         setError(errorMsg)
         onError?.(errorMsg)
-        clearInterval(pollInterval)
+        return true
       }
     }
 
-    // Initial poll
-    pollStatus()
-
-    // Poll every 2 seconds
-    pollInterval = setInterval(pollStatus, 2000)
+    // Re-poll as soon as each long-poll request returns
+    const pollUntilDone = async () => {
+      while (!cancelled && !(await pollStatus())) {
+        // Keep polling
+      }
+    }
+    pollUntilDone()
 
     return () => {
-      clearInterval(pollInterval)
+      cancelled = true
     }
   }, [commandId, onComplete, onError])
 
@@ -53,11 +53,25 @@ export interface CommandStatus {
   exit_state: number
   stdout: string | null
   stderr: string | null
+  status?: 'queued' | 'running' | 'done' | 'failed'
+  queue_position?: number | null
+  progress?: CommandProgress | null
   created_at?: string
   started_at?: string | null
   completed_at?: string | null
 }
 
+// Progress reported by the command handler while it runs
+export interface CommandProgress {
+  stage: string
+  items_done: number | null
+  items_total: number | null
+  bytes_processed: number | null
+  percent: number | null
+  eta_seconds: number | null
+  updated_at: string
+}
+
 export interface MergePdfsResult {
   merged_file_id: string
 }
@@ -126,8 +140,11 @@ export const processApi = {
   },
 
   // Get command status
-  getCommandStatus: async (commandId: string): Promise<CommandStatus> => {
-    const response = await api.get(`/api/command/${commandId}`)
+  // waitSeconds > 0 long-polls: the server answers when the command finishes or the wait expires
+  getCommandStatus: async (commandId: string, waitSeconds = 0): Promise<CommandStatus> => {
+    const response = await api.get(`/api/command/${commandId}`, {
+      params: waitSeconds > 0 ? { wait: waitSeconds } : undefined,
+    })
     return response.data.command  // Extract the command data from the wrapper
   },
 